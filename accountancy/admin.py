@@ -1,28 +1,85 @@
 from django.contrib import admin, messages
 from django.conf import settings
-from django.http import HttpResponse
+from django.db.transaction import atomic
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
 
 from django_reverse_admin import ReverseModelAdmin
-import djqscsv
-import csv
 
+from app.emails import mail_batch
 from finances.models import TransactionType
 from .models import *
+from .forms import IntakeForm, StatementForm, TransactionForm
+from . import exports, intake, invoices, search, statements, transitions
+
+
+def apply_transition(request, queryset, name, by_who='', field='transaction'):
+    try:
+        result = transitions.apply(
+            name,
+            queryset.values_list(field, flat=True),
+            by_who,
+        )
+    except transitions.ConcurrentTransition as error:
+        messages.error(request, '{} Žiadna transakcia nebola zmenená, skúste to znova.'.format(error))
+        return transitions.Result([], [])
+    report_transition(request, result, name)
+    return result
+
+
+def report_transition(request, result, name):
+    if result.changed:
+        messages.success(request, 'Počet zmenených transakcií: {}'.format(len(result.changed)))
+    if result.rejected:
+        messages.error(request, 'Transakcie {} neboli zmenené, pretože nie sú v správnom stave{}.'.format(
+            ', '.join(str(pk) for pk in result.rejected),
+            ' alebo nie sú zaradené' if name == 'approve' else '',
+        ))
 
 
 class ExportCsvMixin:
     def export_as_csv(self, request, queryset):
-        return djqscsv.render_to_csv_response(queryset)
+        return exports.csv_response(
+            exports.model_header(queryset.model),
+            exports.model_rows(queryset),
+            '{}_export.csv'.format(queryset.model._meta.model_name),
+        )
 
     export_as_csv.short_description = 'Exportuj ako CSV'
 
 
-class TransactionAdmin(admin.ModelAdmin, ExportCsvMixin):
+class TransactionSearchMixin:
+    search_prefix = 'transaction__'
+
+    def get_search_results(self, request, queryset, search_term):
+        return search.filter_transactions(queryset, search_term, self.search_prefix), False
+
+
+class ClosedReadOnlyMixin:
+    def get_transaction(self, obj):
+        return obj.transaction
+
+    def is_closed(self, obj):
+        return obj is not None and getattr(self.get_transaction(obj), 'state', None) == 'old'
+
+    def has_change_permission(self, request, obj=None):
+        return not self.is_closed(obj) and super().has_change_permission(request, obj)
+
+    def has_delete_permission(self, request, obj=None):
+        return not self.is_closed(obj) and super().has_delete_permission(request, obj)
+
+
+class TransactionAdmin(TransactionSearchMixin, ClosedReadOnlyMixin, admin.ModelAdmin, ExportCsvMixin):
+    form = TransactionForm
+    change_list_template = 'admin/accountancy/transaction/change_list.html'
     list_display = ('pk', 'section', 'ammount', 'description')
     list_per_page = 100
     list_filter = ['section', 'state']
 
-    search_fields = ['pk', 'ammount', 'description']
+    search_fields = ['pk', 'ammount', 'description', 'provider', 'invoice_number', 'business_id']
+    search_prefix = ''
     ordering = ('-date_created',)
 
     date_hierarchy = 'date_created'
@@ -52,11 +109,57 @@ class TransactionAdmin(admin.ModelAdmin, ExportCsvMixin):
         'export_as_csv',
     ]
 
+    def get_transaction(self, obj):
+        return obj
+
     def save_model(self, request, obj, form, change):
         if not obj.pk:
             obj.created_by = request.user
         super(TransactionAdmin, self).save_model(request, obj, form, change)
 
+        duplicates = [str(pk) for pk in invoices.duplicates(obj).values_list('pk', flat=True)]
+        if duplicates:
+            messages.warning(request, 'Možná duplicitná faktúra: rovnakú faktúru majú aj transakcie {}.'.format(
+                ', '.join(duplicates),
+            ))
+
+    def get_urls(self):
+        return [
+            path(
+                'import/',
+                self.admin_site.admin_view(self.import_transactions),
+                name='accountancy_transaction_import',
+            ),
+        ] + super().get_urls()
+
+    def import_transactions(self, request):
+        form = IntakeForm(request.POST or None, request.FILES or None)
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            title='Hromadný import transakcií',
+            form=form,
+        )
+
+        if form.is_valid():
+            sheet = form.cleaned_data['sheet']
+            try:
+                result = intake.import_transactions(
+                    sheet,
+                    sheet.name,
+                    form.cleaned_data['invoices'],
+                    request.user,
+                )
+            except intake.IntakeError as e:
+                form.add_error(None, str(e))
+            else:
+                if not result.errors:
+                    messages.success(request, 'Počet vytvorených transakcií: {}'.format(result.created))
+                    return redirect('admin:accountancy_transaction_changelist')
+                context['errors'] = result.errors
+
+        return TemplateResponse(request, 'admin/accountancy/transaction/import.html', context)
+
     def changelist_view(self, request, extra_context=None):
         if 'state__exact' not in request.GET:
             q = request.GET.copy()
@@ -67,17 +170,23 @@ class TransactionAdmin(admin.ModelAdmin, ExportCsvMixin):
         return super(TransactionAdmin, self).changelist_view(request, extra_context=extra_context)
 
     def request_approval(self, request, queryset):
-        for q in queryset:
-            if Approval.objects.filter(transaction=q):
-                q.approval.send_reminder()
-            else:
-                a = Approval.objects.create(
-                    transaction=q,
-                )
-                q.approval = a
-                q.save()
+        with atomic(), mail_batch():
+            Approval.objects.bulk_create([
+                Approval(transaction=q)
+                for q in queryset.filter(approval__isnull=True)
+            ])
+
+            approvals = Approval.objects.filter(
+                transaction__in=queryset,
+            ).select_related('transaction')
+            for a in approvals:
                 a.send_reminder()
 
+            TransactionChange.record('request_approval', [
+                (a.transaction.pk, a.transaction.state, a.transaction.state)
+                for a in approvals
+            ])
+
     def send_reminder(self, request, queryset):
         self.request_approval(request, queryset)
 
@@ -85,20 +194,28 @@ class TransactionAdmin(admin.ModelAdmin, ExportCsvMixin):
     request_approval.short_description = 'Požiadať o schválenie'
 
 
-class ApprovalAdmin(ReverseModelAdmin, ExportCsvMixin):
+class ApprovalAdmin(TransactionSearchMixin, ClosedReadOnlyMixin, ReverseModelAdmin, ExportCsvMixin):
     list_display = (
         'get_id',
         'get_section',
         'transaction_type',
         'get_ammount',
     )
+    list_select_related = ('transaction', 'transaction_type')
     list_per_page = 100
     list_filter = [
         'transaction__section',
         'transaction__state',
     ]
 
-    search_fields = ['transaction__pk', 'transaction__ammount', 'transaction__description']
+    search_fields = [
+        'transaction__pk',
+        'transaction__ammount',
+        'transaction__description',
+        'transaction__provider',
+        'transaction__invoice_number',
+        'transaction__business_id',
+    ]
     ordering = ('-transaction__date_created',)
 
     autocomplete_fields = ['transaction_type']
@@ -177,36 +294,36 @@ class ApprovalAdmin(ReverseModelAdmin, ExportCsvMixin):
     get_ammount.short_description = 'Suma'
 
     def send_reminder(self, request, queryset):
-        for q in queryset:
-            q.item.send_reminder()
+        with mail_batch():
+            for q in queryset:
+                q.item.send_reminder()
 
     send_reminder.short_description = 'Pošli upomienku žiadosti'
 
     def approve(self, request, queryset):
-        for q in queryset:
-            if q.transaction_type:
-                t = q.transaction
-                t.approve()
-            else:
-                messages.error(request, "Transakcia {} nebola schválená, pretože nie je zaradená".format(q.transaction.id))
+        apply_transition(request, queryset, 'approve')
 
     approve.short_description = 'Schváliť a požiadať o prevod'
 
     def disapprove(self, request, queryset):
-        for q in queryset:
-            t = q.transaction
-            t.disapprove('finančným manažérom sekcie')
+        apply_transition(request, queryset, 'disapprove', 'finančným manažérom sekcie')
 
     disapprove.short_description = 'Zamietnuť transakciu'
 
 
-class ItemAdmin(ReverseModelAdmin, ExportCsvMixin):
+class ItemAdmin(TransactionSearchMixin, ClosedReadOnlyMixin, ReverseModelAdmin, ExportCsvMixin):
+    change_list_template = 'admin/accountancy/item/change_list.html'
     list_display = (
         'get_id',
         'get_section',
         'get_transaction_type',
         'get_ammount',
     )
+    list_select_related = (
+        'transaction',
+        'approval__transaction',
+        'approval__transaction_type',
+    )
     list_per_page = 100
     list_filter = [
         'transaction__section',
@@ -218,6 +335,9 @@ class ItemAdmin(ReverseModelAdmin, ExportCsvMixin):
         'transaction__pk',
         'transaction__ammount',
         'transaction__description',
+        'transaction__provider',
+        'transaction__invoice_number',
+        'transaction__business_id',
     ]
     ordering = ('-date_payed',)
 
@@ -251,6 +371,7 @@ class ItemAdmin(ReverseModelAdmin, ExportCsvMixin):
         'disapprove',
         'export_as_csv',
         'export_full_csv',
+        'export_invoices',
     ]
 
     def save_model(self, request, obj, form, change):
@@ -266,6 +387,70 @@ class ItemAdmin(ReverseModelAdmin, ExportCsvMixin):
 
         return super(ItemAdmin, self).changelist_view(request, extra_context=extra_context)
 
+    def get_urls(self):
+        return [
+            path(
+                'import-statement/',
+                self.admin_site.admin_view(self.import_statement),
+                name='accountancy_item_import_statement',
+            ),
+        ] + super().get_urls()
+
+    def import_statement(self, request):
+        if request.method == 'POST' and 'confirm' in request.POST:
+            matches = []
+            invalid = []
+            for value in request.POST.getlist('pay'):
+                pk, _, date = value.partition(':')
+                try:
+                    matches.append((int(pk), statements.parse_date(date)))
+                except (ValueError, statements.StatementError):
+                    invalid.append(value)
+            if invalid:
+                messages.error(request, 'Neplatné položky boli preskočené: {}'.format(', '.join(invalid)))
+            report_transition(request, statements.pay(matches, request.user), 'pay')
+            return redirect('admin:accountancy_item_changelist')
+
+        form = StatementForm(request.POST or None, request.FILES or None)
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            title='Import bankového výpisu',
+            form=form,
+        )
+
+        if form.is_valid():
+            statement = form.cleaned_data['statement']
+            try:
+                result = statements.reconcile(statement, statement.name)
+            except statements.StatementError as e:
+                form.add_error('statement', str(e))
+                return TemplateResponse(request, 'admin/accountancy/item/import_statement.html', context)
+
+            matched = result.matched
+            if form.cleaned_data['pay_matched']:
+                report_transition(request, statements.pay(
+                    [(pk, line.date) for line, pk in matched],
+                    request.user,
+                ), 'pay')
+                matched = []
+
+            candidates = Transaction.objects.in_bulk(
+                [pk for line, pk in matched] +
+                [pk for line, pks in result.unmatched for pk in pks]
+            )
+            context.update(
+                matched=[(line, candidates[pk]) for line, pk in matched],
+                unmatched=[
+                    (line, [candidates[pk] for pk in pks])
+                    for line, pks in result.unmatched
+                ],
+                errors=result.errors,
+                reconciled=True,
+            )
+
+        return TemplateResponse(request, 'admin/accountancy/item/import_statement.html', context)
+
     def get_id(self, obj):
         return str(obj.approval.transaction)
 
@@ -289,61 +474,86 @@ class ItemAdmin(ReverseModelAdmin, ExportCsvMixin):
     get_ammount.short_description = 'Suma'
 
     def make_privat(self, request, queryset):
-        for q in queryset:
-            q.transaction.state = 'payed'
-            q.transaction.save()
+        apply_transition(request, queryset, 'make_privat')
 
     make_privat.short_description = 'Urob súkromným'
 
     def make_public(self, request, queryset):
-        for q in queryset:
-            q.transaction.state = 'public'
-            q.transaction.save()
+        apply_transition(request, queryset, 'make_public')
 
     make_public.short_description = 'Urob verejným'
 
     def disapprove(self, request, queryset):
-        for q in queryset:
-            t = q.transaction
-            t.disapprove('finančným manažérom SAF')
+        apply_transition(request, queryset, 'disapprove', 'finančným manažérom SAF')
 
     disapprove.short_description = 'Zamietnuť transakciu'
     
     def return_to_approval(self, request, queryset):
-        for q in queryset:
-            q.disapprove()
+        apply_transition(request, queryset, 'return_to_approval')
 
     return_to_approval.short_description = 'Vrátiť na schválenie'
 
     def pay(self, request, queryset):
-        for q in queryset:
-            t = q.transaction
-            t.pay()
-            q.send_invoice()
+        apply_transition(request, queryset, 'pay')
 
     pay.short_description = 'Zaplatiť transakciu'
     
     def export_full_csv(self, request, queryset):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="invoicing.csv"'
-        writer = csv.writer(response)
-        
-        writer.writerow(["EXČ", "Dátum", "Popis", "IČO", "Dodávateľ", "Suma"])
-        for q in queryset:
-            writer.writerow([
-                q.transaction.invoice_number,
-                q.date_payed,
-                q.transaction.description,
-                q.transaction.business_id,
-                q.transaction.provider,
-                q.transaction.ammount
-            ])
-            
-        return response
+        return exports.csv_response(
+            exports.INVOICING_HEADER,
+            exports.invoicing_rows(queryset),
+            'invoicing.csv',
+        )
     
     export_full_csv.short_description = 'Exportuj celé CSV'
 
+    def export_invoices(self, request, queryset):
+        return exports.zip_response(
+            queryset.order_by('date_payed', 'pk'),
+            'invoices.zip',
+        )
+
+    export_invoices.short_description = 'Exportuj faktúry ako ZIP'
+
+
+class InvoiceJobAdmin(admin.ModelAdmin):
+    list_display = ('invoice', 'state', 'pages', 'size', 'attempts', 'date_processed')
+    list_per_page = 100
+    list_filter = ('state',)
+
+    search_fields = ['invoice']
+    ordering = ('-created',)
+
+    readonly_fields = (
+        'invoice',
+        'created',
+        'attempts',
+        'next_attempt',
+        'last_error',
+        'size',
+        'pages',
+        'text',
+        'date_processed',
+    )
+
+    actions = [
+        'retry',
+    ]
+
+    def has_add_permission(self, request):
+        return False
+
+    def retry(self, request, queryset):
+        queryset.update(
+            state='queued',
+            attempts=0,
+            next_attempt=timezone.now(),
+        )
+
+    retry.short_description = 'Spracovať znova'
+
 
 admin.site.register(Transaction, TransactionAdmin)
 admin.site.register(Approval, ApprovalAdmin)
 admin.site.register(Item, ItemAdmin)
+admin.site.register(InvoiceJob, InvoiceJobAdmin)
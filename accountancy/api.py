@@ -0,0 +1,109 @@
+from django.conf import settings
+from django.utils.decorators import method_decorator
+from django.views.generic import View
+
+from app import api
+from app.caching import cached_view
+from accountancy.changes import changes_since
+from accountancy.models import Transaction, STATES
+from accountancy.pagination import keyset_page
+from accountancy.views import can_view_transactions
+
+SECTIONS = settings.SECTIONS
+
+CURSOR_FIELD = 'item__date_payed'
+
+FIELDS = {
+    'id': 'pk',
+    'date_payed': 'item__date_payed',
+    'ammount': 'ammount',
+    'section': 'section',
+    'transaction_type': 'approval__transaction_type__name',
+    'state': 'state',
+    'date_created': 'date_created',
+    'description': 'description',
+    'provider': 'provider',
+    'business_id': 'business_id',
+    'invoice_number': 'invoice_number',
+}
+
+PUBLIC_FIELDS = ('id', 'date_payed', 'ammount', 'section', 'transaction_type')
+
+
+def access(request):
+    # users without the permission to view transactions get the public data
+    return 'all' if can_view_transactions(request.user) else 'public'
+
+
+@method_decorator(cached_view('diary', variant=access), name='dispatch')
+class TransactionsApi(View):
+
+    def get_queryset(self, request):
+        transactions = Transaction.objects.all()
+
+        if can_view_transactions(request.user):
+            state = api.get_choice(request, 'state', STATES)
+            if state:
+                transactions = transactions.filter(state=state)
+        else:
+            transactions = transactions.filter(state='public')
+
+        section = api.get_choice(request, 'section', SECTIONS)
+        if section:
+            transactions = transactions.filter(section=section)
+
+        date_from = api.get_date(request, 'date_from')
+        if date_from:
+            transactions = transactions.filter(item__date_payed__gte=date_from)
+
+        date_to = api.get_date(request, 'date_to')
+        if date_to:
+            transactions = transactions.filter(item__date_payed__lte=date_to)
+
+        return transactions
+
+    def get(self, request, *args, **kwargs):
+        available = FIELDS if can_view_transactions(request.user) else PUBLIC_FIELDS
+        try:
+            fields = api.get_fields(request, available)
+            transactions = self.get_queryset(request)
+            size = api.get_page_size(request)
+        except api.ApiError as e:
+            return api.error_response(e)
+
+        lookups = set(FIELDS[f] for f in fields) | {'pk', CURSOR_FIELD}
+        page = keyset_page(
+            transactions.values(*lookups),
+            CURSOR_FIELD,
+            request.GET.get('after'),
+            size,
+        )
+
+        return api.json_response({
+            'results': [
+                {f: row[FIELDS[f]] for f in fields}
+                for row in page.object_list
+            ],
+            'next': api.next_url(request, page.next_cursor),
+        })
+
+
+class ChangesApi(View):
+
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return api.json_response({'error': 'Prihláste sa.'}, status=403)
+        if not can_view_transactions(request.user):
+            return api.json_response({'error': 'Nemáte oprávnenie na zobrazenie transakcií.'}, status=403)
+
+        try:
+            since = api.get_int(request, 'since') or 0
+            size = api.get_page_size(request)
+        except api.ApiError as e:
+            return api.error_response(e)
+
+        changes = changes_since(since, size)
+        return api.json_response({
+            'results': changes,
+            'next_since': changes[-1]['seq'] if changes else since,
+        })
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class AccountancyConfig(AppConfig):
     name = 'accountancy'
     verbose_name = 'Účtovníctvo'
+
+    def ready(self):
+        import app.caching
+        import accountancy.changes
+        import accountancy.invoices
+        import accountancy.processing
+        import accountancy.search
+
+        post_migrate.connect(accountancy.search.create_index, sender=self)
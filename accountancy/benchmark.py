@@ -0,0 +1,175 @@
+import io
+import platform
+import statistics
+import time
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.db.transaction import atomic, set_rollback
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import exports, synthetic
+from .admin import TransactionAdmin, ApprovalAdmin, ItemAdmin
+from .models import Transaction, Approval, Item
+
+'''
+Reproducible benchmark of the public pages, the admin changelists, every
+admin action and the CSV exports on synthetic data (see synthetic.py):
+
+results = run(sizes=[1000, 100000], repeat=5)
+
+Every size is generated with the same seed into a throwaway database of the
+configured backend (SQLite or PostgreSQL), so runs on different commits or
+machines can be compared. Every case is repeated, the cache is cleared
+before each repetition, and the best and median time and the number of
+queries are reported. Admin actions run in a transaction which is rolled
+back, so each repetition starts from the same data.
+
+`manage.py benchmark --sizes 1000,100000 --output results.json`
+'''
+
+SELECTED = 100
+
+CHANGELISTS = (
+    (Transaction, TransactionAdmin, 'state', 'created'),
+    (Approval, ApprovalAdmin, 'transaction__state', 'created'),
+    (Item, ItemAdmin, 'transaction__state', 'approved'),
+)
+
+ACTION_STATES = {
+    'ApprovalAdmin.send_reminder': 'approved',
+    'ItemAdmin.make_public': 'payed',
+    'ItemAdmin.make_privat': 'public',
+    'ItemAdmin.export_full_csv': 'public',
+    'ItemAdmin.export_invoices': 'public',
+}
+
+
+def consume(response):
+    if response.streaming:
+        for chunk in response.streaming_content:
+            pass
+    return response
+
+
+def measure(case, func, repeat):
+    durations = []
+    queries = 0
+    for i in range(repeat):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            func()
+            durations.append(time.perf_counter() - start)
+        queries = len(context)
+
+    return {
+        'case': case,
+        'best_ms': round(min(durations) * 1000, 3),
+        'median_ms': round(statistics.median(durations) * 1000, 3),
+        'queries': queries,
+    }
+
+
+def rolled_back(func):
+    def run():
+        with atomic():
+            func()
+            set_rollback(True)
+    return run
+
+
+def get(client, url):
+    return lambda: consume(client.get(url))
+
+
+def changelist_url(model, lookup, state):
+    return '/admin/accountancy/{}/?{}__exact={}'.format(model._meta.model_name, lookup, state)
+
+
+def action(client, name, model, lookup, state):
+    url = changelist_url(model, lookup, state)
+    pks = list(model.objects.filter(
+        **{lookup: state}
+    ).order_by('pk').values_list('pk', flat=True)[:SELECTED])
+
+    return rolled_back(lambda: consume(client.post(url, {
+        'action': name,
+        '_selected_action': pks,
+    })))
+
+
+def cases(client):
+    yield 'DiaryView', get(client, '/')
+    yield 'BalanceView', get(client, '/finances/balance/')
+    yield 'TransactionsApi', get(client, '/api/transactions/')
+
+    for model, model_admin, lookup, state in CHANGELISTS:
+        yield '{} changelist'.format(model_admin.__name__), get(client, changelist_url(model, lookup, state))
+        yield '{} search'.format(model_admin.__name__), get(client, '{}&q=provider+12'.format(
+            changelist_url(model, lookup, state),
+        ))
+
+        for name in model_admin.actions:
+            case = '{}.{}'.format(model_admin.__name__, name)
+            yield case, action(client, name, model, lookup, ACTION_STATES.get(case, state))
+
+    yield 'export_as_csv (all transactions)', lambda: exports.write_csv(
+        io.StringIO(),
+        exports.model_header(Transaction),
+        exports.model_rows(Transaction.objects.all()),
+    )
+    yield 'export_full_csv (all paid items)', lambda: exports.write_csv(
+        io.StringIO(),
+        exports.INVOICING_HEADER,
+        exports.invoicing_rows(exports.payed_items(Item.objects.all())),
+    )
+
+
+def measure_all(repeat=3):
+    user, created = get_user_model().objects.get_or_create(
+        username='benchmark',
+        defaults={'is_staff': True, 'is_superuser': True},
+    )
+    client = Client()
+    client.force_login(user)
+
+    return [measure(case, func, repeat) for case, func in cases(client)]
+
+
+def database_version():
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version
+    if connection.vendor == 'postgresql':
+        return str(connection.pg_version)
+    return ''
+
+
+def environment():
+    return {
+        'date': timezone.now().isoformat(),
+        'database': connection.vendor,
+        'database_version': database_version(),
+        'django': django.get_version(),
+        'python': platform.python_version(),
+    }
+
+
+def run(sizes, repeat=3, seed=0, invoices=20, log=None):
+    results = []
+    for size in sizes:
+        with synthetic.throwaway_database():
+            if log:
+                log('Generujem {} transakcií...'.format(size))
+            synthetic.generate(transactions=size, seed=seed, invoices=invoices)
+            for result in measure_all(repeat):
+                result['size'] = size
+                results.append(result)
+                if log:
+                    log('{size:>9} {case:<50} {best_ms:>10.1f} ms {queries:>5} dopytov'.format(**result))
+
+    return dict(environment(), seed=seed, repeat=repeat, results=results)
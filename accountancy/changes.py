@@ -0,0 +1,67 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Transaction, Item, TransactionChange
+
+'''
+Append-only change log of transactions for downstream synchronization.
+
+State changes are recorded by accountancy.transitions, other saves are
+recorded here as 'create' or 'edit'.
+
+Clients read the log with changes_since(cursor) and continue from the seq
+of the last change they received. Sequence numbers come from the database
+and only grow, a transaction still in progress may commit a lower one
+after a higher one was read, so clients should re-read a short overlap.
+'''
+
+FIELDS = {
+    'seq': 'pk',
+    'transaction': 'transaction_id',
+    'event': 'event',
+    'old_state': 'old_state',
+    'new_state': 'new_state',
+    'date': 'date',
+    'state': 'transaction__state',
+    'ammount': 'transaction__ammount',
+    'section': 'transaction__section',
+    'invoice_number': 'transaction__invoice_number',
+    'date_payed': 'transaction__item__date_payed',
+}
+
+
+def changes_since(cursor=0, limit=1000):
+    rows = TransactionChange.objects.filter(
+        pk__gt=cursor or 0,
+    ).order_by('pk').values(*FIELDS.values())[:limit]
+
+    return [
+        {name: row[lookup] for name, lookup in FIELDS.items()}
+        for row in rows
+    ]
+
+
+@receiver(pre_save, sender=Transaction)
+def snapshot_state(sender, instance, **kwargs):
+    if instance.pk:
+        instance._old_state = Transaction.objects.filter(
+            pk=instance.pk,
+        ).values_list('state', flat=True).first()
+
+
+@receiver(post_save, sender=Transaction)
+def record_save(sender, instance, created, **kwargs):
+    TransactionChange.record('create' if created else 'edit', [
+        (instance.pk, getattr(instance, '_old_state', None), instance.state),
+    ])
+
+
+@receiver(post_save, sender=Item)
+def record_item(sender, instance, created, **kwargs):
+    if not created and instance.transaction_id:
+        TransactionChange.record('edit', [(instance.transaction_id, None, None)])
+
+
+@receiver(post_delete, sender=Transaction)
+def record_delete(sender, instance, **kwargs):
+    TransactionChange.record('delete', [(instance.pk, instance.state, None)])
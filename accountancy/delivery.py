@@ -0,0 +1,124 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.encoding import escape_uri_path
+from django.utils.http import parse_etags, quote_etag
+
+'''
+Delivery of invoice files after the permission check in InvoiceView. With
+INVOICE_DELIVERY the transfer is handed over to the front-end server:
+
+- 'x-accel-redirect' (nginx): the file is served from the internal location
+  INVOICE_ACCEL_PREFIX, which maps to MEDIA_ROOT, e.g.
+
+  location /protected/ {
+      internal;
+      alias /srv/saf/media/;
+  }
+
+- 'x-sendfile' (Apache mod_xsendfile, lighttpd): the absolute path is sent.
+
+Without it Django serves the file itself. Whole files go through
+FileResponse, which WSGI servers send with sendfile (wsgi.file_wrapper),
+single byte ranges are answered with 206 Partial Content. The ETag is the
+content digest of the file (see accountancy.storage), so browsers
+revalidate with If-None-Match and get 304 Not Modified.
+'''
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+CACHE_MAX_AGE = 24 * 60 * 60
+
+
+class RangeFile:
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def byte_range(header, size):
+    match = RANGE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+
+    start, end = match.groups()
+    if start:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    else:
+        start, end = max(size - int(end), 0), size - 1
+    return start, end
+
+
+def file_response(request, path, etag):
+    try:
+        file = open(path, 'rb')
+    except OSError:
+        raise Http404('Súbor faktúry neexistuje.')
+    size = os.fstat(file.fileno()).st_size
+
+    header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if header and if_range and etag not in parse_etags(if_range):
+        header = None
+
+    requested = byte_range(header, size) if header else None
+    if requested is None:
+        response = FileResponse(file)
+    elif requested[0] > requested[1]:
+        file.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */{}'.format(size)
+    else:
+        start, end = requested
+        response = FileResponse(RangeFile(file, start, end - start + 1), status=206)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def serve(request, storage, name, digest):
+    path = storage.path(name)
+    etag = quote_etag(digest) if digest else None
+
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        response = not_modified
+    else:
+        delivery = getattr(settings, 'INVOICE_DELIVERY', None)
+        if delivery == 'x-accel-redirect':
+            response = HttpResponse()
+            response['X-Accel-Redirect'] = escape_uri_path(
+                getattr(settings, 'INVOICE_ACCEL_PREFIX', '/protected/') + name
+            )
+        elif delivery == 'x-sendfile':
+            response = HttpResponse()
+            response['X-Sendfile'] = path
+        else:
+            response = file_response(request, path, etag)
+
+        if response.status_code != 416:
+            response['Content-Type'] = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            response['Content-Disposition'] = 'inline; filename="{}"'.format(os.path.basename(name))
+
+    if etag:
+        response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=CACHE_MAX_AGE)
+    return response
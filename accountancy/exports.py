@@ -0,0 +1,186 @@
+import csv
+import io
+import os
+import zipfile
+
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date
+
+from .models import Transaction
+
+'''
+CSV and ZIP exports written row by row from a values_list() iterator, so
+neither the rows, the model instances nor the invoice files are ever held
+in memory all at once.
+'''
+
+CHUNK_SIZE = 2000
+
+INVOICING_HEADER = ['EXČ', 'Dátum', 'Popis', 'IČO', 'Dodávateľ', 'Suma']
+
+INVOICING_FIELDS = (
+    'transaction__invoice_number',
+    'date_payed',
+    'transaction__description',
+    'transaction__business_id',
+    'transaction__provider',
+    'transaction__ammount',
+)
+
+PAYED_STATES = ['payed', 'public', 'old']
+
+MANIFEST_HEADER = INVOICING_HEADER + ['Súbor']
+
+MANIFEST_FIELDS = INVOICING_FIELDS + (
+    'transaction',
+    'transaction__invoice',
+)
+
+
+class Echo:
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def write_csv(output, header, rows):
+    writer = csv.writer(output)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+
+
+def csv_response(header, rows, filename):
+    response = StreamingHttpResponse(
+        iter_csv(header, rows),
+        content_type='text/csv',
+    )
+    response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
+    return response
+
+
+def invoicing_rows(items):
+    return items.values_list(*INVOICING_FIELDS).iterator(chunk_size=CHUNK_SIZE)
+
+
+def model_columns(model):
+    return [f for f in model._meta.concrete_fields]
+
+
+def model_header(model):
+    return [str(f.verbose_name) for f in model_columns(model)]
+
+
+def model_rows(queryset):
+    fields = [f.attname for f in model_columns(queryset.model)]
+    return queryset.values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+
+
+def parse_date_argument(value):
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+
+def payed_items(items, year=None, date_from=None, date_to=None):
+    items = items.filter(
+        transaction__state__in=PAYED_STATES,
+    ).order_by('date_payed', 'pk')
+
+    if year:
+        items = items.filter(date_payed__year=year)
+    if date_from:
+        items = items.filter(date_payed__gte=date_from)
+    if date_to:
+        items = items.filter(date_payed__lte=date_to)
+    return items
+
+
+class ZipBuffer:
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def invoice_storage():
+    return Transaction._meta.get_field('invoice').storage
+
+
+def invoice_arcname(transaction, name):
+    return 'faktury/{}_{}'.format(transaction, os.path.basename(name))
+
+
+def manifest_rows(items):
+    storage = invoice_storage()
+    for row in items.values_list(*MANIFEST_FIELDS).iterator(chunk_size=CHUNK_SIZE):
+        transaction, name = row[-2:]
+        if name and storage.exists(name):
+            yield row[:-2] + (invoice_arcname(transaction, name),)
+        else:
+            yield row[:-2] + ('',)
+
+
+def iter_invoices_zip(items):
+    storage = invoice_storage()
+    buffer = ZipBuffer()
+
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        rows = items.values_list('transaction', 'transaction__invoice')
+        for transaction, name in rows.iterator(chunk_size=CHUNK_SIZE):
+            if not name or not storage.exists(name):
+                continue
+
+            with storage.open(name, 'rb') as invoice:
+                arcname = invoice_arcname(transaction, name)
+                with archive.open(arcname, 'w', force_zip64=True) as entry:
+                    for chunk in invoice.chunks():
+                        entry.write(chunk)
+                        yield buffer.pop()
+            yield buffer.pop()
+
+        with archive.open('manifest.csv', 'w', force_zip64=True) as entry:
+            manifest = io.TextIOWrapper(entry, encoding='utf-8', newline='')
+            writer = csv.writer(manifest)
+            writer.writerow(MANIFEST_HEADER)
+            for row in manifest_rows(items):
+                writer.writerow(row)
+                manifest.flush()
+                yield buffer.pop()
+            manifest.flush()
+            manifest.detach()
+
+    yield buffer.pop()
+
+
+def write_invoices_zip(output, items):
+    for chunk in iter_invoices_zip(items):
+        output.write(chunk)
+
+
+def zip_response(items, filename):
+    response = StreamingHttpResponse(
+        iter_invoices_zip(items),
+        content_type='application/zip',
+    )
+    response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
+    return response
@@ -0,0 +1,48 @@
+from django import forms
+
+from .models import Transaction
+from .registry import lookup_provider
+
+
+class StatementForm(forms.Form):
+    statement = forms.FileField(
+        label='Bankový výpis',
+        help_text='CSV export alebo výpis vo formáte camt.053 (XML).',
+    )
+    pay_matched = forms.BooleanField(
+        label='Hneď zaplatiť isté zhody',
+        required=False,
+        initial=True,
+    )
+
+
+class IntakeForm(forms.Form):
+    sheet = forms.FileField(
+        label='Tabuľka transakcií',
+        help_text='CSV alebo Excel (xlsx) so stĺpcami Suma, Sekcia, Popis, IBAN, '
+                  'Dodávateľ, IČO, Číslo faktúry a Faktúra (názov PDF súboru v archíve).',
+    )
+    invoices = forms.FileField(
+        label='Faktúry',
+        help_text='ZIP archív s faktúrami vo formáte PDF.',
+    )
+
+
+class TransactionForm(forms.ModelForm):
+
+    class Meta:
+        model = Transaction
+        fields = '__all__'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['provider'].required = False
+        self.fields['provider'].help_text = 'Ak ho nevyplníte, doplní sa z registra podľa IČO.'
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('provider') and cleaned_data.get('business_id'):
+            cleaned_data['provider'] = lookup_provider(cleaned_data['business_id'])
+        if not cleaned_data.get('provider'):
+            self.add_error('provider', 'Vyplňte názov dodávateľa, podľa IČO sa v registri nenašiel.')
+        return cleaned_data
@@ -0,0 +1,224 @@
+import csv
+import hashlib
+import io
+import os
+import zipfile
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.db.models import Max
+from django.db.transaction import atomic
+
+from app.caching import bump_version
+from .models import Transaction, TransactionChange
+from .registry import lookup_providers
+from . import invoices, processing, search
+
+'''
+Bulk intake of transactions from a CSV or Excel sheet with the invoices
+in a ZIP archive:
+
+result = import_transactions(sheet, 'prevody.xlsx', zip_file, user)
+result.created  # number of created transactions
+result.errors   # ['Riadok 3, IČO: ...', ...], nothing is created if any
+
+Every row is validated with the same rules as the admin form (full_clean
+of the model), all errors are collected before anything is written. The
+valid rows are then inserted with bulk_create in chunks, each chunk with
+its invoices saved to the storage first. When the import fails, the
+invoice files it stored and nothing references are deleted. Reading Excel sheets needs the
+optional openpyxl package.
+
+Empty providers are filled from the provider registry (accountancy.registry)
+by the business ID, with one lookup for the whole sheet.
+'''
+
+CHUNK_SIZE = 500
+
+COLUMNS = {
+    'suma': 'ammount',
+    'sekcia': 'section',
+    'popis': 'description',
+    'iban': 'iban',
+    'dodávateľ': 'provider',
+    'názov poskytovateľa': 'provider',
+    'ičo': 'business_id',
+    'ičo/business id': 'business_id',
+    'číslo faktúry': 'invoice_number',
+    'faktúra': 'invoice',
+}
+
+REQUIRED_COLUMNS = ('ammount', 'section', 'iban', 'business_id', 'invoice_number', 'invoice')
+
+Result = namedtuple('Result', ['created', 'errors'])
+
+
+class IntakeError(Exception):
+    pass
+
+
+def read_csv(file):
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    return csv.reader(text, dialect=dialect)
+
+
+def read_excel(file):
+    try:
+        import openpyxl
+    except ImportError:
+        raise IntakeError('Na import súborov Excel je potrebný balík openpyxl.')
+
+    try:
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    except Exception:
+        raise IntakeError('Súbor nie je platný zošit Excel.')
+    return workbook.active.iter_rows(values_only=True)
+
+
+def read_rows(file, name):
+    if name.lower().endswith(('.xlsx', '.xlsm')):
+        rows = read_excel(file)
+    else:
+        rows = read_csv(file)
+
+    header = next(rows, None)
+    if header is None:
+        raise IntakeError('Súbor je prázdny.')
+
+    fields = [COLUMNS.get(str(h or '').strip().lower()) for h in header]
+    missing = [f for f in REQUIRED_COLUMNS if f not in fields]
+    if missing:
+        raise IntakeError('V súbore chýbajú stĺpce: {}'.format(', '.join(missing)))
+
+    for number, row in enumerate(rows, start=2):
+        values = {
+            field: '' if value is None else str(value).strip()
+            for field, value in zip(fields, row) if field
+        }
+        if any(values.values()):
+            yield number, values
+
+
+def parse_ammount(value):
+    try:
+        return Decimal(value.replace(' ', '').replace(',', '.'))
+    except InvalidOperation:
+        return value
+
+
+def invoice_files(archive):
+    if archive is None:
+        return {}, None
+    try:
+        archive = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        raise IntakeError('Faktúry nie sú platný ZIP archív.')
+
+    return {
+        os.path.basename(info.filename): info
+        for info in archive.infolist()
+        if not info.is_dir()
+    }, archive
+
+
+def validate(rows, invoices, user):
+    transactions = []
+    errors = []
+
+    for number, values in rows:
+        invoice = values.pop('invoice', '')
+        t = Transaction(
+            created_by=user,
+            ammount=parse_ammount(values.pop('ammount', '')),
+            **values
+        )
+        t.invoice.name = os.path.basename(invoice)
+
+        try:
+            t.full_clean(exclude=['date_created'])
+        except ValidationError as e:
+            for field, messages in e.message_dict.items():
+                label = Transaction._meta.get_field(field).verbose_name if field != '__all__' else ''
+                for message in messages:
+                    errors.append('Riadok {}, {}: {}'.format(number, label, message))
+
+        if t.invoice.name and t.invoice.name not in invoices:
+            errors.append('Riadok {}, faktúra: súbor {} sa v archíve nenachádza.'.format(number, t.invoice.name))
+
+        transactions.append(t)
+
+    return transactions, errors
+
+
+def fill_providers(rows):
+    providers = lookup_providers(
+        values.get('business_id') for number, values in rows if not values.get('provider')
+    )
+    for number, values in rows:
+        if not values.get('provider'):
+            values['provider'] = providers.get(values.get('business_id', '').strip(), '')
+    return rows
+
+
+def store_invoices(chunk, files, zip_file, field):
+    new = []
+    for t in chunk:
+        data = zip_file.read(files[t.invoice.name])
+        filename = field.generate_filename(t, t.invoice.name)
+        existed = field.storage.exists(
+            field.storage.digest_name(filename, hashlib.sha256(data).hexdigest())
+        )
+        t.invoice.name = field.storage.save(filename, ContentFile(data))
+        if not existed:
+            new.append(t.invoice.name)
+    return new
+
+
+def inserted(chunk, last_pk):
+    if connection.features.can_return_ids_from_bulk_insert:
+        return [(t.pk, t.state) for t in chunk]
+
+    # SQLite serializes writes, the rows after the last pk are this chunk
+    return list(Transaction.objects.filter(
+        pk__gt=last_pk,
+        invoice__in=[t.invoice.name for t in chunk],
+    ).values_list('pk', 'state'))
+
+
+def import_transactions(file, name, archive=None, user=None):
+    files, zip_file = invoice_files(archive)
+    rows = fill_providers(list(read_rows(file, name)))
+    transactions, errors = validate(rows, files, user)
+    if errors:
+        return Result(0, errors)
+
+    field = Transaction._meta.get_field('invoice')
+    stored = []
+    try:
+        with atomic():
+            for start in range(0, len(transactions), CHUNK_SIZE):
+                chunk = transactions[start:start + CHUNK_SIZE]
+                stored += store_invoices(chunk, files, zip_file, field)
+
+                last_pk = Transaction.objects.aggregate(last=Max('pk'))['last'] or 0
+                Transaction.objects.bulk_create(chunk)
+
+                created = inserted(chunk, last_pk)
+                TransactionChange.record('create', [(pk, None, state) for pk, state in created])
+                search.index(pk for pk, state in created)
+                processing.enqueue(t.invoice.name for t in chunk)
+    except BaseException:
+        invoices.discard(stored)
+        raise
+
+    bump_version('diary', 'balance')
+    return Result(len(transactions), [])
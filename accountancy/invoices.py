@@ -0,0 +1,128 @@
+import os
+import time
+
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.db.transaction import on_commit
+from django.dispatch import receiver
+
+from .models import Transaction
+from .storage import digest
+
+'''
+Duplicate invoices and the lifetime of stored invoice files (see
+accountancy.storage).
+
+duplicates(transaction) finds other transactions with the same invoice
+file or the same business ID, invoice number and amount with one query
+over indexed columns. The digest of the uploaded file counts too, so an
+invoice uploaded again is found after its first copy was recompressed (see
+accountancy.processing). Disapproved transactions are left out, an invoice
+resubmitted after disapproval is not a duplicate.
+
+Files are shared by all transactions with the same invoice_hash, a file is
+deleted after the commit which removed its last reference, but only when
+it was not written in the last INVOICE_RELEASE_DELAY seconds: another
+request may have just stored the same content and not committed yet.
+Such files and uploads left by rolled back requests are deleted later by
+`manage.py sweep_invoices`. Files stored
+before the content addressed storage (without a digest in the name) are
+never deleted, `manage.py store_invoices` moves them to the new layout.
+'''
+
+
+def duplicates(transaction):
+    q = Q(
+        business_id=transaction.business_id,
+        invoice_number=transaction.invoice_number,
+        ammount=transaction.ammount,
+    )
+    hashes = {transaction.invoice_hash, transaction.invoice_original_hash} - {''}
+    if hashes:
+        q |= Q(invoice_hash__in=hashes) | Q(invoice_original_hash__in=hashes)
+
+    return Transaction.objects.filter(q).exclude(
+        pk=transaction.pk,
+    ).exclude(
+        state='disapproved',
+    ).order_by('pk')
+
+
+def invoice_storage():
+    return Transaction._meta.get_field('invoice').storage
+
+
+def release_delay():
+    return getattr(settings, 'INVOICE_RELEASE_DELAY', 3600)
+
+
+def release(name):
+    invoice_hash = digest(name)
+    if not invoice_hash:
+        return False
+
+    storage = invoice_storage()
+    try:
+        modified = os.path.getmtime(storage.path(name))
+    except OSError:
+        return False
+    if time.time() - modified < release_delay():
+        return False
+    if Transaction.objects.filter(invoice_hash=invoice_hash).exists():
+        return False
+
+    storage.delete(name)
+    return True
+
+
+def discard(names):
+    # files stored by a rolled back request, unless another one uses them
+    storage = invoice_storage()
+    for name in names:
+        if not Transaction.objects.filter(invoice_hash=digest(name)).exists():
+            storage.delete(name)
+
+
+def sweep():
+    storage = invoice_storage()
+    directory = storage.path(Transaction._meta.get_field('invoice').upload_to)
+    deleted = 0
+
+    for root, directories, files in os.walk(directory):
+        for filename in files:
+            path = os.path.join(root, filename)
+            if filename.startswith('.upload-'):
+                if time.time() - os.path.getmtime(path) >= release_delay():
+                    os.remove(path)
+                    deleted += 1
+                continue
+
+            name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+            deleted += release(name)
+    return deleted
+
+
+def release_on_commit(name):
+    if digest(name):
+        on_commit(lambda: release(name))
+
+
+@receiver(pre_save, sender=Transaction)
+def snapshot_invoice(sender, instance, **kwargs):
+    if instance.pk and instance.invoice and not instance.invoice._committed:
+        instance._old_invoice = Transaction.objects.filter(
+            pk=instance.pk,
+        ).values_list('invoice', flat=True).first()
+
+
+@receiver(post_save, sender=Transaction)
+def release_replaced(sender, instance, **kwargs):
+    old = instance.__dict__.pop('_old_invoice', None)
+    if old and old != instance.invoice.name:
+        release_on_commit(old)
+
+
+@receiver(post_delete, sender=Transaction)
+def release_deleted(sender, instance, **kwargs):
+    release_on_commit(instance.invoice.name)
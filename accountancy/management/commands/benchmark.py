@@ -0,0 +1,70 @@
+import json
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from accountancy import benchmark
+
+
+def sizes(value):
+    return [int(size) for size in value.split(',')]
+
+
+class Command(BaseCommand):
+    help = (
+        'Vygeneruje syntetické dáta v dočasnej databáze a zmeria verejné stránky, '
+        'zoznamy a akcie administrácie a CSV exporty. Výsledky zapíše ako JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=sizes,
+            default=[1000],
+            help='Počty transakcií oddelené čiarkou, napr. 1000,100000,1000000.',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Počet opakovaní každého merania.',
+        )
+        parser.add_argument(
+            '--invoices',
+            type=int,
+            default=20,
+            help='Počet vygenerovaných PDF faktúr.',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+        )
+        parser.add_argument(
+            '--output',
+            help='Cesta k výstupnému JSON súboru, predvolene štandardný výstup.',
+        )
+
+    def handle(self, *args, **options):
+        media = tempfile.TemporaryDirectory()
+        with media, override_settings(
+            MEDIA_ROOT=media.name,
+            ALLOWED_HOSTS=['testserver'],
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+            INSTRUMENTATION=False,
+        ):
+            results = benchmark.run(
+                options['sizes'],
+                repeat=options['repeat'],
+                seed=options['seed'],
+                invoices=options['invoices'],
+                log=self.stderr.write,
+            )
+
+        output = json.dumps(results, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
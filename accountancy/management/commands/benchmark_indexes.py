@@ -0,0 +1,117 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from accountancy import synthetic
+from accountancy.models import Transaction, Approval, Item
+from finances.models import TransactionType, ExtraExpense
+
+INDEXED_MODELS = (Transaction, Item, TransactionType, ExtraExpense)
+
+# the queries get the transaction type with the most extra expenses
+QUERIES = (
+    ('TransactionAdmin', lambda extra_type: Transaction.objects.filter(
+        state='created',
+    ).order_by('-date_created')[:100]),
+    ('ApprovalAdmin', lambda extra_type: Approval.objects.filter(
+        transaction__state='created',
+    ).select_related('transaction', 'transaction_type').order_by('-transaction__date_created')[:100]),
+    ('ItemAdmin', lambda extra_type: Item.objects.filter(
+        transaction__state='approved',
+    ).select_related('transaction', 'approval__transaction_type').order_by('-date_payed')[:100]),
+    ('DiaryView', lambda extra_type: Transaction.objects.filter(
+        state='public',
+    ).order_by('-item__date_payed')[:100]),
+    ('BalanceView', lambda extra_type: TransactionType.objects.filter(
+        section='ultimate',
+    ).order_by('name')),
+    ('ExtraExpense', lambda extra_type: ExtraExpense.objects.filter(
+        transaction_type=extra_type,
+        state__in=['payed', 'borrowed'],
+    )),
+    ('Section', lambda extra_type: Transaction.objects.filter(
+        section='discgolf',
+        state__in=['payed', 'public'],
+    ).order_by('-pk')[:100]),
+)
+
+
+def busiest_type():
+    return ExtraExpense.objects.values('transaction_type').annotate(
+        count=Count('pk'),
+    ).order_by('-count').values_list('transaction_type', flat=True).first()
+
+
+class Command(BaseCommand):
+    help = (
+        'Vytvorí dočasnú databázu so syntetickými dátami a porovná plány '
+        'a časy najčastejších dopytov bez indexov a s indexmi.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--transactions',
+            type=int,
+            default=1000000,
+            help='Počet vygenerovaných transakcií.',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Počet opakovaní každého dopytu, použije sa najlepší čas.',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+        )
+
+    def measure(self, repeat):
+        extra_type = busiest_type()
+        results = {}
+        for name, query in QUERIES:
+            best = None
+            for i in range(repeat):
+                start = time.perf_counter()
+                list(query(extra_type))
+                duration = time.perf_counter() - start
+                best = duration if best is None else min(best, duration)
+            results[name] = (best, query(extra_type).explain())
+        return results
+
+    def set_indexes(self, connection, enabled):
+        with connection.schema_editor() as editor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    if enabled:
+                        editor.add_index(model, index)
+                    else:
+                        editor.remove_index(model, index)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def handle(self, *args, **options):
+        with synthetic.throwaway_database() as connection:
+            self.stdout.write('Generujem {} transakcií...'.format(options['transactions']))
+            synthetic.generate(
+                transactions=options['transactions'],
+                seed=options['seed'],
+            )
+
+            self.set_indexes(connection, False)
+            before = self.measure(options['repeat'])
+            self.set_indexes(connection, True)
+            after = self.measure(options['repeat'])
+
+        for name, query in QUERIES:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                '{}: {:.2f} ms -> {:.2f} ms'.format(name, before[name][0] * 1000, after[name][0] * 1000)
+            ))
+            self.stdout.write('  bez indexov:')
+            for line in before[name][1].splitlines():
+                self.stdout.write('    ' + line)
+            self.stdout.write('  s indexmi:')
+            for line in after[name][1].splitlines():
+                self.stdout.write('    ' + line)
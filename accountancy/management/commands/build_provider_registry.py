@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accountancy import registry
+
+
+class Command(BaseCommand):
+    help = 'Zostaví index registra dodávateľov (IČO -> názov) z CSV súboru so stĺpcami ICO a NAZOV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'dataset',
+            help='Cesta k CSV súboru registra.',
+        )
+        parser.add_argument(
+            '--output',
+            help='Cesta k indexu, predvolene PROVIDER_REGISTRY_INDEX.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['output'] or registry.index_path()
+        if not path:
+            raise CommandError('Nastavte PROVIDER_REGISTRY_INDEX alebo zadajte --output.')
+
+        try:
+            with open(options['dataset'], 'rb') as dataset:
+                count = registry.build_index(dataset, path)
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
+
+        self.stdout.write(self.style.SUCCESS('Počet dodávateľov v registri: {}'.format(count)))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accountancy import exports
+from accountancy.models import Item
+
+
+class Command(BaseCommand):
+    help = 'Exportuje faktúry zaplatených položiek spolu so zoznamom do ZIP archívu.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output',
+            help='Cesta k výstupnému ZIP súboru.',
+        )
+        parser.add_argument(
+            '--year',
+            type=int,
+            help='Rok zúčtovania.',
+        )
+        parser.add_argument(
+            '--from',
+            dest='date_from',
+            type=exports.parse_date_argument,
+            help='Dátum zúčtovania od (RRRR-MM-DD).',
+        )
+        parser.add_argument(
+            '--to',
+            dest='date_to',
+            type=exports.parse_date_argument,
+            help='Dátum zúčtovania do (RRRR-MM-DD).',
+        )
+
+    def handle(self, *args, **options):
+        items = exports.payed_items(
+            Item.objects.all(),
+            options['year'],
+            options['date_from'],
+            options['date_to'],
+        )
+
+        try:
+            output = open(options['output'], 'wb')
+        except OSError as e:
+            raise CommandError(e)
+        with output:
+            exports.write_invoices_zip(output, items)
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accountancy import exports
+from accountancy.models import Item
+
+
+class Command(BaseCommand):
+    help = 'Exportuje zaplatené položky pre účtovníka do CSV súboru.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--year',
+            type=int,
+            help='Rok zúčtovania.',
+        )
+        parser.add_argument(
+            '--from',
+            dest='date_from',
+            type=exports.parse_date_argument,
+            help='Dátum zúčtovania od (RRRR-MM-DD).',
+        )
+        parser.add_argument(
+            '--to',
+            dest='date_to',
+            type=exports.parse_date_argument,
+            help='Dátum zúčtovania do (RRRR-MM-DD).',
+        )
+        parser.add_argument(
+            '-o', '--output',
+            help='Cesta k výstupnému súboru, inak štandardný výstup.',
+        )
+
+    def handle(self, *args, **options):
+        items = exports.payed_items(
+            Item.objects.all(),
+            options['year'],
+            options['date_from'],
+            options['date_to'],
+        )
+        rows = exports.invoicing_rows(items)
+
+        if options['output']:
+            try:
+                output = open(options['output'], 'w', newline='', encoding='utf-8')
+            except OSError as e:
+                raise CommandError(e)
+            with output:
+                exports.write_csv(output, exports.INVOICING_HEADER, rows)
+        else:
+            exports.write_csv(self.stdout, exports.INVOICING_HEADER, rows)
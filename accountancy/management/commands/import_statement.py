@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accountancy import statements
+
+
+class Command(BaseCommand):
+    help = 'Spáruje bankový výpis (CSV alebo camt.053) so schválenými transakciami a zaplatí isté zhody.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'statement',
+            help='Cesta k súboru s výpisom.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Iba vypíše zhody, transakcie nezaplatí.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['statement'], 'rb') as statement:
+                result = statements.reconcile(statement, options['statement'])
+        except (OSError, statements.StatementError) as e:
+            raise CommandError(e)
+
+        for error in result.errors:
+            self.stderr.write(error)
+        for line, pks in result.unmatched:
+            self.stdout.write('riadok {}: {} {} VS {} -> kandidáti {}'.format(
+                line.number,
+                line.date,
+                line.ammount,
+                line.reference or '-',
+                ', '.join(str(pk) for pk in pks) or '-',
+            ))
+
+        if not options['dry_run']:
+            paid = statements.pay([(pk, line.date) for line, pk in result.matched])
+            self.stdout.write(self.style.SUCCESS('Zaplatených transakcií: {}'.format(len(paid.changed))))
+        else:
+            self.stdout.write('Istých zhôd: {}'.format(len(result.matched)))
+        self.stdout.write('Nespárovaných riadkov: {}'.format(len(result.unmatched)))
@@ -0,0 +1,43 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from accountancy import intake
+
+
+class Command(BaseCommand):
+    help = 'Hromadne vytvorí transakcie z CSV alebo Excel tabuľky s faktúrami v ZIP archíve.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'sheet',
+            help='Cesta k CSV alebo xlsx súboru.',
+        )
+        parser.add_argument(
+            'invoices',
+            help='Cesta k ZIP archívu s faktúrami.',
+        )
+        parser.add_argument(
+            '--user',
+            help='Používateľské meno autora transakcií.',
+        )
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = get_user_model().objects.get_by_natural_key(options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError('Používateľ {} neexistuje.'.format(options['user']))
+
+        try:
+            with open(options['sheet'], 'rb') as sheet, open(options['invoices'], 'rb') as invoices:
+                result = intake.import_transactions(sheet, options['sheet'], invoices, user)
+        except (OSError, intake.IntakeError) as e:
+            raise CommandError(e)
+
+        for error in result.errors:
+            self.stderr.write(error)
+        if result.errors:
+            raise CommandError('Žiadna transakcia nebola vytvorená, počet chýb: {}'.format(len(result.errors)))
+
+        self.stdout.write(self.style.SUCCESS('Počet vytvorených transakcií: {}'.format(result.created)))
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accountancy.processing import broken, process_pool, process_queued
+
+
+class Command(BaseCommand):
+    help = 'Spracuje faktúry čakajúce vo fronte na lokálnom zásobníku procesov.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=50,
+            help='Maximálny počet faktúr spracovaných naraz.',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Počet procesov, predvolene počet jadier.',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Beží nepretržite a frontu kontroluje opakovane.',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=10,
+            help='Počet sekúnd medzi kontrolami fronty v režime --loop.',
+        )
+
+    def handle(self, *args, **options):
+        executor = process_pool(options['workers'])
+        try:
+            while True:
+                done, failed = process_queued(options['limit'], executor)
+                if done or failed:
+                    self.stdout.write('Spracované: {}, neúspešné: {}'.format(done, failed))
+
+                if failed and broken(executor):
+                    self.stderr.write('Proces spracovania zlyhal, spúšťa sa nový zásobník procesov.')
+                    executor.shutdown(wait=False)
+                    executor = process_pool(options['workers'])
+
+                if not options['loop']:
+                    break
+                if done + failed < options['limit']:
+                    time.sleep(options['interval'])
+        finally:
+            executor.shutdown()
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from accountancy import search
+
+
+class Command(BaseCommand):
+    help = 'Vytvorí a znovu naplní index pre vyhľadávanie transakcií.'
+
+    def handle(self, *args, **options):
+        search.rebuild()
+        self.stdout.write(self.style.SUCCESS('Index vyhľadávania je aktuálny.'))
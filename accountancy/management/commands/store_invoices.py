@@ -0,0 +1,46 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.db.transaction import atomic
+
+from accountancy import processing
+from accountancy.models import Transaction
+from accountancy.storage import digest
+
+
+class Command(BaseCommand):
+    help = (
+        'Presunie faktúry uložené pred zavedením ukladania podľa obsahu do nového '
+        'umiestnenia, rovnaké súbory uloží iba raz.'
+    )
+
+    def handle(self, *args, **options):
+        field = Transaction._meta.get_field('invoice')
+        storage = field.storage
+        names = Transaction.objects.filter(
+            invoice_hash='',
+        ).exclude(
+            invoice='',
+        ).values_list('invoice', flat=True).distinct()
+
+        stored = missing = 0
+        for name in names.iterator():
+            if not storage.exists(name):
+                missing += 1
+                continue
+
+            with storage.open(name, 'rb') as invoice:
+                new_name = storage.save(field.generate_filename(None, os.path.basename(name)), invoice)
+            with atomic():
+                Transaction.objects.filter(invoice=name).update(
+                    invoice=new_name,
+                    invoice_hash=digest(new_name),
+                    invoice_original_hash=digest(new_name),
+                )
+            storage.delete(name)
+            processing.enqueue([new_name])
+            stored += 1
+
+        self.stdout.write(self.style.SUCCESS('Presunutých faktúr: {}'.format(stored)))
+        if missing:
+            self.stdout.write(self.style.WARNING('Chýbajúcich súborov: {}'.format(missing)))
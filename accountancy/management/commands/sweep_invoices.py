@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from accountancy import invoices
+
+
+class Command(BaseCommand):
+    help = 'Zmaže uložené faktúry, na ktoré už neodkazuje žiadna transakcia.'
+
+    def handle(self, *args, **options):
+        deleted = invoices.sweep()
+        self.stdout.write(self.style.SUCCESS('Zmazaných súborov: {}'.format(deleted)))
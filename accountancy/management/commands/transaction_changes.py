@@ -0,0 +1,28 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from accountancy.changes import changes_since
+
+
+class Command(BaseCommand):
+    help = 'Vypíše zmeny transakcií od zadaného poradového čísla, jednu JSON zmenu na riadok.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            type=int,
+            default=0,
+            help='Poradové číslo poslednej spracovanej zmeny.',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=1000,
+            help='Najväčší počet vypísaných zmien.',
+        )
+
+    def handle(self, *args, **options):
+        for change in changes_since(options['since'], options['limit']):
+            self.stdout.write(json.dumps(change, cls=DjangoJSONEncoder, ensure_ascii=False))
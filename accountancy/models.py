@@ -1,12 +1,16 @@
 from django.db import models
+from django.db.models import Q
 from django.conf import settings
 from django.core.validators import RegexValidator
+from django.utils import timezone
 
 import os
 from django.core.exceptions import ValidationError
 
 from finances.models import TransactionType
 from app.emails import SendMail
+from .storage import ContentAddressedStorage, HashedFileField
+from .validators import validate_iban, validate_business_id
 
 SECTIONS = settings.SECTIONS
 
@@ -32,6 +36,14 @@ def validate_file_extension(value):
         raise ValidationError('Súbor musí byť vo formáte PDF.')
 
 
+def paid_in_year(year):
+    # transactions without a payment date belong to the year they were created
+    return (
+        Q(item__date_payed__year=year) |
+        Q(item__date_payed__isnull=True, date_created__year=year)
+    )
+
+
 class Transaction(models.Model):
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -64,6 +76,7 @@ class Transaction(models.Model):
     )
     iban = models.CharField(
         max_length=31,
+        validators=[validate_iban],
     )
     provider = models.CharField(
         max_length=255,
@@ -72,64 +85,93 @@ class Transaction(models.Model):
     business_id = models.CharField(
         max_length=15,
         verbose_name='IČO/Business ID',
-        validators=[RegexValidator(regex='[0-9]{8,}')],
+        validators=[RegexValidator(regex='[0-9]{8,}'), validate_business_id],
     )
     invoice_number = models.CharField(
         max_length=63,
         verbose_name='číslo faktúry',
     )
-    invoice = models.FileField(
+    invoice = HashedFileField(
         verbose_name='faktúra',
-        upload_to='invoices/%Y/%m/',
+        upload_to='invoices/',
+        storage=ContentAddressedStorage(url_name='accountancy:invoice'),
         validators=[validate_file_extension],
+        hash_field='invoice_hash',
+        original_hash_field='invoice_original_hash',
+    )
+    invoice_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        verbose_name='odtlačok faktúry',
+    )
+    invoice_original_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        verbose_name='odtlačok nahranej faktúry',
     )
 
     class Meta:
         verbose_name = 'transakcia'
         verbose_name_plural = 'transakcie'
+        indexes = [
+            models.Index(
+                fields=['state', '-date_created'],
+                name='transaction_state_created',
+            ),
+            models.Index(
+                fields=['section', 'state'],
+                name='transaction_section_state',
+            ),
+            models.Index(
+                fields=['-date_created'],
+                name='transaction_created_open',
+                condition=models.Q(state__in=['created', 'approved']),
+            ),
+            models.Index(
+                fields=['ammount'],
+                name='transaction_ammount',
+            ),
+            models.Index(
+                fields=['business_id', 'invoice_number', 'ammount'],
+                name='transaction_invoice',
+            ),
+            models.Index(
+                fields=['invoice_hash'],
+                name='transaction_invoice_hash',
+            ),
+            models.Index(
+                fields=['invoice_original_hash'],
+                name='transaction_invoice_original',
+            ),
+        ]
 
     def __str__(self):
         return 'Transakcia {} - {}'.format(self.pk, self.date_created.date())
 
-    def approve(self):
-        self.state = 'approved'
-        self.save()
-
-        i = Item.objects.create(
-            transaction=self,
-            approval=self.approval
-        )
-        i.send_reminder()
+    def transition(self, name, by_who=''):
+        from .transitions import apply_one
+        apply_one(name, self, by_who)
 
-        SendMail(
-            [self.created_by.email],
-            'Informácia o schválení transakcie '+str(self.pk)
-        ).change_state(
-            'schválená finančným manažérom sekcie',
-            self
-        )
+    def approve(self):
+        self.transition('approve')
 
     def pay(self):
-        self.state = 'public'
-        self.save()
-
-        SendMail(
-            [self.created_by.email],
-            'Informácia o zaplatení transakcie '+str(self.pk)
-        ).change_state(
-            'zaplatená',
-            self
-        )
+        self.transition('pay')
 
     def disapprove(self, by_who):
-        self.state = 'disapproved'
-        self.save()
+        self.transition('disapprove', by_who)
+
+    def send_state_info(self, subject, model):
+        if not self.created_by or not self.created_by.email:
+            return
 
         SendMail(
             [self.created_by.email],
-            'Informácia o zamietnutí transakcie '+str(self.pk)
+            subject+str(self.pk)
         ).change_state(
-            'zamietnutá '+by_who,
+            model,
             self
         )
 
@@ -213,6 +255,12 @@ class Item(models.Model):
     class Meta:
         verbose_name = 'položka'
         verbose_name_plural = 'položky'
+        indexes = [
+            models.Index(
+                fields=['-date_payed'],
+                name='item_date_payed',
+            ),
+        ]
 
     def __str__(self):
         return '{} - {}'.format(
@@ -221,11 +269,7 @@ class Item(models.Model):
         )
     
     def disapprove(self):
-        self.transaction.state = 'created'
-        self.transaction.save()
-
-        self.approval.send_reminder()
-        self.delete()
+        self.transaction.transition('return_to_approval')
 
     def send_reminder(self):
         SendMail(
@@ -246,3 +290,136 @@ class Item(models.Model):
             {'t': self.transaction},
             self.transaction.invoice.path,
         )
+
+
+EVENTS = (
+    ('create', 'vytvorenie'),
+    ('edit', 'úprava'),
+    ('delete', 'zmazanie'),
+    ('request_approval', 'žiadosť o schválenie'),
+    ('approve', 'schválenie'),
+    ('disapprove', 'zamietnutie'),
+    ('return_to_approval', 'vrátenie na schválenie'),
+    ('pay', 'zaplatenie'),
+    ('make_public', 'zverejnenie'),
+    ('make_privat', 'skrytie'),
+    ('close_year', 'uzavretie roka'),
+)
+
+
+class TransactionChange(models.Model):
+    transaction = models.ForeignKey(
+        Transaction,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        related_name='changes',
+        verbose_name='transakcia',
+    )
+    event = models.CharField(
+        max_length=31,
+        choices=EVENTS,
+        verbose_name='udalosť',
+    )
+    old_state = models.CharField(
+        max_length=15,
+        choices=STATES,
+        verbose_name='pôvodný stav',
+        blank=True,
+    )
+    new_state = models.CharField(
+        max_length=15,
+        choices=STATES,
+        verbose_name='nový stav',
+        blank=True,
+    )
+    date = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='dátum',
+    )
+
+    class Meta:
+        verbose_name = 'zmena transakcie'
+        verbose_name_plural = 'zmeny transakcií'
+
+    def __str__(self):
+        return '{} {} ({})'.format(self.pk, self.event, self.transaction_id)
+
+    @classmethod
+    def record(cls, event, changes):
+        cls.objects.bulk_create([
+            cls(
+                transaction_id=pk,
+                event=event,
+                old_state=old_state or '',
+                new_state=new_state or '',
+            )
+            for pk, old_state, new_state in changes
+        ])
+
+
+JOB_STATES = (
+    ('queued', 'čaká na spracovanie'),
+    ('done', 'spracovaná'),
+    ('invalid', 'neplatný súbor'),
+    ('failed', 'nespracovateľná'),
+)
+
+
+class InvoiceJob(models.Model):
+    invoice = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='faktúra',
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='vytvorené',
+    )
+    state = models.CharField(
+        max_length=15,
+        choices=JOB_STATES,
+        verbose_name='stav',
+        default='queued',
+    )
+    attempts = models.PositiveSmallIntegerField(
+        verbose_name='počet pokusov',
+        default=0,
+    )
+    next_attempt = models.DateTimeField(
+        verbose_name='ďalší pokus',
+        default=timezone.now,
+    )
+    last_error = models.TextField(
+        verbose_name='posledná chyba',
+        blank=True,
+    )
+    size = models.PositiveIntegerField(
+        verbose_name='veľkosť',
+        blank=True,
+        null=True,
+    )
+    pages = models.PositiveIntegerField(
+        verbose_name='počet strán',
+        blank=True,
+        null=True,
+    )
+    text = models.TextField(
+        verbose_name='text',
+        blank=True,
+    )
+    date_processed = models.DateTimeField(
+        verbose_name='spracované',
+        blank=True,
+        null=True,
+    )
+
+    class Meta:
+        verbose_name = 'spracovanie faktúry'
+        verbose_name_plural = 'spracovanie faktúr'
+        indexes = [
+            models.Index(fields=['state', 'next_attempt']),
+        ]
+
+    def __str__(self):
+        return self.invoice
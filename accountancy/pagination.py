@@ -0,0 +1,86 @@
+from datetime import date
+
+from django.db.models import F, Q
+from django.http import Http404
+
+'''
+Keyset (seek) pagination over a nullable date field and the primary key,
+newest first and rows without a date last. Every page is a single indexed
+query no matter how deep it is:
+
+page = keyset_page(queryset, 'item__date_payed', request.GET.get('after'), 100)
+page.object_list, page.has_next, page.next_cursor
+'''
+
+
+class KeysetPage:
+
+    def __init__(self, object_list, has_next, next_cursor, cursor, size):
+        self.object_list = object_list
+        self.size = size
+        self.has_next = has_next
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def encode_cursor(value, pk):
+    return '{}_{}'.format(value.isoformat() if value else '', pk)
+
+
+def decode_cursor(cursor):
+    try:
+        value, pk = cursor.split('_')
+        return (date.fromisoformat(value) if value else None), int(pk)
+    except ValueError:
+        raise Http404('Neplatný kurzor stránkovania.')
+
+
+def keyset_ordering(field):
+    return (F(field).desc(nulls_last=True), '-pk')
+
+
+def keyset_filter(field, value, pk):
+    if value is None:
+        return Q(**{field + '__isnull': True, 'pk__lt': pk})
+
+    return (
+        Q(**{field + '__lt': value})
+        | Q(**{field: value, 'pk__lt': pk})
+        | Q(**{field + '__isnull': True})
+    )
+
+
+def keyset_rows(queryset, field, cursor, size):
+    queryset = queryset.order_by(*keyset_ordering(field))
+    if cursor:
+        queryset = queryset.filter(keyset_filter(field, *decode_cursor(cursor)))
+    return queryset[:size + 1]
+
+
+def resolve(obj, field):
+    for name in field.split('__'):
+        obj = getattr(obj, name, None)
+        if obj is None:
+            return None
+    return obj
+
+
+def row_cursor(row, field):
+    if isinstance(row, dict):
+        return encode_cursor(row[field], row['pk'])
+    return encode_cursor(resolve(row, field), row.pk)
+
+
+def keyset_page(queryset, field, cursor, size):
+    rows = list(keyset_rows(queryset, field, cursor, size))
+    has_next = len(rows) > size
+    rows = rows[:size]
+
+    next_cursor = row_cursor(rows[-1], field) if has_next else None
+    return KeysetPage(rows, has_next, next_cursor, cursor, size)
@@ -0,0 +1,141 @@
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import zlib
+
+'''
+Inspection of invoice files, run in the worker processes of
+accountancy.processing. Nothing here touches Django or the database, the
+functions take a path and plain options and return a plain dict, so they
+can run in a process pool started with the spawn method.
+
+Page count and text are read with the optional pypdf package. Without it
+pages are counted from the page objects and text is read from the
+uncompressed or Flate compressed content streams, which is enough for
+generated invoices but not for scans. Recompression needs Ghostscript.
+'''
+
+HEADER_SIZE = 1024
+TRAILER_SIZE = 1024
+RECOMPRESS_TIMEOUT = 300
+
+PAGE = re.compile(rb'/Type\s*/Page(?![a-zA-Z])')
+STREAM = re.compile(rb'<<(.*?)>>\s*stream\r?\n(.*?)\r?\nendstream', re.S)
+TEXT = re.compile(rb'\(((?:\\.|[^\\)])*)\)\s*(?:Tj|\')|\[((?:\\.|[^\]])*)\]\s*TJ', re.S)
+STRING = re.compile(rb'\(((?:\\.|[^\\)])*)\)', re.S)
+ESCAPE = re.compile(rb'\\([nrtbf()\\]|[0-7]{1,3})')
+
+ESCAPES = {
+    b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f',
+    b'(': b'(', b')': b')', b'\\': b'\\',
+}
+
+
+def unescape(string):
+    return ESCAPE.sub(
+        lambda m: ESCAPES.get(m.group(1)) or bytes([int(m.group(1), 8) & 0xff]),
+        string,
+    )
+
+
+def streams(data):
+    for dictionary, stream in STREAM.findall(data):
+        if b'/FlateDecode' in dictionary:
+            try:
+                stream = zlib.decompress(stream)
+            except zlib.error:
+                continue
+        elif b'/Filter' in dictionary:
+            continue
+        yield stream
+
+
+def simple_text(data):
+    words = []
+    for stream in streams(data):
+        for single, array in TEXT.findall(stream):
+            for string in [single] if single else STRING.findall(array):
+                words.append(unescape(string).decode('latin-1'))
+    return ' '.join(w for w in words if w.strip())
+
+
+def read_pdf(path, data):
+    try:
+        import pypdf
+    except ImportError:
+        return len(PAGE.findall(data)), simple_text(data)
+
+    reader = pypdf.PdfReader(path)
+    return len(reader.pages), ' '.join(page.extract_text() or '' for page in reader.pages)
+
+
+def recompress(path, ghostscript):
+    if not shutil.which(ghostscript):
+        return None
+
+    descriptor, output = tempfile.mkstemp(suffix='.pdf')
+    os.close(descriptor)
+    try:
+        subprocess.run(
+            [
+                ghostscript, '-q', '-dSAFER', '-dBATCH', '-dNOPAUSE',
+                '-sDEVICE=pdfwrite', '-dPDFSETTINGS=/ebook',
+                '-sOutputFile={}'.format(output), path,
+            ],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            timeout=RECOMPRESS_TIMEOUT,
+        )
+    except (OSError, subprocess.SubprocessError):
+        os.remove(output)
+        return None
+
+    if os.path.getsize(output) >= os.path.getsize(path):
+        os.remove(output)
+        return None
+    return output
+
+
+def inspect_file(path, digest, options):
+    with open(path, 'rb') as file:
+        data = file.read()
+
+    result = {
+        'size': len(data),
+        'pages': None,
+        'text': '',
+        'error': '',
+        'retry': False,
+        'recompressed': None,
+    }
+
+    if b'%PDF-' not in data[:HEADER_SIZE] or b'%%EOF' not in data[-TRAILER_SIZE:]:
+        result['error'] = 'Súbor nie je PDF.'
+        return result
+
+    if digest and hashlib.sha256(data).hexdigest() != digest:
+        result['error'] = 'Obsah súboru nezodpovedá odtlačku v názve.'
+        return result
+
+    try:
+        result['pages'], text = read_pdf(path, data)
+    except Exception:
+        result['error'] = 'PDF sa nedá prečítať.'
+        return result
+    result['text'] = ' '.join(text.split())[:options['text_length']]
+
+    if options['recompress_size'] and len(data) > options['recompress_size']:
+        result['recompressed'] = recompress(path, options['ghostscript'])
+
+    return result
+
+
+def inspect(path, digest, options):
+    try:
+        return inspect_file(path, digest, options)
+    except Exception as error:
+        return {'error': repr(error), 'retry': True}
@@ -0,0 +1,217 @@
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connection
+from django.db.models.signals import pre_save, post_save
+from django.db.transaction import atomic
+from django.dispatch import receiver
+from django.utils import timezone
+
+from app.caching import bump_version
+from mailing.outbox import move_attachment
+from . import invoices, pdf, search
+from .models import Transaction, InvoiceJob
+from .storage import digest
+
+'''
+Background processing of invoice files. Every newly stored invoice gets an
+InvoiceJob (an upload only inserts the job, bulk imports call enqueue()),
+and `manage.py process_invoices` works through the queue on a local
+process pool (see accountancy.pdf):
+
+- checks that the file really is a PDF and that its content matches the
+  digest in its name,
+- counts the pages and extracts the text, which is added to the search
+  index (accountancy.search),
+- with INVOICE_RECOMPRESS_SIZE set, rewrites bigger files with Ghostscript
+  and replaces them when the result is smaller.
+
+Only the parent process touches the database: it claims a batch of jobs
+like the e-mail outbox (mailing.outbox), sends the paths to the workers and
+writes the results back with one bulk_update. Failed jobs are retried
+INVOICE_QUEUE_MAX_ATTEMPTS times with a growing delay, invalid files are
+not retried. A worker killed in the middle of a batch (e.g. out of memory on
+a huge scan) breaks the pool: the jobs of the batch count it as a failed
+attempt, so a file which keeps killing workers ends up failed, and the
+command starts a new pool.
+'''
+
+TEXT_LENGTH = 100000
+
+RESULT_FIELDS = [
+    'invoice',
+    'state',
+    'attempts',
+    'next_attempt',
+    'last_error',
+    'size',
+    'pages',
+    'text',
+    'date_processed',
+]
+
+
+def max_attempts():
+    return getattr(settings, 'INVOICE_QUEUE_MAX_ATTEMPTS', 5)
+
+
+def retry_delay(attempts):
+    base = getattr(settings, 'INVOICE_QUEUE_RETRY_DELAY', 60)
+    return timedelta(seconds=base * 2 ** (attempts - 1))
+
+
+def worker_options():
+    return {
+        'text_length': TEXT_LENGTH,
+        'recompress_size': getattr(settings, 'INVOICE_RECOMPRESS_SIZE', None),
+        'ghostscript': getattr(settings, 'GHOSTSCRIPT', 'gs'),
+    }
+
+
+def process_pool(workers=None):
+    # spawned workers don't inherit the open database connections
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def broken(executor):
+    try:
+        executor.submit(int).result()
+    except BrokenProcessPool:
+        return True
+    return False
+
+
+def submit(executor, *args):
+    try:
+        return executor.submit(*args)
+    except BrokenProcessPool as error:
+        future = Future()
+        future.set_exception(error)
+        return future
+
+
+def pool_result(future):
+    try:
+        return future.result()
+    except BrokenProcessPool as error:
+        return {'error': repr(error), 'retry': True}
+
+
+def inspect_all(paths, digests, executor=None):
+    options = worker_options()
+    if executor is None:
+        return [pdf.inspect(path, digest, options) for path, digest in zip(paths, digests)]
+
+    futures = [
+        submit(executor, pdf.inspect, path, digest, options)
+        for path, digest in zip(paths, digests)
+    ]
+    return [pool_result(future) for future in futures]
+
+
+def enqueue(names):
+    names = set(name for name in names if name)
+    InvoiceJob.objects.bulk_create(
+        [InvoiceJob(invoice=name) for name in sorted(names)],
+        ignore_conflicts=True,
+    )
+
+
+def claim(limit):
+    now = timezone.now()
+    lease = now + timedelta(seconds=getattr(settings, 'INVOICE_QUEUE_LEASE', 600))
+
+    with atomic():
+        due = InvoiceJob.objects.filter(
+            state='queued',
+            next_attempt__lte=now,
+        ).order_by('next_attempt', 'pk')
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+
+        pks = list(due.values_list('pk', flat=True)[:limit])
+        InvoiceJob.objects.filter(pk__in=pks).update(next_attempt=lease)
+
+    return InvoiceJob.objects.filter(pk__in=pks).order_by('pk')
+
+
+def replace_invoice(job, path):
+    field = Transaction._meta.get_field('invoice')
+    old = job.invoice
+    try:
+        with open(path, 'rb') as recompressed:
+            new = field.storage.save(field.generate_filename(None, os.path.basename(old)), File(recompressed))
+    finally:
+        os.remove(path)
+
+    # queryset updates skip the signals, the cache and the outbox are updated here
+    Transaction.objects.filter(invoice=old).update(invoice=new, invoice_hash=digest(new))
+    InvoiceJob.objects.filter(invoice=new).exclude(pk=job.pk).delete()
+    move_attachment(field.storage.path(old), field.storage.path(new))
+    bump_version('diary')
+    invoices.release_on_commit(old)
+
+    job.invoice = new
+    job.size = field.storage.size(new)
+
+
+def apply_result(job, result, now):
+    job.attempts += 1
+    job.last_error = result['error']
+
+    if result['retry']:
+        if job.attempts >= max_attempts():
+            job.state = 'failed'
+        else:
+            job.next_attempt = now + retry_delay(job.attempts)
+        return
+
+    job.state = 'invalid' if result['error'] else 'done'
+    job.size = result['size']
+    job.pages = result['pages']
+    job.text = result['text']
+    job.date_processed = now
+    if result['recompressed']:
+        replace_invoice(job, result['recompressed'])
+
+
+def process_queued(limit=50, executor=None):
+    jobs = list(claim(limit))
+    if not jobs:
+        return 0, 0
+
+    storage = Transaction._meta.get_field('invoice').storage
+    results = inspect_all(
+        [storage.path(job.invoice) for job in jobs],
+        [digest(job.invoice) for job in jobs],
+        executor,
+    )
+
+    now = timezone.now()
+    with atomic():
+        for job, result in zip(jobs, results):
+            apply_result(job, result, now)
+        InvoiceJob.objects.bulk_update(jobs, RESULT_FIELDS)
+
+        search.index(Transaction.objects.filter(
+            invoice__in=[job.invoice for job in jobs if job.state == 'done'],
+        ).values_list('pk', flat=True))
+
+    done = sum(1 for job in jobs if job.state == 'done')
+    return done, len(jobs) - done
+
+
+@receiver(pre_save, sender=Transaction)
+def mark_upload(sender, instance, **kwargs):
+    instance._invoice_uploaded = bool(instance.invoice) and not instance.invoice._committed
+
+
+@receiver(post_save, sender=Transaction)
+def enqueue_upload(sender, instance, **kwargs):
+    if instance.__dict__.pop('_invoice_uploaded', False):
+        enqueue([instance.invoice.name])
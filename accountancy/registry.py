@@ -0,0 +1,158 @@
+import csv
+import io
+import os
+import sqlite3
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+
+'''
+Optional offline registry of providers for filling the provider name from
+the business ID. The dataset (e.g. an export of the register of legal
+entities) is a CSV file with the columns ICO and NAZOV, which is converted
+once into an indexed SQLite file:
+
+python manage.py build_provider_registry register.csv
+
+and the path of the index is set as PROVIDER_REGISTRY_INDEX. Without it
+every lookup returns None.
+
+Found providers are cached in the process (lookup_provider), unknown IDs
+are not. The connection is reopened (and the cache cleared) whenever the
+index file changes, e.g. when another process rebuilds it, so a rebuilt
+index is used without a restart. Bulk lookups (lookup_providers) query the
+index once per LOOKUP_CHUNK_SIZE IDs.
+'''
+
+LOOKUP_CHUNK_SIZE = 500
+
+ID_COLUMNS = ('ico', 'ičo', 'business_id')
+NAME_COLUMNS = ('nazov', 'názov', 'name')
+
+
+def index_path():
+    return getattr(settings, 'PROVIDER_REGISTRY_INDEX', None)
+
+
+_index = {'key': None, 'db': None}
+_index_lock = threading.Lock()
+
+
+def connection():
+    path = index_path()
+    if not path:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    key = (path, stat.st_ino, stat.st_mtime_ns)
+    with _index_lock:
+        if _index['key'] != key:
+            if _index['db'] is not None:
+                _index['db'].close()
+            _index['db'] = sqlite3.connect(
+                'file:{}?mode=ro'.format(path),
+                uri=True,
+                check_same_thread=False,
+            )
+            _index['key'] = key
+            cached_provider.cache_clear()
+        return _index['db']
+
+
+class ProviderNotFound(Exception):
+    pass
+
+
+@lru_cache(maxsize=4096)
+def cached_provider(business_id):
+    # lru_cache doesn't keep exceptions, misses are looked up again
+    db = connection()
+    if db is None or not business_id:
+        raise ProviderNotFound(business_id)
+    row = db.execute(
+        'SELECT name FROM provider WHERE business_id = ?',
+        (business_id.strip(),),
+    ).fetchone()
+    if row is None:
+        raise ProviderNotFound(business_id)
+    return row[0]
+
+
+def lookup_provider(business_id):
+    # reopens the connection and clears the cache if the index was replaced
+    connection()
+    try:
+        return cached_provider(business_id)
+    except ProviderNotFound:
+        return None
+
+
+def lookup_providers(business_ids):
+    db = connection()
+    business_ids = sorted(set(b.strip() for b in business_ids if b))
+    if db is None or not business_ids:
+        return {}
+
+    providers = {}
+    for start in range(0, len(business_ids), LOOKUP_CHUNK_SIZE):
+        chunk = business_ids[start:start + LOOKUP_CHUNK_SIZE]
+        providers.update(db.execute(
+            'SELECT business_id, name FROM provider WHERE business_id IN ({})'.format(
+                ', '.join('?' * len(chunk)),
+            ),
+            chunk,
+        ))
+    return providers
+
+
+def find_column(header, names):
+    for i, h in enumerate(header):
+        if h.strip().lower() in names:
+            return i
+    raise ValueError('V súbore chýba stĺpec {}.'.format(names[0].upper()))
+
+
+def read_dataset(file):
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t|')
+    except csv.Error:
+        dialect = csv.excel
+
+    reader = csv.reader(text, dialect=dialect)
+    header = next(reader, [])
+    id_column = find_column(header, ID_COLUMNS)
+    name_column = find_column(header, NAME_COLUMNS)
+
+    for row in reader:
+        if len(row) > max(id_column, name_column) and row[id_column].strip():
+            yield row[id_column].strip(), row[name_column].strip()
+
+
+def build_index(file, path):
+    temporary = '{}.tmp'.format(path)
+    if os.path.exists(temporary):
+        os.remove(temporary)
+
+    db = sqlite3.connect(temporary)
+    try:
+        db.execute(
+            'CREATE TABLE provider (business_id TEXT PRIMARY KEY, name TEXT NOT NULL) WITHOUT ROWID'
+        )
+        with db:
+            db.executemany(
+                'INSERT OR REPLACE INTO provider VALUES (?, ?)',
+                read_dataset(file),
+            )
+        count = db.execute('SELECT COUNT(*) FROM provider').fetchone()[0]
+    finally:
+        db.close()
+
+    os.replace(temporary, path)
+    return count
@@ -0,0 +1,248 @@
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from finances.models import TransactionType
+from .models import Transaction, Approval, InvoiceJob
+
+'''
+Full-text search of transactions by description, provider, invoice number,
+business ID, transaction type name and the text of the invoice (see
+accountancy.processing), backed by a search index which is kept up to date
+by the signals below:
+
+- PostgreSQL: table with a tsvector of every transaction and a GIN index,
+- SQLite: FTS5 virtual table with the transaction id as rowid.
+
+The index is created after `manage.py migrate` and filled from scratch with
+`manage.py rebuild_search_index`. Bulk inserts and updates (bulk_create,
+queryset.update) don't send signals, code using them calls index(pks) or
+rebuild() itself.
+
+filter_transactions(Item.objects.all(), 'hotel 2020', prefix='transaction__')
+
+matches transactions containing words starting with every word of the
+query. Whole numbers match the transaction id, the amount and whole words
+(business ID, parts of invoice numbers) exactly, decimal numbers (12.50 or
+12,50) match only the amount. Other databases fall back to icontains
+lookups.
+'''
+
+TABLE = 'accountancy_search'
+
+CHUNK_SIZE = 500
+
+MAX_ID = 2 ** 31 - 1
+MAX_AMMOUNT = Decimal('999999.99')
+
+FALLBACK_FIELDS = (
+    'description',
+    'provider',
+    'invoice_number',
+    'business_id',
+    'approval__transaction_type__name',
+)
+
+SQL = {
+    'sqlite': {
+        'create': [
+            "CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+            "document, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+        ],
+        'document': "COALESCE(t.description, '') || ' ' || t.provider || ' ' || "
+                    "t.invoice_number || ' ' || t.business_id || ' ' || COALESCE(tt.name, '') || ' ' || "
+                    "COALESCE(j.text, '')",
+        'delete': 'DELETE FROM {table} WHERE rowid IN ({select})',
+        'insert': 'INSERT INTO {table} (rowid, document) {select}',
+        'remove': 'DELETE FROM {table} WHERE rowid IN ({pks})',
+        'clear': 'DELETE FROM {table}',
+        'match': 'SELECT rowid FROM {table} WHERE {table} MATCH %s',
+    },
+    'postgresql': {
+        'create': [
+            'CREATE TABLE IF NOT EXISTS {table} ('
+            'transaction_id integer PRIMARY KEY, document tsvector NOT NULL)',
+            'CREATE INDEX IF NOT EXISTS {table}_document ON {table} USING gin (document)',
+        ],
+        'document': "to_tsvector('{config}', concat_ws(' ', t.description, t.provider, "
+                    "t.invoice_number, t.business_id, tt.name, j.text))",
+        'delete': None,
+        'insert': 'INSERT INTO {table} (transaction_id, document) {select} '
+                  'ON CONFLICT (transaction_id) DO UPDATE SET document = EXCLUDED.document',
+        'remove': 'DELETE FROM {table} WHERE transaction_id IN ({pks})',
+        'clear': 'TRUNCATE {table}',
+        'match': "SELECT transaction_id FROM {table} WHERE document @@ to_tsquery('{config}', %s)",
+    },
+}
+
+SELECT = (
+    'SELECT t.id{document} FROM {transaction} t '
+    'LEFT JOIN {approval} a ON a.transaction_id = t.id '
+    'LEFT JOIN {type} tt ON tt.id = a.transaction_type_id '
+    'LEFT JOIN {job} j ON j.invoice = t.invoice '
+    'WHERE {where}'
+)
+
+
+class Match(RawSQL):
+    # the in lookup wraps its right hand side in parentheses itself
+
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params
+
+
+def statements(using=DEFAULT_DB_ALIAS):
+    return SQL.get(connections[using].vendor)
+
+
+def names(using=DEFAULT_DB_ALIAS):
+    quote = connections[using].ops.quote_name
+    return {
+        'table': quote(TABLE),
+        'config': getattr(settings, 'SEARCH_CONFIG', 'simple'),
+        'transaction': quote(Transaction._meta.db_table),
+        'approval': quote(Approval._meta.db_table),
+        'type': quote(TransactionType._meta.db_table),
+        'job': quote(InvoiceJob._meta.db_table),
+    }
+
+
+def select(where, using=DEFAULT_DB_ALIAS, document=True):
+    n = names(using)
+    if document:
+        document = ', ' + statements(using)['document'].format(**n)
+    return SELECT.format(document=document or '', where=where, **n)
+
+
+def execute(statement, params=(), using=DEFAULT_DB_ALIAS, **kwargs):
+    with connections[using].cursor() as cursor:
+        cursor.execute(statement.format(**names(using), **kwargs), params)
+
+
+def create_index(using=DEFAULT_DB_ALIAS, **kwargs):
+    sql = statements(using)
+    if sql is not None:
+        for statement in sql['create']:
+            execute(statement, using=using)
+
+
+def update(where, params=(), using=DEFAULT_DB_ALIAS):
+    sql = statements(using)
+    if sql is None:
+        return
+    if sql['delete']:
+        execute(sql['delete'], params, using, select=select(where, using, document=False))
+    execute(sql['insert'], params, using, select=select(where, using))
+
+
+def index(pks, using=DEFAULT_DB_ALIAS):
+    pks = sorted(set(pk for pk in pks if pk is not None))
+    for start in range(0, len(pks), CHUNK_SIZE):
+        chunk = pks[start:start + CHUNK_SIZE]
+        update('t.id IN ({})'.format(', '.join(['%s'] * len(chunk))), chunk, using)
+
+
+def index_type(transaction_type, using=DEFAULT_DB_ALIAS):
+    update('a.transaction_type_id = %s', [transaction_type], using)
+
+
+def remove(pks, using=DEFAULT_DB_ALIAS):
+    sql = statements(using)
+    pks = list(pks)
+    if sql is None or not pks:
+        return
+    execute(sql['remove'], pks, using, pks=', '.join(['%s'] * len(pks)))
+
+
+def rebuild(using=DEFAULT_DB_ALIAS):
+    sql = statements(using)
+    if sql is None:
+        return
+    create_index(using)
+    execute(sql['clear'], using=using)
+    update('1 = 1', using=using)
+
+
+def parse_ammount(term):
+    if not re.match(r'^-?\d+([.,]\d{1,2})?$', term):
+        return None
+    try:
+        ammount = Decimal(term.replace(',', '.'))
+    except InvalidOperation:
+        return None
+    return ammount if abs(ammount) <= MAX_AMMOUNT else None
+
+
+def match_query(words, vendor, prefixes=True):
+    if vendor == 'sqlite':
+        return ' '.join('"{}"{}'.format(w, '*' if prefixes else '') for w in words)
+    return ' & '.join('{}{}'.format(w, ':*' if prefixes else '') for w in words)
+
+
+def match(words, using, prefix='', prefixes=True):
+    sql = statements(using)
+    if sql is not None:
+        return Q(**{prefix + 'pk__in': Match(
+            sql['match'].format(**names(using)),
+            [match_query(words, connections[using].vendor, prefixes)],
+        )})
+
+    q = Q()
+    for word in words:
+        q &= Q(*[
+            Q(**{prefix + field + '__icontains': word})
+            for field in FALLBACK_FIELDS
+        ], _connector=Q.OR)
+    return q
+
+
+def filter_transactions(queryset, term, prefix=''):
+    term = term.strip()
+    if not term:
+        return queryset
+
+    q = Q()
+    if term.isdigit() and int(term) <= MAX_ID:
+        q |= Q(**{prefix + 'pk': int(term)})
+
+    ammount = parse_ammount(term)
+    if ammount is not None:
+        q |= Q(**{prefix + 'ammount': ammount})
+
+    words = re.findall(r'[^\W_]+', term)
+    if words and (ammount is None or term.isdigit()):
+        q |= match(words, queryset.db, prefix, prefixes=not term.isdigit())
+
+    return queryset.filter(q)
+
+
+@receiver(post_save, sender=Transaction)
+def index_transaction(sender, instance, using, **kwargs):
+    index([instance.pk], using)
+
+
+@receiver(post_save, sender=Approval)
+def index_approval(sender, instance, using, **kwargs):
+    index([instance.transaction_id], using)
+
+
+@receiver(post_save, sender=TransactionType)
+def index_transaction_type(sender, instance, created, using, **kwargs):
+    if not created:
+        index_type(instance.pk, using)
+
+
+@receiver(post_delete, sender=Approval)
+def index_deleted_approval(sender, instance, using, **kwargs):
+    index([instance.transaction_id], using)
+
+
+@receiver(post_delete, sender=Transaction)
+def remove_transaction(sender, instance, using, **kwargs):
+    remove([instance.pk], using)
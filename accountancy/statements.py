@@ -0,0 +1,286 @@
+import csv
+import io
+import re
+from collections import defaultdict, namedtuple
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from xml.etree.ElementTree import iterparse
+
+from django.conf import settings
+from django.db.transaction import atomic
+
+from .models import Item, Transaction
+from .validators import normalize_iban
+from . import transitions
+
+'''
+Import of bank statements (CSV export or camt.053 XML) matched against the
+approved transactions waiting for payment:
+
+result = reconcile(open('statement.xml', 'rb'))
+result.matched    # [(line, transaction pk)] confident matches
+result.unmatched  # [(line, [candidate transaction pks])]
+pay([(pk, line.date) for line, pk in result.matched], request.user)
+
+The statement is read line by line. All approved transactions are loaded
+in one query into dictionaries keyed by IBAN, amount and reference (the
+variable symbol, compared to the digits of the invoice number), so every
+line is matched in constant time. Only debits (outgoing payments, negative
+amounts in CSV, DBIT in camt.053) are matched, incoming credits such as
+refunds or deposits are skipped. A line is a confident match when exactly
+one transaction agrees on the amount, the reference and the IBAN (or the
+statement line has no IBAN). Everything else is left for the
+reconciliation screen together with its candidates.
+
+pay() sets the dates of payment of all matched items with one query and
+moves their transactions to the paid state with one bulk transition.
+'''
+
+CSV_COLUMNS = getattr(settings, 'STATEMENT_CSV_COLUMNS', {
+    'date': ('Dátum zaúčtovania', 'Dátum', 'Date'),
+    'ammount': ('Suma', 'Čiastka', 'Amount'),
+    'iban': ('IBAN protiúčtu', 'Protiúčet', 'IBAN'),
+    'reference': ('Variabilný symbol', 'VS', 'Reference'),
+    'description': ('Popis', 'Správa pre prijímateľa', 'Description'),
+})
+
+DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y', '%d. %m. %Y', '%d/%m/%Y')
+
+VARIABLE_SYMBOL = re.compile(r'/VS(\d+)')
+
+StatementLine = namedtuple('StatementLine', [
+    'number',
+    'date',
+    'ammount',
+    'iban',
+    'reference',
+    'description',
+    'debit',
+])
+
+Result = namedtuple('Result', ['matched', 'unmatched', 'errors'])
+
+
+class StatementError(Exception):
+    pass
+
+
+def normalize_reference(value):
+    digits = re.sub(r'\D', '', value or '').lstrip('0')
+    return digits or None
+
+
+def parse_ammount(value):
+    value = re.sub(r'\s', '', value or '').replace(',', '.')
+    try:
+        return Decimal(value).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise StatementError('Neplatná suma: {}'.format(value))
+
+
+def parse_date(value):
+    value = (value or '').strip()[:10]
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    raise StatementError('Neplatný dátum: {}'.format(value))
+
+
+def find_column(header, names):
+    for name in names:
+        if name in header:
+            return name
+    return None
+
+
+def parse_csv(file, encoding='utf-8-sig'):
+    text = io.TextIOWrapper(file, encoding=encoding, newline='')
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+
+    reader = csv.DictReader(text, dialect=dialect)
+    columns = {
+        field: find_column(reader.fieldnames or [], names)
+        for field, names in CSV_COLUMNS.items()
+    }
+    missing = [field for field in ('date', 'ammount') if columns[field] is None]
+    if missing:
+        raise StatementError('V súbore chýbajú stĺpce: {}'.format(', '.join(missing)))
+
+    for number, row in enumerate(reader, start=2):
+        values = {
+            field: (row.get(column) or '') if column else ''
+            for field, column in columns.items()
+        }
+        try:
+            ammount = parse_ammount(values['ammount'])
+            yield StatementLine(
+                number,
+                parse_date(values['date']),
+                abs(ammount),
+                normalize_iban(values['iban']),
+                normalize_reference(values['reference']),
+                values['description'].strip(),
+                ammount < 0,
+            )
+        except StatementError as e:
+            yield StatementError('Riadok {}: {}'.format(number, e))
+
+
+def local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def find_path(element, path):
+    for name in path.split('/'):
+        if element is None:
+            return None
+        element = next((e for e in element if local_name(e.tag) == name), None)
+    return element
+
+
+def find_text(element, *paths):
+    for path in paths:
+        found = find_path(element, path)
+        if found is not None and found.text:
+            return found.text.strip()
+    return ''
+
+
+def camt_reference(details):
+    reference = find_text(details, 'RmtInf/Strd/CdtrRefInf/Ref')
+    if not reference:
+        end_to_end = find_text(details, 'Refs/EndToEndId')
+        match = VARIABLE_SYMBOL.search(end_to_end)
+        reference = match.group(1) if match else ''
+    return normalize_reference(reference)
+
+
+def parse_camt(file):
+    number = 0
+    for event, element in iterparse(file):
+        if local_name(element.tag) != 'Ntry':
+            continue
+
+        date = find_text(element, 'BookgDt/Dt', 'BookgDt/DtTm', 'ValDt/Dt')
+        debit = find_text(element, 'CdtDbtInd') == 'DBIT'
+        party = 'Cdtr' if debit else 'Dbtr'
+
+        details = [
+            d for d in find_path(element, 'NtryDtls') or []
+            if local_name(d.tag) == 'TxDtls'
+        ] or [element]
+
+        for d in details:
+            number += 1
+            try:
+                yield StatementLine(
+                    number,
+                    parse_date(date),
+                    abs(parse_ammount(find_text(d, 'Amt', 'AmtDtls/TxAmt/Amt') or find_text(element, 'Amt'))),
+                    normalize_iban(find_text(d, 'RltdPties/{}Acct/Id/IBAN'.format(party))),
+                    camt_reference(d),
+                    find_text(d, 'RmtInf/Ustrd', 'AddtlTxInf') or find_text(element, 'AddtlNtryInf'),
+                    debit,
+                )
+            except StatementError as e:
+                yield StatementError('Položka {}: {}'.format(number, e))
+
+        element.clear()
+
+
+def parse(file, name=''):
+    head = file.read(512)
+    file.seek(0)
+    if name.lower().endswith('.xml') or head.lstrip().startswith(b'<'):
+        return parse_camt(file)
+    return parse_csv(file)
+
+
+class Index:
+
+    def __init__(self, transactions):
+        self.full = defaultdict(list)
+        self.reference = defaultdict(list)
+        self.iban = defaultdict(list)
+
+        for pk, iban, ammount, invoice_number in transactions:
+            iban = normalize_iban(iban)
+            reference = normalize_reference(invoice_number)
+            self.full[(iban, ammount, reference)].append(pk)
+            self.reference[(ammount, reference)].append(pk)
+            self.iban[(iban, ammount)].append(pk)
+
+    def match(self, line):
+        if line.reference:
+            if line.iban:
+                pks = self.full.get((line.iban, line.ammount, line.reference), [])
+            else:
+                pks = self.reference.get((line.ammount, line.reference), [])
+            if len(pks) == 1:
+                return pks[0], []
+
+        candidates = set(self.reference.get((line.ammount, line.reference), []))
+        candidates.update(self.iban.get((line.iban, line.ammount), []))
+        return None, sorted(candidates)
+
+
+def waiting_transactions():
+    return Transaction.objects.filter(
+        state='approved',
+        item__isnull=False,
+    ).values_list('pk', 'iban', 'ammount', 'invoice_number')
+
+
+def reconcile(file, name=''):
+    index = Index(waiting_transactions())
+    matched = []
+    unmatched = []
+    errors = []
+    used = set()
+
+    for line in parse(file, name):
+        if isinstance(line, StatementError):
+            errors.append(str(line))
+            continue
+        if not line.debit:
+            continue
+
+        pk, candidates = index.match(line)
+        if pk is not None and pk not in used:
+            used.add(pk)
+            matched.append((line, pk))
+        else:
+            unmatched.append((line, candidates if pk is None else [pk]))
+
+    return Result(matched, unmatched, errors)
+
+
+def pay(matches, user=None):
+    dates = {pk: date for pk, date in matches}
+    if not dates:
+        return transitions.Result([], [])
+
+    with atomic():
+        items = list(Item.objects.select_for_update().filter(
+            transaction__in=dates,
+            transaction__state='approved',
+        ))
+        for i in items:
+            i.date_payed = dates[i.transaction_id]
+            i.created_by = user
+
+        Item.objects.bulk_update(items, ['date_payed', 'created_by'])
+        result = transitions.apply('pay', [i.transaction_id for i in items])
+
+    changed = set(result.changed)
+    return transitions.Result(
+        result.changed,
+        [pk for pk in dates if pk not in changed],
+    )
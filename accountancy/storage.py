@@ -0,0 +1,106 @@
+import hashlib
+import os
+import re
+from tempfile import NamedTemporaryFile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+from django.urls import reverse
+
+'''
+Content addressed storage of invoices. Uploads are hashed (SHA-256) while
+they are written to a temporary file and stored under their digest:
+
+invoices/ab/ab12...ef.pdf
+
+so the same invoice uploaded twice is stored once. An existing file is
+written again, its modification time marks the latest upload, which keeps
+it from being released while that upload is not committed yet (see
+accountancy.invoices). The digest of every
+transaction's file is kept in Transaction.invoice_hash (see HashedFileField),
+which also serves as the reference count: a file is deleted only when the
+last transaction pointing to it is deleted or gets another invoice (see
+accountancy.invoices). The digest of the uploaded file is kept as well
+(original_hash_field), it stays the same when the stored file is replaced
+by a recompressed one and is used to find duplicate uploads.
+'''
+
+DIGEST = re.compile(r'^[0-9a-f]{64}$')
+
+
+def digest(name):
+    if not name:
+        return ''
+    digest = os.path.splitext(os.path.basename(name))[0]
+    return digest if DIGEST.match(digest) else ''
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def __init__(self, *args, url_name=None, **kwargs):
+        self.url_name = url_name
+        super().__init__(*args, **kwargs)
+
+    def url(self, name):
+        if self.url_name:
+            return reverse(self.url_name, kwargs={'name': name})
+        return super().url(name)
+
+    def digest_name(self, name, digest):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(directory, digest[:2], digest + extension)
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        directory = os.path.dirname(self.path(name))
+        os.makedirs(directory, exist_ok=True)
+
+        sha256 = hashlib.sha256()
+        with NamedTemporaryFile(dir=directory, prefix='.upload-', delete=False) as temporary:
+            try:
+                for chunk in content.chunks():
+                    sha256.update(chunk)
+                    temporary.write(chunk)
+            except BaseException:
+                os.remove(temporary.name)
+                raise
+
+        name = self.digest_name(name, sha256.hexdigest())
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(temporary.name, self.file_permissions_mode)
+        file_move_safe(temporary.name, path, allow_overwrite=True)
+
+        return name.replace('\\', '/')
+
+
+class HashedFileField(models.FileField):
+
+    def __init__(self, *args, hash_field=None, original_hash_field=None, **kwargs):
+        self.hash_field = hash_field
+        self.original_hash_field = original_hash_field
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['hash_field'] = self.hash_field
+        kwargs['original_hash_field'] = self.original_hash_field
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        current = getattr(model_instance, self.attname)
+        uploaded = bool(current) and not current._committed
+
+        file = super().pre_save(model_instance, add)
+        if self.hash_field:
+            setattr(model_instance, self.hash_field, digest(file.name))
+        if self.original_hash_field and (
+            uploaded or not file or not getattr(model_instance, self.original_hash_field)
+        ):
+            setattr(model_instance, self.original_hash_field, digest(file.name))
+        return file
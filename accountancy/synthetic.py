@@ -0,0 +1,222 @@
+import random
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections
+from django.utils import timezone
+
+from app.caching import bump_version
+from finances import ledger
+from finances.models import TransactionType, ExtraExpense
+from .models import Transaction, Approval, Item
+from . import search
+
+'''
+Deterministic synthetic data for benchmarks. The same seed and size always
+produce the same rows, inserted with bulk_create in chunks:
+
+with throwaway_database():
+    generate(transactions=1000000, invoices=100)
+
+With invoices > 0 that many small one page PDF files are written to the
+storage and assigned to the transactions in turn, otherwise all of them
+point to one placeholder path.
+'''
+
+BATCH_SIZE = 5000
+
+TRANSACTION_STATES = (
+    ('created', 5),
+    ('approved', 5),
+    ('disapproved', 5),
+    ('payed', 15),
+    ('public', 70),
+)
+
+EXTRA_STATES = ('allocated', 'borrowed', 'stored', 'payed', 'archived')
+
+
+@contextmanager
+def throwaway_database(alias='default'):
+    connection = connections[alias]
+    old_name = settings.DATABASES[alias]['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+@contextmanager
+def explicit_date_created():
+    field = Transaction._meta.get_field('date_created')
+    field.auto_now = False
+    try:
+        yield
+    finally:
+        field.auto_now = True
+
+
+def chunks(iterable, size=BATCH_SIZE):
+    chunk = []
+    for i in iterable:
+        chunk.append(i)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def next_pk(model):
+    last = model.objects.order_by('-pk').values_list('pk', flat=True).first()
+    return (last or 0) + 1
+
+
+def weighted_state(rng):
+    n = rng.randrange(sum(weight for state, weight in TRANSACTION_STATES))
+    for state, weight in TRANSACTION_STATES:
+        if n < weight:
+            return state
+        n -= weight
+
+
+def generate_types(rng, types_per_section):
+    TransactionType.objects.bulk_create([
+        TransactionType(
+            section=section[0],
+            name='{} {}'.format(section[1], i),
+            ammount=Decimal(rng.randrange(1000, 50000)),
+        )
+        for section in settings.SECTIONS
+        for i in range(types_per_section)
+    ])
+    return list(TransactionType.objects.values_list('pk', 'section'))
+
+
+def dummy_pdf(number):
+    text = 'Synthetic invoice {}'.format(number).encode()
+    stream = b'BT /F1 12 Tf 72 720 Td (' + text + b') Tj ET'
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R '
+        b'/Resources << /Font << /F1 5 0 R >> >> >>',
+        b'<< /Length ' + str(len(stream)).encode() + b' >>\nstream\n' + stream + b'\nendstream',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+
+    pdf = b'%PDF-1.4\n'
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += str(i).encode() + b' 0 obj\n' + body + b'\nendobj\n'
+    xref = len(pdf)
+    pdf += b'xref\n0 ' + str(len(objects) + 1).encode() + b'\n0000000000 65535 f \n'
+    for offset in offsets:
+        pdf += '{:010d} 00000 n \n'.format(offset).encode()
+    pdf += b'trailer\n<< /Size ' + str(len(objects) + 1).encode() + b' /Root 1 0 R >>\n'
+    pdf += b'startxref\n' + str(xref).encode() + b'\n%%EOF\n'
+    return pdf
+
+
+def generate_invoices(count):
+    storage = Transaction._meta.get_field('invoice').storage
+    return [
+        storage.save('invoices/synthetic.pdf', ContentFile(dummy_pdf(i)))
+        for i in range(count)
+    ]
+
+
+def generate_transactions(rng, types, count, years, invoices):
+    start = date(timezone.localdate().year - years + 1, 1, 1)
+    days = (timezone.localdate() - start).days + 1
+    pk = next_pk(Transaction)
+    approval_pk = next_pk(Approval)
+
+    def rows():
+        for i in range(count):
+            transaction_type, section = rng.choice(types)
+            created = start + timedelta(days=rng.randrange(days))
+            yield (
+                pk + i,
+                approval_pk + i,
+                transaction_type,
+                section,
+                weighted_state(rng),
+                created,
+                Decimal(rng.randrange(100, 100000)) / 100,
+            )
+
+    with explicit_date_created():
+        for chunk in chunks(rows()):
+            Transaction.objects.bulk_create([
+                Transaction(
+                    pk=t_pk,
+                    date_created=timezone.make_aware(datetime.combine(created, datetime.min.time())),
+                    state=state,
+                    ammount=ammount,
+                    section=section,
+                    description='Synthetic transaction {}'.format(t_pk),
+                    iban='SK3112000000198742637541',
+                    provider='Provider {}'.format(t_pk % 997),
+                    business_id='{:08d}'.format(t_pk % 99999999),
+                    invoice_number='{}/{}'.format(created.year, t_pk),
+                    invoice=invoices[t_pk % len(invoices)],
+                )
+                for t_pk, a_pk, transaction_type, section, state, created, ammount in chunk
+            ])
+            Approval.objects.bulk_create([
+                Approval(
+                    pk=a_pk,
+                    transaction_id=t_pk,
+                    transaction_type_id=transaction_type,
+                )
+                for t_pk, a_pk, transaction_type, section, state, created, ammount in chunk
+            ])
+            Item.objects.bulk_create([
+                Item(
+                    transaction_id=t_pk,
+                    approval_id=a_pk,
+                    date_payed=created + timedelta(days=rng.randrange(30)) if state in ('payed', 'public') else None,
+                )
+                for t_pk, a_pk, transaction_type, section, state, created, ammount in chunk
+                if state in ('approved', 'payed', 'public')
+            ])
+
+
+def generate_extras(rng, types, count, years):
+    first = timezone.localdate().year - years + 1
+
+    def rows():
+        for i in range(count):
+            transaction_type, section = rng.choice(types)
+            yield ExtraExpense(
+                transaction_type_id=transaction_type,
+                section=section,
+                state=rng.choice(EXTRA_STATES),
+                ammount=Decimal(rng.randrange(100, 100000)) / 100,
+                purpose='Synthetic expense {}'.format(i),
+                year=first + rng.randrange(years),
+            )
+
+    for chunk in chunks(rows()):
+        ExtraExpense.objects.bulk_create(chunk)
+
+
+def generate(transactions=1000, types_per_section=20, extras=None, years=3, seed=0,
+             invoices=0):
+    rng = random.Random(seed)
+    if extras is None:
+        extras = max(transactions // 100, 1)
+
+    types = generate_types(rng, types_per_section)
+    invoice_names = generate_invoices(invoices) or ['invoices/synthetic.pdf']
+    generate_transactions(rng, types, transactions, years, invoice_names)
+    generate_extras(rng, types, extras, years)
+    ledger.rebuild()
+    search.rebuild()
+    bump_version('diary', 'balance')
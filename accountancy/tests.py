@@ -1,3 +1,1130 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import sqlite3
+import zlib
+import tempfile
+import time
+import zipfile
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accountancy import (
+    benchmark, intake, invoices, pdf, processing, registry, search, statements, synthetic, transitions,
+    validators,
+)
+from accountancy.models import Transaction, Approval, Item, TransactionChange, InvoiceJob
+from accountancy.views import DiaryView
+from finances import closing
+from finances.balance import get_balance
+from finances.models import TransactionType
+from mailing.models import Email
+
+
+def create_transaction(transaction_type, state, ammount=Decimal('10.00'), user=None):
+    t = Transaction.objects.create(
+        created_by=user,
+        state=state,
+        ammount=ammount,
+        section=transaction_type.section,
+        description='test',
+        iban='SK3112000000198742637541',
+        provider='test',
+        business_id='12345678',
+        invoice_number='1',
+        invoice='invoices/test.pdf',
+    )
+    a = Approval.objects.create(transaction=t, transaction_type=transaction_type)
+    if state != 'created':
+        Item.objects.create(transaction=t, approval=a)
+    return t
+
+
+class ChangelistQueriesTest(TestCase):
+
+    changelists = [
+        ('/admin/accountancy/transaction/?state__exact={}', 'created'),
+        ('/admin/accountancy/approval/?transaction__state__exact={}', 'created'),
+        ('/admin/accountancy/item/?transaction__state__exact={}', 'approved'),
+    ]
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_login(self.user)
+
+    def populate(self, count):
+        for i in range(count):
+            transaction_type = TransactionType.objects.create(section='ultimate', name=str(i))
+            for state in ('created', 'approved'):
+                create_transaction(transaction_type, state, user=self.user)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_constant_query_count(self):
+        for url, state in self.changelists:
+            url = url.format(state)
+            self.populate(2)
+            small = self.count_queries(url)
+            self.populate(20)
+            self.assertEqual(self.count_queries(url), small, url)
+
+
+@override_settings(EMAIL_QUEUE=True)
+class TransitionsTest(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('user', 'user@example.com')
+        self.type = TransactionType.objects.create(section='ultimate', name='test')
+
+    def populate(self, count):
+        return [create_transaction(self.type, 'created', user=self.user).pk for i in range(count)]
+
+    def apply(self, name, pks):
+        with CaptureQueriesContext(connection) as context:
+            result = transitions.apply(name, pks)
+        return result, len(context)
+
+    def test_workflow(self):
+        pks = self.populate(3)
+        uncategorized = create_transaction(self.type, 'created', user=self.user)
+        Approval.objects.filter(transaction=uncategorized).update(transaction_type=None)
+
+        result, queries = self.apply('approve', pks + [uncategorized.pk])
+        self.assertEqual(result.changed, pks)
+        self.assertEqual(result.rejected, [uncategorized.pk])
+        self.assertEqual(Item.objects.filter(transaction__in=pks).count(), 3)
+
+        Item.objects.update(date_payed='2020-03-01')
+        self.assertEqual(self.apply('pay', pks)[0].changed, pks)
+        self.assertEqual(get_balance()[1]['types'][0]['spent'], Decimal('30.00'))
+        self.assertEqual(set(Transaction.objects.filter(pk__in=pks).values_list('state', flat=True)), {'public'})
+
+        result = self.apply('make_public', pks)[0]
+        self.assertEqual(result.rejected, pks)
+
+        self.apply('make_privat', pks[:1])
+        self.assertEqual(Transaction.objects.get(pk=pks[0]).state, 'payed')
+        self.assertEqual(get_balance()[1]['types'][0]['spent'], Decimal('30.00'))
+
+    def test_constant_query_count(self):
+        small = self.apply('approve', self.populate(2))[1]
+        self.assertEqual(self.apply('approve', self.populate(20))[1], small)
+
+        Item.objects.update(date_payed='2020-03-01')
+        pks = list(Transaction.objects.filter(state='approved').values_list('pk', flat=True))
+        self.apply('pay', pks[:1])
+        small = self.apply('pay', pks[1:3])[1]
+        self.assertEqual(self.apply('pay', pks[3:])[1], small)
+
+    def test_notifications_are_batched(self):
+        self.apply('approve', self.populate(5))
+        self.assertEqual(Email.objects.count(), 2)
+
+    def test_model_methods(self):
+        t = create_transaction(self.type, 'created', user=self.user)
+        with self.assertRaises(transitions.TransitionError):
+            t.pay()
+        self.assertEqual(t.state, 'created')
+
+        t.approve()
+        self.assertEqual(t.state, 'approved')
+        t.item.disapprove()
+        self.assertEqual(Transaction.objects.get(pk=t.pk).state, 'created')
+        self.assertFalse(Item.objects.filter(transaction=t).exists())
+
+    def test_signal(self):
+        received = []
+
+        def receiver(sender, transaction, name, old_state, new_state, **kwargs):
+            received.append((transaction, name, old_state, new_state))
+
+        transitions.transitioned.connect(receiver)
+        self.addCleanup(transitions.transitioned.disconnect, receiver)
+
+        pks = self.populate(2)
+        self.apply('disapprove', pks)
+        self.assertEqual(received, [(pk, 'disapprove', 'created', 'disapproved') for pk in pks])
+
+    def test_concurrent_change(self):
+        pks = self.populate(2)
+        Transaction.objects.filter(pk=pks[1]).update(state='approved')
+
+        # both rows were read as 'created', the second one changed since
+        with mock.patch.object(transitions, 'allowed', return_value=[(pk, 'created') for pk in pks]):
+            with self.assertRaises(transitions.ConcurrentTransition):
+                transitions.apply('approve', pks)
+
+        self.assertEqual(Transaction.objects.get(pk=pks[0]).state, 'created')
+        self.assertFalse(Item.objects.exists())
+        self.assertFalse(TransactionChange.objects.filter(event='approve').exists())
+
+
+class ExportTest(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_login(self.user)
+        self.type = TransactionType.objects.create(section='ultimate', name='test')
+
+    def populate(self, count):
+        for i in range(count):
+            create_transaction(self.type, 'public')
+        Item.objects.update(date_payed='2020-03-01')
+
+    def export(self, action):
+        pks = list(Item.objects.values_list('pk', flat=True))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                '/admin/accountancy/item/?transaction__state__exact=public',
+                {'action': action, '_selected_action': pks},
+            )
+            content = b''.join(response.streaming_content).decode()
+        return content, len(context)
+
+    def test_full_csv(self):
+        self.populate(2)
+        content, small = self.export('export_full_csv')
+        lines = content.splitlines()
+        self.assertEqual(lines[0], 'EXČ,Dátum,Popis,IČO,Dodávateľ,Suma')
+        self.assertEqual(lines[1], '1,2020-03-01,test,12345678,test,10.00')
+
+        self.populate(20)
+        content, queries = self.export('export_full_csv')
+        self.assertEqual(len(content.splitlines()), 23)
+        self.assertEqual(queries, small)
+
+    def test_model_csv(self):
+        self.populate(2)
+        small = self.export('export_as_csv')[1]
+        self.populate(20)
+        content, queries = self.export('export_as_csv')
+        self.assertEqual(len(content.splitlines()), 23)
+        self.assertEqual(queries, small)
+
+    def test_command(self):
+        self.populate(3)
+        create_transaction(self.type, 'approved')
+        output = StringIO()
+        call_command('export_invoicing', year=2020, stdout=output)
+        self.assertEqual(len(output.getvalue().splitlines()), 4)
+
+
+class InvoicesZipTest(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media)
+        self.settings.enable()
+        self.addCleanup(shutil.rmtree, self.media)
+        self.addCleanup(self.settings.disable)
+
+        self.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_login(self.user)
+        self.transaction = create_transaction(TransactionType.objects.create(section='ultimate', name='test'), 'public')
+        create_transaction(TransactionType.objects.create(section='ultimate', name='test'), 'public')
+        Transaction.objects.exclude(pk=self.transaction.pk).update(invoice='invoices/missing.pdf')
+        Item.objects.update(date_payed='2020-03-01')
+        default_storage.save('invoices/test.pdf', ContentFile(b'%PDF-1.4' + b'x' * 200000))
+
+    def test_action(self):
+        pks = list(Item.objects.values_list('pk', flat=True))
+        response = self.client.post(
+            '/admin/accountancy/item/?transaction__state__exact=public',
+            {'action': 'export_invoices', '_selected_action': pks},
+        )
+        archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+
+        self.assertEqual(archive.namelist(), ['faktury/{}_test.pdf'.format(self.transaction.pk), 'manifest.csv'])
+        self.assertEqual(len(archive.read(archive.namelist()[0])), 200008)
+        manifest = archive.read('manifest.csv').decode().splitlines()
+        self.assertEqual(len(manifest), 3)
+        self.assertTrue(manifest[1].endswith('test.pdf'))
+        self.assertTrue(manifest[2].endswith('10.00,'))
+
+    def test_command(self):
+        path = '{}/invoices.zip'.format(self.media)
+        call_command('export_invoices', path, year=2020)
+        self.assertEqual(len(zipfile.ZipFile(path).namelist()), 2)
+
+
+class DiaryTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.type = TransactionType.objects.create(section='ultimate', name='test')
+
+    def populate(self, count):
+        pks = [create_transaction(self.type, 'public').pk for i in range(count)]
+        for i, pk in enumerate(pks):
+            Item.objects.filter(transaction=pk).update(date_payed='2020-03-{:02d}'.format(i % 3 + 1))
+        return pks
+
+    def pages(self, size):
+        pks, url = [], '/?page_size={}'.format(size)
+        while url:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertLessEqual(len(context), 2)
+            page = response.context['page_obj']
+            pks.extend(t.pk for t in page)
+            url = '/?page_size={}&after={}'.format(size, page.next_cursor) if page.has_next else None
+        return pks
+
+    def test_keyset_pagination(self):
+        pks = self.populate(10)
+        create_transaction(self.type, 'approved')
+        no_date = create_transaction(self.type, 'public')
+
+        expected = list(Transaction.objects.filter(state='public').order_by(
+            '-item__date_payed', '-pk',
+        ).values_list('pk', flat=True))
+        expected = [pk for pk in expected if pk != no_date.pk] + [no_date.pk]
+        self.assertEqual(self.pages(3), expected)
+        self.assertEqual(self.pages(100), expected)
+
+    def test_page_size_cap(self):
+        self.populate(3)
+        response = self.client.get('/?page_size=100000')
+        self.assertEqual(response.context['page_obj'].size, DiaryView.max_paginate_by)
+        self.assertEqual(self.client.get('/?after=garbage').status_code, 404)
+
+    def test_closed_year(self):
+        paid = self.populate(1)[0]
+        no_date = create_transaction(self.type, 'public')
+        Transaction.objects.filter(pk=no_date.pk).update(date_created=datetime(2020, 5, 1, tzinfo=timezone.utc))
+        closing.close_year(2020)
+
+        self.assertEqual(list(self.client.get('/').context['object_list']), [])
+        self.assertEqual(
+            sorted(t.pk for t in self.client.get('/?year=2020').context['object_list']),
+            sorted([paid, no_date.pk]),
+        )
+
+
+class CachingTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.type = TransactionType.objects.create(section='ultimate', name='test')
+        self.transaction = create_transaction(self.type, 'public')
+
+    def test_conditional_get(self):
+        for url in ('/', '/finances/balance/'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.has_header('Last-Modified'))
+
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(len(context), 0)
+            self.assertEqual(response['Vary'], 'Cookie')
+            self.assertIn('private', response['Cache-Control'])
+
+    def test_invalidation(self):
+        etag = self.client.get('/')['ETag']
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get('/')['ETag'], etag)
+        self.assertEqual(len(context), 0)
+
+        self.transaction.description = 'zmena'
+        self.transaction.save()
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        transitions.apply('make_privat', [self.transaction.pk])
+        self.assertNotEqual(self.client.get('/')['ETag'], etag)
+
+    def test_authenticated_variant(self):
+        anonymous = self.client.get('/')
+        user = get_user_model().objects.create_user('user', 'user@example.com')
+        self.client.force_login(user)
+        authenticated = self.client.get('/')
+
+        self.assertNotEqual(anonymous['ETag'], authenticated['ETag'])
+        self.assertNotIn(b'Zobraz', anonymous.content)
+        self.assertIn(b'Zobraz', authenticated.content)
+
+
+class TransactionsApiTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.type = TransactionType.objects.create(section='ultimate', name='test')
+        for i in range(5):
+            create_transaction(self.type, 'public')
+        create_transaction(self.type, 'created')
+        Item.objects.update(date_payed='2020-03-01')
+
+    def fetch_all(self, url):
+        results = []
+        while url:
+            with CaptureQueriesContext(connection) as context:
+                data = self.client.get(url).json()
+            self.assertLessEqual(len(context), 3)
+            results.extend(data['results'])
+            url = data['next']
+        return results
+
+    def test_cursor_pagination(self):
+        results = self.fetch_all('/api/transactions/?page_size=2')
+        self.assertEqual(len(results), 5)
+        self.assertEqual(results[0], {
+            'id': 5,
+            'date_payed': '2020-03-01',
+            'ammount': '10.00',
+            'section': 'ultimate',
+            'transaction_type': 'test',
+        })
+
+    def test_fields_and_filters(self):
+        data = self.client.get('/api/transactions/?fields=id,ammount&date_from=2020-03-02').json()
+        self.assertEqual(data['results'], [])
+
+        response = self.client.get('/api/transactions/?fields=description')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/transactions/?section=x').status_code, 400)
+
+        user = get_user_model().objects.create_user('user', 'user@example.com')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get('/api/transactions/?fields=id,state').status_code, 400)
+        data = self.client.get('/api/transactions/?state=created&page_size=10').json()
+        self.assertEqual(len(data['results']), 5)
+        self.assertNotIn(6, [r['id'] for r in data['results']])
+
+        user.user_permissions.add(Permission.objects.get(codename='view_transaction'))
+        self.client.force_login(get_user_model().objects.get(pk=user.pk))
+        data = self.client.get('/api/transactions/?fields=id,state,description&state=created').json()
+        self.assertEqual(data['results'], [{'id': 6, 'state': 'created', 'description': 'test'}])
+
+
+class ChangeFeedTest(TestCase):
+
+    def setUp(self):
+        self.type = TransactionType.objects.create(section='ultimate', name='test')
+        self.user = get_user_model().objects.create_user('user', 'user@example.com')
+
+    def events(self, since=0):
+        return [
+            (c['transaction'], c['event'], c['old_state'], c['new_state'])
+            for c in self.client.get('/api/changes/?since={}'.format(since)).json()['results']
+        ]
+
+    def test_feed(self):
+        t = create_transaction(self.type, 'created')
+        t.approve()
+        Item.objects.get(transaction=t).disapprove()
+        t.approve()
+        transitions.apply('pay', [t.pk])
+
+        self.assertEqual(self.client.get('/api/changes/').status_code, 403)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/api/changes/').status_code, 403)
+        self.user.user_permissions.add(Permission.objects.get(codename='view_transaction'))
+        self.client.force_login(get_user_model().objects.get(pk=self.user.pk))
+
+        self.assertEqual(self.events(), [
+            (t.pk, 'create', '', 'created'),
+            (t.pk, 'approve', 'created', 'approved'),
+            (t.pk, 'return_to_approval', 'approved', 'created'),
+            (t.pk, 'approve', 'created', 'approved'),
+            (t.pk, 'pay', 'approved', 'public'),
+        ])
+
+        last = TransactionChange.objects.order_by('pk').values_list('pk', flat=True)[3]
+        data = self.client.get('/api/changes/?since={}'.format(last)).json()
+        self.assertEqual(len(data['results']), 1)
+        self.assertEqual(data['next_since'], data['results'][0]['seq'])
+        self.assertEqual(self.client.get('/api/changes/?since=x').status_code, 400)
+
+    def test_command(self):
+        t = create_transaction(self.type, 'created')
+        t.delete()
+
+        out = StringIO()
+        call_command('transaction_changes', '--since=0', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('"event": "delete"', lines[1])
+
+
+@override_settings(EMAIL_QUEUE=True)
+class StatementTest(TestCase):
+
+    csv = (
+        'Dátum;Suma;IBAN protiúčtu;Variabilný symbol;Popis\n'
+        '02.03.2020;-10,00;SK31 1200 0000 1987 4263 7541;20200015;Faktúra A\n'
+        '03.03.2020;-20,00;SK0809000000000123123123;7;Faktúra B\n'
+        '04.03.2020;-99,00;;;Neznáma platba\n'
+        'x;-1,00;;;Chyba\n'
+        '05.03.2020;10,00;SK31 1200 0000 1987 4263 7541;20200015;Vrátenie\n'
+    )
+
+    camt = '''<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:camt.053.001.02">
+  <BkToCstmrStmt><Stmt><Ntry>
+    <Amt Ccy="EUR">10.00</Amt>
+    <CdtDbtInd>DBIT</CdtDbtInd>
+    <BookgDt><Dt>2020-03-05</Dt></BookgDt>
+    <NtryDtls><TxDtls>
+      <Refs><EndToEndId>/VS20200015/SS/KS0308</EndToEndId></Refs>
+      <RltdPties><CdtrAcct><Id><IBAN>SK3112000000198742637541</IBAN></Id></CdtrAcct></RltdPties>
+    </TxDtls></NtryDtls>
+  </Ntry></Stmt></BkToCstmrStmt>
+</Document>'''
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.type = TransactionType.objects.create(section='ultimate', name='test')
+        self.a = create_transaction(self.type, 'approved')
+        self.b = create_transaction(self.type, 'approved', Decimal('20.00'))
+        self.c = create_transaction(self.type, 'approved', Decimal('20.00'))
+        Transaction.objects.filter(pk=self.a.pk).update(invoice_number='2020/0015')
+        Transaction.objects.filter(pk__in=[self.b.pk, self.c.pk]).update(
+            iban='SK0809000000000123123123',
+            invoice_number='FA-7',
+        )
+
+    def test_reconcile(self):
+        with CaptureQueriesContext(connection) as context:
+            result = statements.reconcile(BytesIO(self.csv.encode()), 'vypis.csv')
+        self.assertEqual(len(context), 1)
+
+        self.assertEqual([(line.number, pk) for line, pk in result.matched], [(2, self.a.pk)])
+        self.assertEqual([pks for line, pks in result.unmatched], [[self.b.pk, self.c.pk], []])
+        self.assertEqual(len(result.errors), 1)
+
+        result = statements.reconcile(BytesIO(self.camt.encode()))
+        line, pk = result.matched[0]
+        self.assertEqual((pk, str(line.date)), (self.a.pk, '2020-03-05'))
+
+        credit = self.camt.replace('DBIT', 'CRDT').replace('CdtrAcct', 'DbtrAcct')
+        result = statements.reconcile(BytesIO(credit.encode()))
+        self.assertEqual((result.matched, result.unmatched), ([], []))
+
+    def test_admin(self):
+        self.client.force_login(self.user)
+        statement = BytesIO(self.csv.encode())
+        statement.name = 'vypis.csv'
+        response = self.client.post('/admin/accountancy/item/import-statement/', {
+            'statement': statement,
+            'pay_matched': 'on',
+        })
+        self.assertEqual(len(response.context['unmatched']), 2)
+
+        a = Transaction.objects.get(pk=self.a.pk)
+        self.assertEqual((a.state, str(a.item.date_payed)), ('public', '2020-03-02'))
+
+        self.client.post('/admin/accountancy/item/import-statement/', {
+            'confirm': '1',
+            'pay': ['{}:2020-03-03'.format(self.c.pk), 'x:y', '{}'.format(self.b.pk)],
+        })
+        self.assertEqual(
+            list(Transaction.objects.filter(state='public').order_by('pk').values_list('pk', flat=True)),
+            [self.a.pk, self.c.pk],
+        )
+        self.assertEqual(get_balance()[1]['types'][0]['spent'], Decimal('30.00'))
+
+
+class IntakeTest(TestCase):
+
+    header = 'Suma;Sekcia;Popis;IBAN;Dodávateľ;IČO;Číslo faktúry;Faktúra\n'
+    row = '{};ultimate;Cestovné;SK3112000000198742637541;Dodávateľ;12345679;{};{}\n'
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media)
+        self.settings.enable()
+        self.addCleanup(shutil.rmtree, self.media)
+        self.addCleanup(self.settings.disable)
+
+        self.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+
+        self.invoices = BytesIO()
+        with zipfile.ZipFile(self.invoices, 'w') as archive:
+            for i in range(3):
+                archive.writestr('faktury/{}.pdf'.format(i), b'%PDF-1.4')
+            archive.writestr('faktury/obrazok.png', b'png')
+
+    def sheet(self, rows):
+        sheet = BytesIO((self.header + ''.join(rows)).encode())
+        sheet.name = 'prevody.csv'
+        self.invoices.seek(0)
+        self.invoices.name = 'faktury.zip'
+        return sheet
+
+    def test_import(self):
+        sheet = self.sheet(self.row.format('1{},50'.format(i), i, '{}.pdf'.format(i)) for i in range(3))
+        result = intake.import_transactions(sheet, sheet.name, self.invoices, self.user)
+
+        self.assertEqual(result, intake.Result(3, []))
+        transactions = Transaction.objects.order_by('pk')
+        self.assertEqual([t.ammount for t in transactions], [Decimal('10.50'), Decimal('11.50'), Decimal('12.50')])
+        self.assertEqual(default_storage.open(transactions[0].invoice.name).read(), b'%PDF-1.4')
+        self.assertEqual(TransactionChange.objects.filter(event='create').count(), 3)
+
+    def test_same_invoice_as_existing(self):
+        existing = create_transaction(TransactionType.objects.create(section='ultimate', name='test'), 'created')
+        existing.invoice = ContentFile(b'%PDF-1.4', name='faktura.pdf')
+        existing.save()
+
+        sheet = self.sheet(self.row.format('10', i, '{}.pdf'.format(i)) for i in range(3))
+        intake.import_transactions(sheet, sheet.name, self.invoices, self.user)
+
+        created = TransactionChange.objects.filter(event='create').exclude(transaction=existing)
+        self.assertEqual(created.count(), 3)
+        self.assertEqual(TransactionChange.objects.filter(transaction=existing).count(), 2)
+
+    def test_rollback_removes_invoices(self):
+        sheet = self.sheet([self.row.format('10', 1, '0.pdf')])
+        with mock.patch.object(intake.search, 'index', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                intake.import_transactions(sheet, sheet.name, self.invoices, self.user)
+
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual([files for root, directories, files in os.walk(self.media) if files], [])
+
+    def test_errors_are_collected(self):
+        sheet = self.sheet([
+            self.row.format('10', 1, '0.pdf'),
+            self.row.format('x', 2, 'obrazok.png').replace('12345679', '123'),
+            self.row.format('10', 3, 'chyba.pdf').replace('ultimate', 'hokej'),
+        ])
+        result = intake.import_transactions(sheet, sheet.name, self.invoices, self.user)
+
+        self.assertEqual(result.created, 0)
+        self.assertEqual(len(result.errors), 5)
+        self.assertTrue(all(e.startswith('Riadok 3') for e in result.errors[:3]))
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_admin(self):
+        self.client.force_login(self.user)
+        response = self.client.post('/admin/accountancy/transaction/import/', {
+            'sheet': self.sheet([self.row.format('10', 1, '0.pdf')]),
+            'invoices': self.invoices,
+        })
+        self.assertRedirects(response, '/admin/accountancy/transaction/', fetch_redirect_response=False)
+        self.assertEqual(Transaction.objects.get().created_by, self.user)
+
+
+class ValidatorsTest(TestCase):
+
+    def test_iban(self):
+        for iban in ('SK31 1200 0000 1987 4263 7541', 'DE89370400440532013000', 'GB82WEST12345698765432'):
+            validators.validate_iban(iban)
+
+        for iban in ('SK3112000000198742637542', 'SK311200000019874263754', 'GB82WEST1234569876543A', 'X'):
+            with self.assertRaises(ValidationError):
+                validators.validate_iban(iban)
+
+    def test_business_id(self):
+        validators.validate_business_id('12345679')
+        validators.validate_business_id('123456789012')
+        with self.assertRaises(ValidationError):
+            validators.validate_business_id('12345678')
+
+
+class RegistryTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.settings = override_settings(PROVIDER_REGISTRY_INDEX='{}/registry.sqlite3'.format(self.directory))
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        self.addCleanup(registry.cached_provider.cache_clear)
+
+        dataset = BytesIO('ICO;NAZOV\n12345679;Dodávateľ s.r.o.\n35763469;Iná firma a.s.\n'.encode())
+        self.assertEqual(registry.build_index(dataset, registry.index_path()), 2)
+
+    def test_lookup(self):
+        self.assertEqual(registry.lookup_provider('12345679'), 'Dodávateľ s.r.o.')
+        self.assertIsNone(registry.lookup_provider('11111111'))
+        self.assertEqual(
+            registry.lookup_providers(['35763469', '12345679', '11111111']),
+            {'12345679': 'Dodávateľ s.r.o.', '35763469': 'Iná firma a.s.'},
+        )
+
+    def test_miss_is_not_cached(self):
+        self.assertIsNone(registry.lookup_provider('11111111'))
+        with sqlite3.connect(registry.index_path()) as db:
+            db.execute("INSERT INTO provider VALUES ('11111111', 'Nová firma')")
+        self.assertEqual(registry.lookup_provider('11111111'), 'Nová firma')
+
+    def test_replaced_index(self):
+        self.assertEqual(registry.lookup_provider('12345679'), 'Dodávateľ s.r.o.')
+
+        # another process rebuilds the index and moves it over the old one
+        rebuilt = '{}/rebuilt.sqlite3'.format(self.directory)
+        with sqlite3.connect(rebuilt) as db:
+            db.execute('CREATE TABLE provider (business_id TEXT PRIMARY KEY, name TEXT NOT NULL)')
+            db.execute("INSERT INTO provider VALUES ('12345679', 'Premenovaný s.r.o.')")
+        db.close()
+        os.replace(rebuilt, registry.index_path())
+
+        self.assertEqual(registry.lookup_provider('12345679'), 'Premenovaný s.r.o.')
+        self.assertIsNone(registry.lookup_provider('35763469'))
+
+    def test_admin_autofill(self):
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_login(user)
+        invoice = BytesIO(b'%PDF-1.4')
+        invoice.name = 'faktura.pdf'
+        with override_settings(MEDIA_ROOT=self.directory):
+            self.client.post('/admin/accountancy/transaction/add/', {
+                'ammount': '10.00',
+                'iban': 'SK3112000000198742637541',
+                'section': 'ultimate',
+                'description': 'test',
+                'provider': '',
+                'business_id': '12345679',
+                'invoice_number': '1',
+                'invoice': invoice,
+            })
+        self.assertEqual(Transaction.objects.get().provider, 'Dodávateľ s.r.o.')
+
+
+class InstrumentationTest(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        transaction_type = TransactionType.objects.create(section='ultimate', name='test')
+        for i in range(3):
+            create_transaction(transaction_type, 'approved', user=self.user)
+
+    def get(self, url, budget=50):
+        with self.settings(INSTRUMENTATION=True, INSTRUMENTATION_QUERY_BUDGET=budget):
+            client = Client()
+            client.force_login(self.user)
+            return client.get(url)
+
+    def test_server_timing(self):
+        with self.assertLogs('app.instrumentation', 'INFO') as logs:
+            response = self.get('/admin/accountancy/item/')
+
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'^sql;dur=[0-9.]+;desc="\d+ queries", template;dur=[0-9.]+, total;dur=')
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['status'], 200)
+        self.assertIn('accountancy/admin.py', ' '.join(q['origin'] for q in record['slowest']))
+        self.assertEqual(record['repeated']['count'], 1)
+        self.assertLessEqual(len(record['slowest']), 5)
+
+    def test_query_budget(self):
+        with self.assertLogs('app.instrumentation', 'WARNING') as logs:
+            self.get('/admin/accountancy/item/', budget=1)
+        self.assertTrue(logs.output[0].startswith('WARNING:app.instrumentation:Query budget exceeded'))
+
+    def test_disabled(self):
+        self.client.force_login(self.user)
+        self.assertNotIn('Server-Timing', self.client.get('/admin/accountancy/item/'))
+
+
+class BenchmarkTest(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media, INSTRUMENTATION=False)
+        self.settings.enable()
+        self.addCleanup(shutil.rmtree, self.media)
+        self.addCleanup(self.settings.disable)
+
+    def test_measure_all(self):
+        synthetic.generate(transactions=60, types_per_section=2, invoices=2)
+        self.assertEqual(Transaction.objects.count(), 60)
+        self.assertEqual(Transaction.objects.values('invoice').distinct().count(), 2)
+        for t in Transaction.objects.all()[:2]:
+            self.assertTrue(default_storage.exists(t.invoice.name))
+
+        states = dict(Transaction.objects.values_list('pk', 'state'))
+        results = benchmark.measure_all(repeat=1)
+
+        cases = [r['case'] for r in results]
+        self.assertIn('DiaryView', cases)
+        self.assertIn('ItemAdmin.pay', cases)
+        self.assertIn('export_full_csv (all paid items)', cases)
+        self.assertTrue(all(r['queries'] > 0 and r['best_ms'] >= 0 for r in results))
+        self.assertEqual(dict(Transaction.objects.values_list('pk', 'state')), states)
+
+
+class SearchTest(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.type = TransactionType.objects.create(section='ultimate', name='Turnaj')
+        self.travel = create_transaction(self.type, 'approved', ammount=Decimal('12.50'))
+        self.travel.description = 'Cestovné na majstrovstvá'
+        self.travel.invoice_number = 'FA-2020/17'
+        self.travel.save()
+        self.other = create_transaction(self.type, 'created', ammount=Decimal('99.00'))
+
+    def find(self, term, queryset=None, prefix=''):
+        if queryset is None:
+            queryset = Transaction.objects.all()
+        return sorted(search.filter_transactions(queryset, term, prefix).values_list(
+            prefix + 'pk' if prefix else 'pk', flat=True,
+        ))
+
+    def test_words(self):
+        self.assertEqual(self.find('cestovne'), [self.travel.pk])
+        self.assertEqual(self.find('MAJSTR cest'), [self.travel.pk])
+        self.assertEqual(self.find('FA-2020/17'), [self.travel.pk])
+        self.assertEqual(self.find('turnaj'), [self.travel.pk, self.other.pk])
+        self.assertEqual(self.find('test'), [self.travel.pk, self.other.pk])
+        self.assertEqual(self.find('hotel'), [])
+        self.assertEqual(self.find('   '), [self.travel.pk, self.other.pk])
+
+    def test_numbers(self):
+        self.assertEqual(self.find(str(self.other.pk)), [self.other.pk])
+        self.assertEqual(self.find('12,50'), [self.travel.pk])
+        self.assertEqual(self.find('99'), [self.other.pk])
+        self.assertEqual(self.find('17'), [self.travel.pk])
+        self.assertEqual(self.find('12345678'), [self.travel.pk, self.other.pk])
+        self.assertEqual(self.find('1234567'), [])
+
+    def test_index_follows_changes(self):
+        self.other.description = 'Hotel'
+        self.other.save()
+        self.assertEqual(self.find('hotel'), [self.other.pk])
+
+        self.type.name = 'Sústredenie'
+        self.type.save()
+        self.assertEqual(self.find('sustredenie'), [self.travel.pk, self.other.pk])
+
+        Approval.objects.get(transaction=self.other).delete()
+        self.assertEqual(self.find('sustredenie'), [self.travel.pk])
+
+        pk = self.other.pk
+        self.other.delete()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT rowid FROM accountancy_search WHERE rowid = %s', [pk])
+            self.assertIsNone(cursor.fetchone())
+
+    def test_rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM accountancy_search')
+        self.assertEqual(self.find('cestovne'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.find('cestovne'), [self.travel.pk])
+
+    def test_admin(self):
+        self.assertEqual(self.find('cestovne', Item.objects.all(), 'transaction__'), [self.travel.pk])
+
+        self.client.force_login(self.user)
+        for url, state in ChangelistQueriesTest.changelists:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url.format('approved') + '&q=cestovne')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['cl'].result_count, 1)
+            sql = ' '.join(q['sql'] for q in context.captured_queries)
+            self.assertIn('MATCH', sql)
+            self.assertNotIn('LIKE', sql)
+
+
+class InvoiceStorageTest(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media)
+        self.settings.enable()
+        self.addCleanup(shutil.rmtree, self.media)
+        self.addCleanup(self.settings.disable)
+
+        self.type = TransactionType.objects.create(section='ultimate', name='test')
+        self.storage = Transaction._meta.get_field('invoice').storage
+
+    def upload(self, content, state='created', **kwargs):
+        t = create_transaction(self.type, state)
+        for name, value in kwargs.items():
+            setattr(t, name, value)
+        t.invoice = ContentFile(content, name='faktura.pdf')
+        t.save()
+        return t
+
+    def test_stored_once(self):
+        first = self.upload(b'%PDF-1.4 first', invoice_number='1')
+        second = self.upload(b'%PDF-1.4 first', invoice_number='2')
+        other = self.upload(b'%PDF-1.4 other', invoice_number='3')
+
+        self.assertEqual(first.invoice.name, second.invoice.name)
+        self.assertNotEqual(first.invoice.name, other.invoice.name)
+        self.assertEqual(len(first.invoice_hash), 64)
+        self.assertEqual(first.invoice.name, 'invoices/{}/{}.pdf'.format(first.invoice_hash[:2], first.invoice_hash))
+        self.assertEqual(first.invoice.read(), b'%PDF-1.4 first')
+        self.assertEqual(len(os.listdir(os.path.join(self.media, 'invoices', first.invoice_hash[:2]))), 1)
+        self.assertEqual(
+            [f for f in os.listdir(os.path.join(self.media, 'invoices')) if f.startswith('.')],
+            [],
+        )
+
+    def test_duplicates(self):
+        first = self.upload(b'%PDF-1.4 first', invoice_number='1')
+        same_file = self.upload(b'%PDF-1.4 first', invoice_number='2')
+        same_number = self.upload(b'%PDF-1.4 other', invoice_number='1')
+        self.upload(b'%PDF-1.4 first', state='disapproved', invoice_number='1')
+        self.upload(b'%PDF-1.4 third', invoice_number='1', ammount=Decimal('11.00'))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(list(invoices.duplicates(first)), [same_file, same_number])
+
+    def test_release(self):
+        first = self.upload(b'%PDF-1.4 first')
+        second = self.upload(b'%PDF-1.4 first')
+        name = first.invoice.name
+
+        first.delete()
+        self.assertFalse(invoices.release(name))
+        self.assertTrue(self.storage.exists(name))
+
+        # written recently, another upload of it may not be committed yet
+        second.delete()
+        self.assertFalse(invoices.release(name))
+        self.assertTrue(self.storage.exists(name))
+
+        with override_settings(INVOICE_RELEASE_DELAY=0):
+            self.assertTrue(invoices.release(name))
+        self.assertFalse(self.storage.exists(name))
+
+    def test_sweep(self):
+        kept = self.upload(b'%PDF-1.4 kept')
+        orphan = self.storage.save('invoices/faktura.pdf', ContentFile(b'%PDF-1.4 orphan'))
+        self.assertEqual(invoices.sweep(), 0)
+
+        old = time.time() - 2 * invoices.release_delay()
+        for name in (kept.invoice.name, orphan):
+            os.utime(self.storage.path(name), (old, old))
+
+        out = StringIO()
+        call_command('sweep_invoices', stdout=out)
+        self.assertIn('1', out.getvalue())
+        self.assertTrue(self.storage.exists(kept.invoice.name))
+        self.assertFalse(self.storage.exists(orphan))
+
+    def test_store_invoices(self):
+        legacy = [
+            default_storage.save('invoices/2020/01/a.pdf', ContentFile(b'%PDF-1.4 legacy')),
+            default_storage.save('invoices/2020/02/b.pdf', ContentFile(b'%PDF-1.4 legacy')),
+        ]
+        for name in legacy:
+            create_transaction(self.type, 'created')
+            Transaction.objects.filter(pk=Transaction.objects.latest('pk').pk).update(invoice=name)
+
+        call_command('store_invoices', stdout=StringIO())
+
+        names = set(Transaction.objects.values_list('invoice', 'invoice_hash'))
+        self.assertEqual(len(names), 1)
+        name, invoice_hash = names.pop()
+        self.assertIn(invoice_hash, name)
+        self.assertTrue(self.storage.exists(name))
+        self.assertFalse(any(default_storage.exists(n) for n in legacy))
+
+
+class ProcessingTest(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media)
+        self.settings.enable()
+        self.addCleanup(shutil.rmtree, self.media)
+        self.addCleanup(self.settings.disable)
+
+        self.type = TransactionType.objects.create(section='ultimate', name='test')
+
+    def upload(self, content):
+        t = create_transaction(self.type, 'created')
+        t.invoice = ContentFile(content, name='faktura.pdf')
+        t.save()
+        return t
+
+    def test_enqueued_once(self):
+        first = self.upload(synthetic.dummy_pdf(1))
+        self.upload(synthetic.dummy_pdf(1))
+        first.description = 'iný popis'
+        first.save()
+        self.assertEqual(list(InvoiceJob.objects.values_list('invoice', 'state')), [
+            (first.invoice.name, 'queued'),
+        ])
+
+    def test_process(self):
+        valid = self.upload(synthetic.dummy_pdf(7))
+        invalid = self.upload(b'<html>not a pdf</html>')
+
+        self.assertEqual(processing.process_queued(), (1, 1))
+        self.assertEqual(processing.process_queued(), (0, 0))
+
+        job = InvoiceJob.objects.get(invoice=valid.invoice.name)
+        self.assertEqual((job.state, job.pages, job.attempts), ('done', 1, 1))
+        self.assertEqual(job.text, 'Synthetic invoice 7')
+        self.assertEqual(job.size, valid.invoice.size)
+
+        job = InvoiceJob.objects.get(invoice=invalid.invoice.name)
+        self.assertEqual((job.state, job.last_error), ('invalid', 'Súbor nie je PDF.'))
+
+        self.assertEqual(
+            list(search.filter_transactions(Transaction.objects.all(), 'synthetic invoice')),
+            [valid],
+        )
+
+    def test_retry(self):
+        t = self.upload(synthetic.dummy_pdf(1))
+        os.remove(t.invoice.path)
+
+        self.assertEqual(processing.process_queued(), (0, 1))
+        job = InvoiceJob.objects.get()
+        self.assertEqual((job.state, job.attempts), ('queued', 1))
+        self.assertIn('FileNotFoundError', job.last_error)
+        self.assertGreater(job.next_attempt, timezone.now())
+
+    def test_process_pool(self):
+        t = self.upload(synthetic.dummy_pdf(3))
+        with processing.process_pool(1) as executor:
+            self.assertEqual(processing.process_queued(executor=executor), (1, 0))
+        self.assertEqual(InvoiceJob.objects.get(invoice=t.invoice.name).pages, 1)
+
+    def test_recompressed_duplicate(self):
+        first = self.upload(synthetic.dummy_pdf(4))
+        original = first.invoice_hash
+
+        descriptor, path = tempfile.mkstemp(suffix='.pdf', dir=self.media)
+        with os.fdopen(descriptor, 'wb') as recompressed:
+            recompressed.write(synthetic.dummy_pdf(5))
+        queued = Email.objects.create(subject='test', body='test', from_email='test', attachment=first.invoice.path)
+        etag = self.client.get('/')['ETag']
+        processing.replace_invoice(InvoiceJob.objects.get(), path)
+
+        first.refresh_from_db()
+        self.assertNotEqual(first.invoice_hash, original)
+        self.assertEqual(first.invoice_original_hash, original)
+        self.assertEqual(Email.objects.get(pk=queued.pk).attachment, first.invoice.path)
+        self.assertNotEqual(self.client.get('/')['ETag'], etag)
+
+        second = self.upload(synthetic.dummy_pdf(4))
+        second.invoice_number = '2'
+        self.assertEqual(list(invoices.duplicates(second)), [first])
+
+    def test_broken_pool(self):
+        self.upload(synthetic.dummy_pdf(2))
+        with processing.process_pool(1) as executor:
+            with self.assertRaises(BrokenProcessPool):
+                executor.submit(os._exit, 1).result()
+
+            self.assertEqual(processing.process_queued(executor=executor), (0, 1))
+            self.assertTrue(processing.broken(executor))
+
+        job = InvoiceJob.objects.get()
+        self.assertEqual((job.state, job.attempts), ('queued', 1))
+        self.assertIn('BrokenProcessPool', job.last_error)
+
+    def test_compressed_text(self):
+        stream = zlib.compress(b'BT (Fakt\372ra) Tj [(c. ) -250 (17)] TJ ET')
+        data = b'<< /Length 1 /Filter /FlateDecode >>\nstream\n' + stream + b'\nendstream'
+        self.assertEqual(pdf.simple_text(data), 'Faktúra c.  17')
+
+
+class InvoiceDeliveryTest(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media)
+        self.settings.enable()
+        self.addCleanup(shutil.rmtree, self.media)
+        self.addCleanup(self.settings.disable)
+
+        self.content = synthetic.dummy_pdf(1)
+        self.transaction = create_transaction(TransactionType.objects.create(section='ultimate', name='test'), 'created')
+        self.transaction.invoice = ContentFile(self.content, name='faktura.pdf')
+        self.transaction.save()
+        self.url = self.transaction.invoice.url
+
+        self.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.user = get_user_model().objects.create_user('user', 'user@example.com', 'user')
+
+    def get(self, user=None, **headers):
+        self.client.force_login(user or self.admin)
+        return self.client.get(self.url, **headers)
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_permissions(self):
+        self.assertEqual(self.url, '/files/{}'.format(self.transaction.invoice.name))
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+        self.assertEqual(self.get(self.user).status_code, 403)
+        self.assertEqual(self.client.get('/files/invoices/00/missing.pdf').status_code, 404)
+        self.assertEqual(self.client.get('/media/{}'.format(self.transaction.invoice.name)).status_code, 404)
+
+        self.user.user_permissions.add(Permission.objects.get(codename='change_transaction'))
+        self.assertEqual(self.get(get_user_model().objects.get(pk=self.user.pk)).status_code, 200)
+        self.user.user_permissions.clear()
+
+        Transaction.objects.filter(pk=self.transaction.pk).update(state='public')
+        self.assertEqual(self.get(get_user_model().objects.get(pk=self.user.pk)).status_code, 200)
+
+    def test_file(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['ETag'], '"{}"'.format(self.transaction.invoice_hash))
+
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_ranges(self):
+        size = len(self.content)
+
+        response = self.get(HTTP_RANGE='bytes=0-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), b'%PDF-')
+        self.assertEqual(response['Content-Range'], 'bytes 0-4/{}'.format(size))
+        self.assertEqual(response['Content-Length'], '5')
+
+        response = self.get(HTTP_RANGE='bytes=-6')
+        self.assertEqual(self.body(response), b'%%EOF\n')
+        self.assertEqual(self.body(self.get(HTTP_RANGE='bytes={}-'.format(size - 6))), b'%%EOF\n')
+
+        response = self.get(HTTP_RANGE='bytes={}-'.format(size))
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */{}'.format(size))
+
+        response = self.get(HTTP_RANGE='bytes=0-4', HTTP_IF_RANGE='"other"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+
+    def test_front_end_server(self):
+        with override_settings(INVOICE_DELIVERY='x-accel-redirect'):
+            response = self.get()
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/{}'.format(self.transaction.invoice.name))
+        self.assertEqual(response.content, b'')
+
+        with override_settings(INVOICE_DELIVERY='x-sendfile'):
+            response = self.get()
+        self.assertEqual(response['X-Sendfile'], self.transaction.invoice.path)
+
+    def test_missing_file(self):
+        os.remove(self.transaction.invoice.path)
+        self.assertEqual(self.get().status_code, 404)
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-4').status_code, 404)
@@ -0,0 +1,205 @@
+from collections import namedtuple, defaultdict
+
+from django.db.models import Q
+from django.db.transaction import atomic
+from django.dispatch import Signal
+from django.utils import timezone
+
+from app.caching import bump_version
+from app.emails import mail_batch
+from finances import ledger
+from .models import Transaction, Item, TransactionChange
+
+'''
+Workflow of transactions. Every change of Transaction.state goes through
+apply(), the admin actions, the model methods (Transaction.approve, ...),
+bank statements and the fiscal year close alike:
+
+result = apply('pay', [1, 2, 3])
+result.changed   # pks of transactions moved to the target state
+result.rejected  # pks which are not allowed to make the transition
+
+TRANSITIONS lists the states a transition may start from, its target state
+and an optional guard (a Q object the transaction must match). A transition
+runs in one database transaction: the rows are locked in pk order
+(select_for_update, row locks on PostgreSQL), and every source state is
+changed with one conditional UPDATE ... WHERE state = <expected>. When the
+number of updated rows differs from the number read, somebody else changed
+them in between, the whole transition is rolled back and ConcurrentTransition
+is raised, so a transaction is never paid twice.
+
+Every changed transaction is recorded in the change log (TransactionChange)
+and sent as a `transitioned` signal (sender=Transaction, transaction=pk,
+name, old_state, new_state, by_who) for notifications. Receivers run inside
+the database transaction. The transition's own notifications go out in one
+mail batch.
+'''
+
+Transition = namedtuple('Transition', ['sources', 'target', 'guard', 'touch'])
+Transition.__new__.__defaults__ = (None, True)
+
+TRANSITIONS = {
+    'approve': Transition(['created'], 'approved', Q(approval__transaction_type__isnull=False)),
+    'pay': Transition(['approved'], 'public'),
+    'disapprove': Transition(['created', 'approved'], 'disapproved'),
+    'return_to_approval': Transition(['approved'], 'created'),
+    'make_public': Transition(['payed'], 'public'),
+    'make_privat': Transition(['public'], 'payed'),
+    'close_year': Transition(['public'], 'old', touch=False),
+}
+
+Result = namedtuple('Result', ['changed', 'rejected'])
+
+transitioned = Signal(providing_args=['transaction', 'name', 'old_state', 'new_state', 'by_who'])
+
+
+class TransitionError(Exception):
+    pass
+
+
+class ConcurrentTransition(TransitionError):
+    pass
+
+
+def allowed(name, pks):
+    transition = TRANSITIONS[name]
+    transactions = Transaction.objects.filter(pk__in=pks, state__in=transition.sources)
+    if transition.guard is not None:
+        transactions = transactions.filter(transition.guard)
+    return sorted(transactions.values_list('pk', 'state'))
+
+
+def change_state(name, rows):
+    transition = TRANSITIONS[name]
+    values = {'state': transition.target}
+    if transition.touch:
+        values['date_created'] = timezone.now()
+
+    by_state = defaultdict(list)
+    for pk, state in rows:
+        by_state[state].append(pk)
+
+    for state, pks in by_state.items():
+        transactions = Transaction.objects.filter(pk__in=pks, state=state)
+        if transition.guard is not None:
+            transactions = transactions.filter(transition.guard)
+        if transactions.update(**values) != len(pks):
+            raise ConcurrentTransition(
+                'Transakcie {} medzitým zmenil niekto iný.'.format(', '.join(str(pk) for pk in pks))
+            )
+
+
+def approve(pks, by_who):
+    transactions = Transaction.objects.filter(
+        pk__in=pks,
+    ).select_related('created_by', 'approval')
+    existing = set(Item.objects.filter(
+        transaction__in=pks,
+    ).values_list('transaction', flat=True))
+
+    items = [
+        Item(transaction=t, approval=t.approval)
+        for t in transactions if t.pk not in existing
+    ]
+    Item.objects.bulk_create(items)
+
+    for i in items:
+        i.send_reminder()
+    for t in transactions:
+        t.send_state_info(
+            'Informácia o schválení transakcie ',
+            'schválená finančným manažérom sekcie',
+        )
+
+
+def pay(pks, by_who):
+    transactions = Transaction.objects.filter(
+        pk__in=pks,
+    ).select_related('created_by', 'item')
+
+    for t in transactions:
+        t.send_state_info(
+            'Informácia o zaplatení transakcie ',
+            'zaplatená',
+        )
+        if t.item.date_payed:
+            t.item.send_invoice()
+
+
+def disapprove(pks, by_who):
+    transactions = Transaction.objects.filter(
+        pk__in=pks,
+    ).select_related('created_by')
+
+    for t in transactions:
+        t.send_state_info(
+            'Informácia o zamietnutí transakcie ',
+            'zamietnutá '+by_who,
+        )
+
+
+def return_to_approval(pks, by_who):
+    Item.objects.filter(transaction__in=pks).delete()
+
+    transactions = Transaction.objects.filter(
+        pk__in=pks,
+    ).select_related('approval')
+    for t in transactions:
+        t.approval.send_reminder()
+
+
+EFFECTS = {
+    'approve': approve,
+    'pay': pay,
+    'disapprove': disapprove,
+    'return_to_approval': return_to_approval,
+}
+
+
+def apply(name, pks, by_who=''):
+    target = TRANSITIONS[name].target
+    pks = list(pks)
+
+    with atomic(), mail_batch():
+        list(Transaction.objects.select_for_update().filter(
+            pk__in=pks,
+        ).order_by('pk').values_list('pk', flat=True))
+        rows = allowed(name, pks)
+        changed = [pk for pk, state in rows]
+
+        before = ledger.transaction_entries(changed)
+        change_state(name, rows)
+
+        TransactionChange.record(name, [(pk, state, target) for pk, state in rows])
+        for pk, state in rows:
+            transitioned.send(
+                sender=Transaction,
+                transaction=pk,
+                name=name,
+                old_state=state,
+                new_state=target,
+                by_who=by_who,
+            )
+
+        if name in EFFECTS:
+            EFFECTS[name](changed, by_who)
+
+        after = ledger.transaction_entries(changed)
+        ledger.add(transactions=ledger.difference(before, after))
+
+    if changed:
+        bump_version('diary', 'balance')
+
+    changed_set = set(changed)
+    return Result(changed, [pk for pk in pks if pk not in changed_set])
+
+
+def apply_one(name, transaction, by_who=''):
+    result = apply(name, [transaction.pk], by_who)
+    if result.rejected:
+        raise TransitionError('Transakcia {} nemôže prejsť zo stavu {} ({}).'.format(
+            transaction.pk,
+            Transaction.objects.filter(pk=transaction.pk).values_list('state', flat=True).first(),
+            name,
+        ))
+    transaction.refresh_from_db(fields=['state', 'date_created'])
@@ -1,9 +1,13 @@
 from django.urls import path
 
-from .views import DiaryView
+from .api import TransactionsApi, ChangesApi
+from .views import DiaryView, InvoiceView
 
 app_name = 'accountancy'
 
 urlpatterns = [
     path('', DiaryView.as_view(), name='diary'),
+    path('api/transactions/', TransactionsApi.as_view(), name='api_transactions'),
+    path('api/changes/', ChangesApi.as_view(), name='api_changes'),
+    path('files/<path:name>', InvoiceView.as_view(), name='invoice'),
 ]
@@ -1,15 +1,94 @@
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
 from django.shortcuts import render
-from django.views.generic import ListView
+from django.utils.decorators import method_decorator
+from django.views.generic import ListView, View
 
+from app.caching import cached_view
+from finances.models import ClosedYear
+from accountancy import delivery
 from accountancy.models import *
+from accountancy.pagination import keyset_page
+from accountancy.storage import digest
 
+PUBLIC_STATES = {'public', 'old'}
 
+# the admin lets users with the change permission view transactions too
+VIEW_PERMISSIONS = ('accountancy.view_transaction', 'accountancy.change_transaction')
+
+
+def can_view_transactions(user):
+    return any(user.has_perm(p) for p in VIEW_PERMISSIONS)
+
+
+@method_decorator(cached_view('diary'), name='dispatch')
 class DiaryView(ListView):
 
     model = Transaction
     paginate_by = 100
+    max_paginate_by = 500
+
+    def get_year(self):
+        try:
+            year = int(self.request.GET.get('year', ''))
+        except ValueError:
+            return None
+        if ClosedYear.objects.filter(year=year).exists():
+            return year
+        return None
+
+    def get_queryset(self):
+        self.year = self.get_year()
+        if self.year:
+            transactions = Transaction.objects.filter(
+                paid_in_year(self.year),
+                state='old',
+            )
+        else:
+            transactions = Transaction.objects.filter(state='public')
+
+        return transactions.select_related(
+            'item',
+            'approval__transaction_type',
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['transaction_list'] = Transaction.objects.filter(state='public').order_by('-item__date_payed')
+        context['year'] = self.year
+        context['closed_years'] = ClosedYear.objects.values_list('year', flat=True)
         return context
+
+    def get_paginate_by(self, queryset):
+        try:
+            size = int(self.request.GET.get('page_size', self.paginate_by))
+        except ValueError:
+            size = self.paginate_by
+        return max(1, min(size, self.max_paginate_by))
+
+    def paginate_queryset(self, queryset, page_size):
+        page = keyset_page(
+            queryset,
+            'item__date_payed',
+            self.request.GET.get('after'),
+            page_size,
+        )
+        return (None, page, page.object_list, page.has_next)
+
+
+class InvoiceView(LoginRequiredMixin, View):
+
+    def get(self, request, name):
+        invoice_hash = digest(name)
+        transactions = Transaction.objects.filter(invoice=name)
+        if invoice_hash:
+            transactions = transactions.filter(invoice_hash=invoice_hash)
+
+        states = set(transactions.values_list('state', flat=True))
+        if not states:
+            raise Http404
+        if not (states & PUBLIC_STATES or can_view_transactions(request.user)):
+            raise PermissionDenied
+
+        storage = Transaction._meta.get_field('invoice').storage
+        return delivery.serve(request, storage, name, invoice_hash)
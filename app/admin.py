@@ -11,6 +11,7 @@ class OrderedAdminSite(admin.AdminSite):
             'autentifikácia a autorizácia': 1,
             'financie': 2,
             'účtovníctvo': 3,
+            'pošta': 4,
         }
 
         model_ordering = {
@@ -20,9 +21,12 @@ class OrderedAdminSite(admin.AdminSite):
             'účty': 4,
             'transakčné typy': 5,
             'extra výdavky': 6,
-            'transakcie': 7,
-            'schválenia': 8,
-            'položky': 9,
+            'uzávierky': 7,
+            'transakcie': 8,
+            'schválenia': 9,
+            'položky': 10,
+            'spracovanie faktúr': 11,
+            'e-maily': 12,
         }
 
         app_dict = self._build_app_dict(request)
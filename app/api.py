@@ -0,0 +1,86 @@
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.utils.dateparse import parse_date
+
+'''
+Helpers shared by the read-only JSON endpoints. Rows are serialized
+straight from values() querysets, model instances are never created.
+'''
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class ApiError(Exception):
+    pass
+
+
+def json_response(data, status=200):
+    return JsonResponse(
+        data,
+        status=status,
+        encoder=DjangoJSONEncoder,
+        json_dumps_params={'ensure_ascii': False},
+    )
+
+
+def error_response(error):
+    return json_response({'error': str(error)}, status=400)
+
+
+def get_fields(request, available, default=None):
+    value = request.GET.get('fields')
+    if not value:
+        return list(default or available)
+
+    fields = [f.strip() for f in value.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in available]
+    if unknown:
+        raise ApiError('Neznáme polia: {}'.format(', '.join(unknown)))
+    return fields
+
+
+def get_page_size(request):
+    try:
+        size = int(request.GET.get('page_size', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ApiError('Neplatná veľkosť stránky.')
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def get_int(request, name):
+    value = request.GET.get(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ApiError('Neplatná hodnota parametra {}.'.format(name))
+
+
+def get_date(request, name):
+    value = request.GET.get(name)
+    if not value:
+        return None
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ApiError('Neplatný dátum v parametri {}.'.format(name))
+    return parsed
+
+
+def get_choice(request, name, choices):
+    value = request.GET.get(name)
+    if value and value not in [c[0] for c in choices]:
+        raise ApiError('Neplatná hodnota parametra {}.'.format(name))
+    return value or None
+
+
+def next_url(request, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query['after'] = cursor
+    return request.build_absolute_uri('{}?{}'.format(request.path, query.urlencode()))
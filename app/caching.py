@@ -0,0 +1,124 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+'''
+Versioned caching of the public pages:
+
+@method_decorator(cached_view('diary'), name='dispatch')
+class DiaryView(ListView):
+    ...
+
+Every cached page depends on named versions stored in the cache. Saving or
+deleting a model listed in DEPENDENCIES bumps the versions of the pages
+built from it, which invalidates their cached copies and ETags. Bulk
+updates that bypass signals call bump_version() themselves.
+
+Revalidation uses only the ETag, which differs for anonymous and logged in
+users, or for the groups returned by the variant function of the view. Last-Modified is left out, it has a resolution of one second and
+would be the same for both variants.
+
+The versions must be shared by all server processes, so production should
+use a shared cache backend (see CACHES in local_settings.py.template).
+'''
+
+DEPENDENCIES = {
+    'accountancy.Transaction': ('diary', 'balance'),
+    'accountancy.Approval': ('diary', 'balance'),
+    'accountancy.Item': ('diary', 'balance'),
+    'finances.TransactionType': ('diary', 'balance'),
+    'finances.ExtraExpense': ('balance',),
+    'finances.Budget': ('balance',),
+}
+
+
+def version_key(name):
+    return 'version:{}'.format(name)
+
+
+def get_versions(names):
+    keys = [version_key(name) for name in names]
+    versions = cache.get_many(keys)
+
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        now = time.time()
+        for key in missing:
+            cache.add(key, now, None)
+        versions.update(cache.get_many(missing))
+
+    return [versions.get(key, 0) for key in keys]
+
+
+def bump_version(*names):
+    now = time.time()
+    cache.set_many({version_key(name): now for name in names}, None)
+
+
+def model_changed(sender, **kwargs):
+    bump_version(*DEPENDENCIES[sender._meta.label])
+
+
+for label in DEPENDENCIES:
+    post_save.connect(model_changed, sender=label, dispatch_uid='caching_save_' + label)
+    post_delete.connect(model_changed, sender=label, dispatch_uid='caching_delete_' + label)
+
+
+def user_variant(request):
+    return 'user' if request.user.is_authenticated else 'anonymous'
+
+
+def cached_view(*names, variant=user_variant):
+    timeout = getattr(settings, 'VIEW_CACHE_TIMEOUT', 3600)
+
+    def versions(request):
+        if not hasattr(request, '_cache_versions'):
+            request._cache_versions = get_versions(names)
+        return request._cache_versions
+
+    def etag(request, *args, **kwargs):
+        key = '{}:{}:{}'.format(
+            variant(request),
+            request.get_full_path(),
+            ','.join(str(v) for v in versions(request)),
+        )
+        return hashlib.md5(key.encode()).hexdigest()
+
+    def decorator(view):
+
+        @condition(etag_func=etag)
+        def page(request, *args, **kwargs):
+            key = 'page:{}'.format(etag(request))
+            cached = cache.get(key) if request.method in ('GET', 'HEAD') else None
+
+            if cached is not None:
+                response = HttpResponse(cached['content'], content_type=cached['content_type'])
+            else:
+                response = view(request, *args, **kwargs)
+                if request.method in ('GET', 'HEAD') and response.status_code == 200 and not response.streaming:
+                    if hasattr(response, 'render'):
+                        response.render()
+                    cache.set(key, {
+                        'content': response.content,
+                        'content_type': response['Content-Type'],
+                    }, timeout)
+            return response
+
+        # applied to 304 Not Modified responses as well
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = page(request, *args, **kwargs)
+            patch_vary_headers(response, ('Cookie',))
+            patch_cache_control(response, private=True, max_age=0)
+            return response
+
+        return wrapper
+
+    return decorator
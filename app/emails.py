@@ -1,15 +1,108 @@
+import threading
+from contextlib import contextmanager
+
 from django.conf import settings
 from django.core.exceptions import SuspiciousOperation
-from django.core.mail import EmailMessage
+from django.core.mail import EmailMessage, get_connection
+from django.db.transaction import atomic, on_commit
 from django.template.loader import get_template
 
+from app.instrumentation import timer
+from mailing.outbox import enqueue, enqueue_many
+
 '''
 SendMail(
     ['contact1', 'contact2'],
     'subject'
 ).method(instance)
+
+With EMAIL_QUEUE = True in settings messages are stored in the outbox (see
+mailing.outbox) and sent by `manage.py send_queued_mail`, otherwise they
+are sent directly from the request.
+
+Inside `with mail_batch():` messages are collected and sent together when
+the block ends. Reminders and state changes for the same recipients are
+merged into one digest listing all the transactions. The block runs in one
+database transaction: queued messages are stored in it together with the
+changes that triggered them, messages sent directly go out after it
+commits, and an exception rolls back the changes and drops the messages.
 '''
 
+_local = threading.local()
+
+
+class MailBatch:
+
+    def __init__(self):
+        self.messages = []
+        self.digests = {}
+
+    def add(self, email, attachement=None):
+        self.messages.append(('email', (email, attachement)))
+
+    def add_digestable(self, mail, template, digest, model, obj):
+        key = (tuple(mail.recipients), template, model)
+        if key not in self.digests:
+            self.digests[key] = (mail, digest, [])
+            self.messages.append(('digest', key))
+        self.digests[key][2].append(obj)
+
+    def render(self):
+        for kind, message in self.messages:
+            if kind == 'email':
+                yield message
+                continue
+
+            mail, digest, objects = self.digests[message]
+            recipients, template, model = message
+            if len(objects) == 1:
+                context = {'model': model, 't': objects[0]}
+                yield mail.build_email(get_template(template).render(context)), None
+            else:
+                context = {'model': model, 'transactions': objects}
+                subject = digest['subject'].format(model=model, count=len(objects))
+                yield SendMail(list(recipients), subject).build_email(
+                    get_template(digest['template']).render(context)
+                ), None
+
+    def flush(self):
+        with timer('mail'):
+            self.send_all()
+
+    def send_all(self):
+        messages = list(self.render())
+        if not messages:
+            return
+
+        if getattr(settings, 'EMAIL_QUEUE', False):
+            enqueue_many(messages)
+        else:
+            emails = []
+            for email, attachement in messages:
+                if attachement:
+                    email.attach_file(attachement)
+                emails.append(email)
+            on_commit(lambda: get_connection(fail_silently=False).send_messages(emails))
+
+
+def current_batch():
+    return getattr(_local, 'batch', None)
+
+
+@contextmanager
+def mail_batch():
+    if current_batch() is not None:
+        yield current_batch()
+        return
+
+    _local.batch = MailBatch()
+    try:
+        with atomic():
+            yield _local.batch
+            _local.batch.flush()
+    finally:
+        _local.batch = None
+
 
 class SendMail:
 
@@ -50,17 +143,24 @@ class SendMail:
             self.subject = subject
 
     def send_reminder(self, model, obj):
-        plaintext = get_template('emails/reminder.txt')
+        self.send_digestable('emails/reminder.txt', {
+            'template': 'emails/reminder_digest.txt',
+            'subject': 'Žiadosť o {model} {count} prevodov',
+        }, model, obj)
 
-        context = {
-            'model': model,
-            't': obj,
-        }
+    def change_state(self, model, obj):
+        self.send_digestable('emails/change_state.txt', {
+            'template': 'emails/change_state_digest.txt',
+            'subject': 'Informácia o zmene stavu {count} transakcií',
+        }, model, obj)
 
-        self.send_rendered_email(context, plaintext)
+    def send_digestable(self, template, digest, model, obj):
+        batch = current_batch()
+        if batch is not None:
+            batch.add_digestable(self, template, digest, model, obj)
+            return
 
-    def change_state(self, model, obj):
-        plaintext = get_template('emails/change_state.txt')
+        plaintext = get_template(template)
 
         context = {
             'model': model,
@@ -73,22 +173,31 @@ class SendMail:
         template = get_template('emails/send_invoice.txt')
         content = template.render(context)
 
-        email = EmailMessage(
-            self.subject,
-            content,
-            getattr(settings, 'FROM_EMAIL_NAME', 'info@szf.sk'),
-            self.recipients,
-        )
-        email.attach_file(attachement) 
-        email.send(fail_silently=False)
+        self.send(self.build_email(content), attachement)
 
     def send_rendered_email(self, context, template):
         content = template.render(context)
 
-        email = EmailMessage(
+        self.send(self.build_email(content))
+
+    def build_email(self, content):
+        return EmailMessage(
             self.subject,
             content,
             getattr(settings, 'FROM_EMAIL_NAME', 'info@szf.sk'),
             self.recipients,
         )
-        email.send(fail_silently=False)
+
+    def send(self, email, attachement=None):
+        batch = current_batch()
+        if batch is not None:
+            batch.add(email, attachement)
+            return
+
+        with timer('mail'):
+            if getattr(settings, 'EMAIL_QUEUE', False):
+                enqueue(email, attachement)
+            else:
+                if attachement:
+                    email.attach_file(attachement)
+                email.send(fail_silently=False)
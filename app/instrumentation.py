@@ -0,0 +1,182 @@
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+import traceback
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+'''
+Opt-in per request instrumentation, enabled with INSTRUMENTATION = True
+in settings:
+
+- number and total time of SQL queries, the slowest ones with the line of
+  project code which ran them and the most repeated statement (N+1),
+- time spent rendering the template of a TemplateResponse, including the
+  queries of lazy querysets evaluated in the template,
+- time spent sending or queueing e-mails (SendMail and mail batches).
+
+The numbers are sent in the Server-Timing header, so they are visible in
+the browser developer tools, and logged as one JSON line per request to
+the 'app.instrumentation' logger. Requests with more queries than
+INSTRUMENTATION_QUERY_BUDGET are logged as warnings.
+
+Other code measures its own work with:
+
+with timer('mail'):
+    ...
+'''
+
+logger = logging.getLogger('app.instrumentation')
+
+SLOWEST_QUERIES = 5
+SQL_PREVIEW_LENGTH = 300
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_local = threading.local()
+
+
+class Stats:
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0
+        self.slowest = []
+        self.statements = Counter()
+        self.timers = Counter()
+
+    def add_query(self, sql, duration):
+        self.queries += 1
+        self.sql_time += duration
+        self.statements[sql] += 1
+
+        if len(self.slowest) < SLOWEST_QUERIES or duration > self.slowest[0][0]:
+            entry = (duration, self.queries, sql[:SQL_PREVIEW_LENGTH], origin())
+            if len(self.slowest) < SLOWEST_QUERIES:
+                heapq.heappush(self.slowest, entry)
+            else:
+                heapq.heapreplace(self.slowest, entry)
+
+    def repeated(self):
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+
+def current_stats():
+    return getattr(_local, 'stats', None)
+
+
+def origin():
+    stack = traceback.StackSummary.extract(traceback.walk_stack(None), lookup_lines=False)
+    for frame in stack:
+        filename = os.path.abspath(frame.filename)
+        if filename == os.path.abspath(__file__) or not filename.startswith(PROJECT_ROOT):
+            continue
+        if 'site-packages' in filename:
+            continue
+        return '{}:{} in {}'.format(os.path.relpath(filename, PROJECT_ROOT), frame.lineno, frame.name)
+    return None
+
+
+@contextmanager
+def timer(name):
+    stats = current_stats()
+    if stats is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.timers[name] += time.perf_counter() - start
+
+
+def record_query(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats = current_stats()
+        if stats is not None:
+            stats.add_query(sql, time.perf_counter() - start)
+
+
+def milliseconds(seconds):
+    return round(seconds * 1000, 2)
+
+
+class InstrumentationMiddleware:
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'INSTRUMENTATION', False):
+            raise MiddlewareNotUsed()
+
+        self.get_response = get_response
+        self.query_budget = getattr(settings, 'INSTRUMENTATION_QUERY_BUDGET', 50)
+
+    def __call__(self, request):
+        _local.stats = stats = Stats()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(record_query))
+                response = self.get_response(request)
+        finally:
+            _local.stats = None
+
+        total = time.perf_counter() - start
+        response['Server-Timing'] = self.server_timing(stats, total)
+        self.log(request, response, stats, total)
+        return response
+
+    def process_template_response(self, request, response):
+        stats = current_stats()
+        start = time.perf_counter()
+
+        def rendered(response):
+            stats.timers['template'] += time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def server_timing(self, stats, total):
+        metrics = [
+            'sql;dur={};desc="{} queries"'.format(milliseconds(stats.sql_time), stats.queries),
+        ]
+        for name, duration in sorted(stats.timers.items()):
+            metrics.append('{};dur={}'.format(name, milliseconds(duration)))
+        metrics.append('total;dur={}'.format(milliseconds(total)))
+        return ', '.join(metrics)
+
+    def log(self, request, response, stats, total):
+        repeated, repeated_count = stats.repeated()
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': milliseconds(total),
+            'queries': stats.queries,
+            'sql_ms': milliseconds(stats.sql_time),
+            'timers_ms': {name: milliseconds(d) for name, d in stats.timers.items()},
+            'slowest': [
+                {'ms': milliseconds(duration), 'sql': sql, 'origin': where}
+                for duration, number, sql, where in sorted(stats.slowest, reverse=True)
+            ],
+            'repeated': {'count': repeated_count, 'sql': (repeated or '')[:SQL_PREVIEW_LENGTH]},
+        }
+
+        if stats.queries > self.query_budget:
+            record['query_budget'] = self.query_budget
+            logger.warning('Query budget exceeded: %s', json.dumps(record))
+        else:
+            logger.info('%s', json.dumps(record))
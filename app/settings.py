@@ -22,9 +22,11 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'finances.apps.FinancesConfig',
     'accountancy.apps.AccountancyConfig',
+    'mailing.apps.MailingConfig',
 ]
 
 MIDDLEWARE = [
+    'app.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -1,8 +1,15 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
+from .balance import copy_budgets
 from .models import *
 
 
+class BudgetInline(admin.TabularInline):
+    model = Budget
+    extra = 1
+    ordering = ('-year',)
+
+
 class TransactionTypeAdmin(admin.ModelAdmin):
     list_display = ('name', 'section')
     list_per_page = 100
@@ -18,11 +25,23 @@ class TransactionTypeAdmin(admin.ModelAdmin):
         }),
     )
 
+    inlines = [BudgetInline]
+
+    actions = ['copy_budgets']
+
+    def copy_budgets(self, request, queryset):
+        year = current_year()
+        created = copy_budgets(year - 1, year, queryset)
+        messages.success(request, 'Počet vytvorených rozpočtov na rok {}: {}'.format(year, created))
+
+    copy_budgets.short_description = 'Skopíruj rozpočty z minulého roka'
+
 
 class ExtraExpenseAdmin(admin.ModelAdmin):
     list_display = ('__str__', 'section', 'state', 'purpose')
+    list_select_related = ('transaction_type',)
     list_per_page = 100
-    list_filter = ('section', 'state')
+    list_filter = ('section', 'state', 'year')
 
     search_fields = ['transaction_type', 'purpose']
     ordering = ('-pk',)
@@ -30,7 +49,7 @@ class ExtraExpenseAdmin(admin.ModelAdmin):
     fieldsets = (
         ('Zaradenie', {
             'classes': ('wide',),
-            'fields': ('section', 'state'),
+            'fields': ('section', 'state', 'year'),
         }),
         ('Extra výdavok', {
             'classes': ('wide',),
@@ -39,5 +58,24 @@ class ExtraExpenseAdmin(admin.ModelAdmin):
     )
 
 
+class BalanceSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('name', 'section', 'year', 'spent', 'budget')
+    list_per_page = 100
+    list_filter = ('year', 'section')
+
+    search_fields = ['name']
+    ordering = ('-year', 'section', 'name')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 admin.site.register(TransactionType, TransactionTypeAdmin)
 admin.site.register(ExtraExpense, ExtraExpenseAdmin)
+admin.site.register(BalanceSnapshot, BalanceSnapshotAdmin)
@@ -0,0 +1,82 @@
+from django.conf import settings
+from django.utils.decorators import method_decorator
+from django.views.generic import View
+
+from app import api
+from app.caching import cached_view
+from finances.balance import get_balance, get_type_totals, get_year_over_year
+from finances.models import TransactionType
+
+SECTIONS = settings.SECTIONS
+
+BALANCE_FIELDS = ('id', 'section', 'name', 'spent', 'budget', 'remaining')
+
+
+@method_decorator(cached_view('balance'), name='dispatch')
+class BalanceApi(View):
+
+    def get(self, request, *args, **kwargs):
+        try:
+            fields = api.get_fields(request, BALANCE_FIELDS)
+            section = api.get_choice(request, 'section', SECTIONS)
+            year = api.get_int(request, 'year')
+            after = api.get_int(request, 'after')
+            size = api.get_page_size(request)
+        except api.ApiError as e:
+            return api.error_response(e)
+
+        types = TransactionType.objects.order_by('pk')
+        if section:
+            types = types.filter(section=section)
+        if after:
+            types = types.filter(pk__gt=after)
+
+        pks = list(types.values_list('pk', flat=True)[:size + 1])
+        has_next = len(pks) > size
+        pks = pks[:size]
+
+        totals = get_type_totals(TransactionType.objects.filter(pk__in=pks), year)
+        totals.sort(key=lambda t: t['id'])
+
+        return api.json_response({
+            'results': [{f: t[f] for f in fields} for t in totals],
+            'next': api.next_url(request, str(pks[-1]) if has_next else None),
+        })
+
+
+@method_decorator(cached_view('balance'), name='dispatch')
+class SectionsApi(View):
+
+    def get(self, request, *args, **kwargs):
+        try:
+            year = api.get_int(request, 'year')
+        except api.ApiError as e:
+            return api.error_response(e)
+
+        # the same totals as BalanceApi, so budgets of the year and closed
+        # years are counted the same way in both endpoints
+        return api.json_response({
+            'results': [
+                {
+                    'section': section['section'],
+                    'name': section['name'],
+                    'spent': sum(t['spent'] for t in section['types']),
+                    'budget': sum(t['budget'] or 0 for t in section['types']),
+                }
+                for section in get_balance(SECTIONS, year=year)
+            ],
+        })
+
+
+@method_decorator(cached_view('balance'), name='dispatch')
+class YearsApi(View):
+
+    def get(self, request, *args, **kwargs):
+        try:
+            years = [int(y) for y in request.GET.get('years', '').split(',') if y.strip()]
+        except ValueError:
+            return api.error_response(api.ApiError('Neplatná hodnota parametra years.'))
+
+        return api.json_response({
+            'results': get_year_over_year(SECTIONS, years),
+        })
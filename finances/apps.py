@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FinancesConfig(AppConfig):
     name = 'finances'
     verbose_name = 'Financie'
+
+    def ready(self):
+        import finances.ledger
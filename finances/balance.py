@@ -0,0 +1,227 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import DecimalField, F, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce
+
+from finances.models import TransactionType, Budget, Ledger, ClosedYear, BalanceSnapshot
+
+SECTIONS = settings.SECTIONS
+
+SPENT_TRANSACTION_STATES = ['payed', 'public', 'old']
+SPENT_EXTRA_STATES = ['payed', 'borrowed']
+
+'''
+Balance of every transaction type read from the ledger (see finances.ledger)
+in a single grouped query, independently of the amount of history:
+
+get_balance(year=2020) -> [
+    {
+        'section': 'ultimate',
+        'name': 'ultimate',
+        'types': [
+            {'id': 1, 'name': '...', 'spent': Decimal, 'budget': Decimal, 'remaining': Decimal},
+        ],
+    },
+]
+
+The budget of a year is its Budget row, or TransactionType.ammount for the
+years without one. Closed years (see finances.closing) are read from their
+snapshots, so they stay the same even when the types or budgets change
+later.
+
+get_year_over_year() compares the spent money and the budgets of all
+sections in all years, with the same fallback to TransactionType.ammount,
+using two queries (the open years and one grouped union):
+
+get_year_over_year() -> [
+    {
+        'section': 'ultimate',
+        'name': 'ultimate',
+        'years': [
+            {'year': 2020, 'spent': Decimal, 'budget': Decimal, 'remaining': Decimal},
+        ],
+    },
+]
+'''
+
+
+def remaining(budget, spent):
+    if budget is None:
+        return None
+    return budget - spent
+
+
+def get_snapshot_totals(types, year):
+    snapshots = BalanceSnapshot.objects.filter(
+        year=year,
+        transaction_type__in=types,
+    ).order_by('section', 'transaction_type')
+
+    return [
+        {
+            'id': s.transaction_type_id,
+            'section': s.section,
+            'name': s.name,
+            'spent': s.spent,
+            'budget': s.budget,
+            'remaining': remaining(s.budget, s.spent),
+        }
+        for s in snapshots
+    ]
+
+
+def year_budget(year):
+    return Coalesce(
+        Subquery(Budget.objects.filter(
+            transaction_type=OuterRef('pk'),
+            year=year,
+        ).values('ammount')[:1]),
+        'ammount',
+    )
+
+
+def get_type_totals(types=None, year=None):
+    if types is None:
+        types = TransactionType.objects.all()
+
+    if year and ClosedYear.objects.filter(year=year).exists():
+        return get_snapshot_totals(types, year)
+
+    if year:
+        budget = year_budget(year)
+    else:
+        budget = F('ammount')
+
+    ledger = Q(ledger__year=year) if year else None
+    types = types.order_by('section', 'pk').annotate(
+        spent_transactions=Sum('ledger__transactions', filter=ledger),
+        spent_extras=Sum('ledger__extras', filter=ledger),
+        budget=budget,
+    ).values('pk', 'section', 'name', 'budget', 'spent_transactions', 'spent_extras')
+
+    totals = []
+    for t in types:
+        spent = (t['spent_transactions'] or 0) + (t['spent_extras'] or 0)
+        totals.append({
+            'id': t['pk'],
+            'section': t['section'],
+            'name': t['name'],
+            'spent': spent,
+            'budget': t['budget'],
+            'remaining': remaining(t['budget'], spent),
+        })
+    return totals
+
+
+def get_balance(sections=SECTIONS, types=None, year=None):
+    by_section = {}
+    for t in get_type_totals(types, year):
+        by_section.setdefault(t['section'], []).append(t)
+
+    return [
+        {
+            'section': section[0],
+            'name': section[1],
+            'types': by_section.get(section[0], []),
+        }
+        for section in sections
+    ]
+
+
+def decimal(value):
+    return Cast(Value(value), DecimalField(max_digits=12, decimal_places=2))
+
+
+def open_years(closed, years=None):
+    parts = [
+        Ledger.objects.exclude(year__in=closed).exclude(transactions=0, extras=0).values_list(
+            'year', flat=True,
+        ).order_by(),
+        Budget.objects.exclude(year__in=closed).values_list('year', flat=True).order_by(),
+    ]
+    if years:
+        parts = [p.filter(year__in=years) for p in parts]
+    return sorted(parts[0].union(parts[1]))
+
+
+def get_year_totals(years=None):
+    closed = ClosedYear.objects.values('year')
+
+    ledger = Ledger.objects.exclude(year__in=closed).annotate(
+        group_section=F('section'),
+    ).values('year', 'group_section').annotate(
+        spent=Sum(F('transactions') + F('extras')),
+        budget=decimal(0),
+    )
+    budgets = [
+        TransactionType.objects.annotate(
+            year=Value(year, IntegerField()),
+            group_section=F('section'),
+        ).values('year', 'group_section').annotate(
+            spent=decimal(0),
+            budget=Sum(year_budget(year)),
+        ).order_by()
+        for year in open_years(closed, years)
+    ]
+    snapshots = BalanceSnapshot.objects.annotate(
+        group_section=F('section'),
+    ).values('year', 'group_section').annotate(
+        spent=Sum('spent'),
+        budget=Sum('budget'),
+    )
+
+    parts = [ledger.order_by(), snapshots.order_by()]
+    if years:
+        parts = [p.filter(year__in=years) for p in parts]
+    parts += budgets
+
+    totals = defaultdict(lambda: {'spent': 0, 'budget': 0})
+    for row in parts[0].union(*parts[1:], all=True):
+        key = (row['group_section'], row['year'])
+        totals[key]['spent'] += row['spent'] or 0
+        totals[key]['budget'] += row['budget'] or 0
+    return totals
+
+
+def get_year_over_year(sections=SECTIONS, years=None):
+    by_section = defaultdict(list)
+    for (section, year), t in sorted(get_year_totals(years).items(), key=lambda i: i[0][1]):
+        if not (t['spent'] or t['budget']):
+            continue
+        by_section[section].append({
+            'year': year,
+            'spent': t['spent'],
+            'budget': t['budget'],
+            'remaining': t['budget'] - t['spent'],
+        })
+
+    return [
+        {
+            'section': section[0],
+            'name': section[1],
+            'years': by_section.get(section[0], []),
+        }
+        for section in sections
+    ]
+
+
+def copy_budgets(source_year, target_year, types=None):
+    if types is None:
+        types = TransactionType.objects.all()
+
+    existing = Budget.objects.filter(year=target_year).values('transaction_type')
+    budgets = types.exclude(pk__in=existing).annotate(
+        budget=Coalesce(
+            Subquery(Budget.objects.filter(
+                transaction_type=OuterRef('pk'),
+                year=source_year,
+            ).values('ammount')[:1]),
+            'ammount',
+        ),
+    ).filter(budget__isnull=False).values_list('pk', 'budget')
+
+    return len(Budget.objects.bulk_create([
+        Budget(transaction_type_id=pk, year=target_year, ammount=ammount)
+        for pk, ammount in budgets
+    ]))
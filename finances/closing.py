@@ -0,0 +1,93 @@
+from django.apps import apps
+from django.db.transaction import atomic
+
+from app.caching import bump_version
+from finances import ledger
+from finances.balance import get_type_totals
+from finances.models import current_year, ExtraExpense, ClosedYear, BalanceSnapshot
+
+'''
+Closing of a fiscal year:
+
+close_year(2020)
+
+- stores the balance of every transaction type in the year as a snapshot,
+  which is shown for the year from then on,
+- moves the public transactions paid in the year to the state 'old', so
+  the diary, the API and the admin changelists, which all filter by state,
+  no longer touch them (the diary shows them with ?year=2020),
+- carries the borrowed and stored extra expenses forward to the next year
+  and archives the original ones.
+
+Private paid transactions keep the state 'payed', 'old' ones are shown in
+the public diary. All old transactions stay counted in the ledger and are
+read-only in the admin.
+'''
+
+CARRIED_EXTRA_STATES = ('borrowed', 'stored')
+
+
+class ClosingError(Exception):
+    pass
+
+
+def closed_transactions(year):
+    from accountancy.models import paid_in_year
+    return apps.get_model('accountancy', 'Transaction').objects.filter(
+        paid_in_year(year),
+        state='public',
+    )
+
+
+def carry_forward(year):
+    extras = list(ExtraExpense.objects.filter(
+        year=year,
+        state__in=CARRIED_EXTRA_STATES,
+    ).select_for_update())
+
+    carried = [
+        ExtraExpense(
+            ammount=e.ammount,
+            state=e.state,
+            section=e.section,
+            transaction_type_id=e.transaction_type_id,
+            purpose='Prenesené z roku {}: {}'.format(year, e.purpose),
+            year=year + 1,
+        )
+        for e in extras
+    ]
+    ExtraExpense.objects.bulk_create(carried)
+    ExtraExpense.objects.filter(pk__in=[e.pk for e in extras]).update(state='archived')
+
+    ledger.add(extras=ledger.difference(ledger.extra_entries(extras), ledger.extra_entries(carried)))
+    return len(carried)
+
+
+def close_year(year):
+    if year >= current_year():
+        raise ClosingError('Rok {} ešte neskončil.'.format(year))
+    if ClosedYear.objects.filter(year=year).exists():
+        raise ClosingError('Rok {} je už uzavretý.'.format(year))
+
+    from accountancy import transitions
+
+    with atomic():
+        BalanceSnapshot.objects.bulk_create([
+            BalanceSnapshot(
+                transaction_type_id=t['id'],
+                section=t['section'],
+                year=year,
+                name=t['name'],
+                spent=t['spent'],
+                budget=t['budget'],
+            )
+            for t in get_type_totals(year=year)
+        ])
+        ClosedYear.objects.create(year=year)
+
+        result = transitions.apply('close_year', closed_transactions(year).values_list('pk', flat=True))
+
+        carried = carry_forward(year)
+
+    bump_version('diary', 'balance')
+    return len(result.changed), carried
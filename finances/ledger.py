@@ -0,0 +1,251 @@
+import threading
+from collections import defaultdict
+
+from django.apps import apps
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce, ExtractYear
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from app.caching import bump_version
+from finances.balance import SPENT_TRANSACTION_STATES, SPENT_EXTRA_STATES
+from finances.models import ExtraExpense, Ledger
+
+'''
+Running totals of spent money per (transaction type, section, year).
+
+Every save or deletion of Transaction, Approval, Item and ExtraExpense
+compares the contribution of the touched rows before and after the change
+and adds the difference to the ledger. A deletion may cascade from a
+transaction to its approval and item, the contribution of the transaction
+is then tracked across all the deleted rows, so it is subtracted once.
+Bulk updates bypass the signals, `manage.py rebuild_ledger` repairs the
+ledger after those.
+'''
+
+_deleting = threading.local()
+
+
+def transaction_model():
+    return apps.get_model('accountancy', 'Transaction')
+
+
+def transaction_year(date_payed, date_created):
+    if date_payed:
+        return date_payed.year
+    return timezone.localtime(date_created).year
+
+
+def transaction_entries(pks):
+    entries = defaultdict(int)
+    pks = [pk for pk in pks if pk is not None]
+    if not pks:
+        return entries
+
+    rows = transaction_model().objects.filter(
+        pk__in=pks,
+        state__in=SPENT_TRANSACTION_STATES,
+        approval__transaction_type__isnull=False,
+    ).values_list(
+        'approval__transaction_type',
+        'section',
+        'item__date_payed',
+        'date_created',
+        'ammount',
+    )
+    for transaction_type, section, date_payed, date_created, ammount in rows:
+        key = (transaction_type, section, transaction_year(date_payed, date_created))
+        entries[key] += ammount
+    return entries
+
+
+def extra_entries(extras):
+    entries = defaultdict(int)
+    for e in extras:
+        if e.state in SPENT_EXTRA_STATES and e.transaction_type_id:
+            entries[(e.transaction_type_id, e.section, e.year)] += e.ammount
+    return entries
+
+
+def difference(before, after):
+    diff = defaultdict(int)
+    for key, value in after.items():
+        diff[key] += value
+    for key, value in before.items():
+        diff[key] -= value
+    return {key: value for key, value in diff.items() if value}
+
+
+def add(transactions=None, extras=None):
+    transactions = transactions or {}
+    extras = extras or {}
+
+    for key in set(transactions) | set(extras):
+        transaction_type, section, year = key
+        t = transactions.get(key, 0)
+        e = extras.get(key, 0)
+        if not (t or e):
+            continue
+
+        rows = Ledger.objects.filter(
+            transaction_type_id=transaction_type,
+            section=section,
+            year=year,
+        )
+        if rows.update(transactions=F('transactions') + t, extras=F('extras') + e):
+            continue
+
+        try:
+            with transaction.atomic():
+                Ledger.objects.create(
+                    transaction_type_id=transaction_type,
+                    section=section,
+                    year=year,
+                    transactions=t,
+                    extras=e,
+                )
+        except IntegrityError:
+            rows.update(transactions=F('transactions') + t, extras=F('extras') + e)
+
+
+def compute():
+    totals = defaultdict(lambda: {'transactions': 0, 'extras': 0})
+
+    transactions = transaction_model().objects.filter(
+        state__in=SPENT_TRANSACTION_STATES,
+        approval__transaction_type__isnull=False,
+    ).annotate(
+        year=Coalesce(ExtractYear('item__date_payed'), ExtractYear('date_created')),
+    ).order_by().values_list(
+        'approval__transaction_type',
+        'section',
+        'year',
+    ).annotate(s=Sum('ammount'))
+    for transaction_type, section, year, s in transactions:
+        totals[(transaction_type, section, year)]['transactions'] = s
+
+    extras = ExtraExpense.objects.filter(
+        state__in=SPENT_EXTRA_STATES,
+    ).order_by().values_list(
+        'transaction_type',
+        'section',
+        'year',
+    ).annotate(s=Sum('ammount'))
+    for transaction_type, section, year, s in extras:
+        totals[(transaction_type, section, year)]['extras'] = s
+
+    return totals
+
+
+def rebuild(dry_run=False):
+    expected = compute()
+    drift = []
+
+    with transaction.atomic():
+        existing = {
+            (l.transaction_type_id, l.section, l.year): l
+            for l in Ledger.objects.select_for_update()
+        }
+
+        for key in set(expected) | set(existing):
+            e = expected.get(key, {'transactions': 0, 'extras': 0})
+            l = existing.get(key)
+            stored = {
+                'transactions': l.transactions if l else 0,
+                'extras': l.extras if l else 0,
+            }
+            if stored['transactions'] != e['transactions'] or stored['extras'] != e['extras']:
+                drift.append((key, stored, e))
+
+        if not dry_run:
+            Ledger.objects.all().delete()
+            Ledger.objects.bulk_create([
+                Ledger(
+                    transaction_type_id=key[0],
+                    section=key[1],
+                    year=key[2],
+                    transactions=value['transactions'],
+                    extras=value['extras'],
+                )
+                for key, value in expected.items()
+            ])
+
+    if drift and not dry_run:
+        bump_version('balance')
+    return sorted(drift, key=lambda d: (d[0][2], d[0][1], d[0][0]))
+
+
+def related_transaction_pk(instance):
+    if instance.__class__ is transaction_model():
+        return instance.pk
+    return instance.transaction_id
+
+
+@receiver(pre_save, sender='accountancy.Transaction')
+@receiver(pre_save, sender='accountancy.Approval')
+@receiver(pre_save, sender='accountancy.Item')
+def snapshot_transaction(sender, instance, **kwargs):
+    instance._ledger_before = transaction_entries([related_transaction_pk(instance)])
+
+
+@receiver(post_save, sender='accountancy.Transaction')
+@receiver(post_save, sender='accountancy.Approval')
+@receiver(post_save, sender='accountancy.Item')
+def update_transaction(sender, instance, **kwargs):
+    after = transaction_entries([related_transaction_pk(instance)])
+    add(transactions=difference(getattr(instance, '_ledger_before', {}), after))
+
+
+def pending_deletions():
+    if not hasattr(_deleting, 'transactions'):
+        _deleting.transactions = {}
+    return _deleting.transactions
+
+
+@receiver(pre_delete, sender='accountancy.Transaction')
+@receiver(pre_delete, sender='accountancy.Approval')
+@receiver(pre_delete, sender='accountancy.Item')
+def snapshot_deleted(sender, instance, **kwargs):
+    pk = related_transaction_pk(instance)
+    pending = pending_deletions()
+    if pk not in pending:
+        pending[pk] = [transaction_entries([pk]), 0]
+    pending[pk][1] += 1
+
+
+@receiver(post_delete, sender='accountancy.Transaction')
+@receiver(post_delete, sender='accountancy.Approval')
+@receiver(post_delete, sender='accountancy.Item')
+def update_deleted(sender, instance, **kwargs):
+    pk = related_transaction_pk(instance)
+    pending = pending_deletions()
+    if pk not in pending:
+        return
+
+    before, count = pending[pk]
+    after = transaction_entries([pk])
+    add(transactions=difference(before, after))
+
+    if count > 1:
+        pending[pk] = [after, count - 1]
+    else:
+        del pending[pk]
+
+
+@receiver(pre_save, sender=ExtraExpense)
+def snapshot_extra(sender, instance, **kwargs):
+    old = ExtraExpense.objects.filter(pk=instance.pk) if instance.pk else []
+    instance._ledger_before = extra_entries(old)
+
+
+@receiver(post_save, sender=ExtraExpense)
+def update_extra(sender, instance, **kwargs):
+    before = getattr(instance, '_ledger_before', {})
+    add(extras=difference(before, extra_entries([instance])))
+
+
+@receiver(post_delete, sender=ExtraExpense)
+def delete_extra(sender, instance, **kwargs):
+    add(extras=difference(extra_entries([instance]), {}))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from finances import closing
+
+
+class Command(BaseCommand):
+    help = 'Uzavrie účtovný rok: uloží uzávierku, archivuje jeho transakcie a prenesie extra výdavky.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'year',
+            type=int,
+            help='Uzatváraný rok.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            archived, carried = closing.close_year(options['year'])
+        except closing.ClosingError as e:
+            raise CommandError(e)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Rok {} je uzavretý. Archivovaných transakcií: {}, prenesených extra výdavkov: {}'.format(
+                options['year'],
+                archived,
+                carried,
+            )
+        ))
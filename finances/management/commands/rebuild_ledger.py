@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from finances import ledger
+
+
+class Command(BaseCommand):
+    help = 'Prepočíta účtovnú knihu z transakcií a extra výdavkov a vypíše rozdiely.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Iba vypíše rozdiely, účtovnú knihu nezmení.',
+        )
+
+    def handle(self, *args, **options):
+        drift = ledger.rebuild(dry_run=options['dry_run'])
+
+        for (transaction_type, section, year), stored, expected in drift:
+            self.stdout.write(
+                'typ {} ({}, {}): transakcie {} -> {}, extra {} -> {}'.format(
+                    transaction_type,
+                    section,
+                    year,
+                    stored['transactions'],
+                    expected['transactions'],
+                    stored['extras'],
+                    expected['extras'],
+                )
+            )
+
+        if drift:
+            self.stdout.write(self.style.WARNING('Nájdených rozdielov: {}'.format(len(drift))))
+        else:
+            self.stdout.write(self.style.SUCCESS('Účtovná kniha je aktuálna.'))
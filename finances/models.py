@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 SECTIONS = settings.SECTIONS
 
@@ -12,6 +13,10 @@ STATES = (
 )
 
 
+def current_year():
+    return timezone.localdate().year
+
+
 class TransactionType(models.Model):
     section = models.CharField(
         max_length=15,
@@ -28,11 +33,18 @@ class TransactionType(models.Model):
         decimal_places=2,
         blank=True,
         null=True,
+        help_text='Rozpočet pre roky, ktoré nemajú vlastný rozpočet.',
     )
 
     class Meta:
         verbose_name = 'transakčný typ'
         verbose_name_plural = 'transakčné typy'
+        indexes = [
+            models.Index(
+                fields=['section', 'name'],
+                name='transactiontype_section',
+            ),
+        ]
 
     def __str__(self):
         if self.section == 'ultimate':
@@ -45,6 +57,38 @@ class TransactionType(models.Model):
         return '{} ({})'.format(self.name, sec)
 
 
+class Budget(models.Model):
+    transaction_type = models.ForeignKey(
+        TransactionType,
+        on_delete=models.CASCADE,
+        verbose_name='zaradenie',
+        related_name='budgets',
+    )
+    year = models.PositiveSmallIntegerField(
+        verbose_name='rok',
+        default=current_year,
+    )
+    ammount = models.DecimalField(
+        verbose_name='suma',
+        max_digits=8,
+        decimal_places=2,
+    )
+
+    class Meta:
+        verbose_name = 'rozpočet'
+        verbose_name_plural = 'rozpočty'
+        unique_together = ('transaction_type', 'year')
+        indexes = [
+            models.Index(
+                fields=['year'],
+                name='budget_year',
+            ),
+        ]
+
+    def __str__(self):
+        return '{} {}'.format(self.transaction_type, self.year)
+
+
 class ExtraExpense(models.Model):
     ammount = models.DecimalField(
         verbose_name='suma',
@@ -70,10 +114,121 @@ class ExtraExpense(models.Model):
     purpose = models.TextField(
         verbose_name='účel',
     )
+    year = models.PositiveSmallIntegerField(
+        verbose_name='rok',
+        default=current_year,
+    )
 
     class Meta:
         verbose_name = 'extra výdavok'
         verbose_name_plural = 'extra výdavky'
+        indexes = [
+            models.Index(
+                fields=['transaction_type', 'state'],
+                name='extraexpense_type_state',
+            ),
+            models.Index(
+                fields=['section', 'state'],
+                name='extraexpense_section_state',
+            ),
+        ]
 
     def __str__(self):
         return '{} - {}'.format(self.transaction_type, self.ammount)
+
+
+class Ledger(models.Model):
+    transaction_type = models.ForeignKey(
+        TransactionType,
+        on_delete=models.CASCADE,
+        verbose_name='zaradenie',
+        related_name='ledger',
+    )
+    section = models.CharField(
+        max_length=15,
+        choices=SECTIONS,
+        verbose_name='sekcia',
+    )
+    year = models.PositiveSmallIntegerField(
+        verbose_name='rok',
+    )
+    transactions = models.DecimalField(
+        verbose_name='zaplatené transakcie',
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+    )
+    extras = models.DecimalField(
+        verbose_name='extra výdavky',
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'účtovná kniha'
+        verbose_name_plural = 'účtovné knihy'
+        unique_together = ('transaction_type', 'section', 'year')
+
+    def __str__(self):
+        return '{} {} ({})'.format(self.transaction_type, self.year, self.section)
+
+
+class ClosedYear(models.Model):
+    year = models.PositiveSmallIntegerField(
+        verbose_name='rok',
+        unique=True,
+    )
+    date_closed = models.DateTimeField(
+        verbose_name='dátum uzavretia',
+        auto_now_add=True,
+    )
+
+    class Meta:
+        verbose_name = 'uzavretý rok'
+        verbose_name_plural = 'uzavreté roky'
+        ordering = ('-year',)
+
+    def __str__(self):
+        return str(self.year)
+
+
+class BalanceSnapshot(models.Model):
+    transaction_type = models.ForeignKey(
+        TransactionType,
+        on_delete=models.CASCADE,
+        verbose_name='zaradenie',
+        related_name='snapshots',
+    )
+    section = models.CharField(
+        max_length=15,
+        choices=SECTIONS,
+        verbose_name='sekcia',
+    )
+    year = models.PositiveSmallIntegerField(
+        verbose_name='rok',
+    )
+    name = models.CharField(
+        max_length=63,
+        verbose_name='meno',
+    )
+    spent = models.DecimalField(
+        verbose_name='prečerpané',
+        max_digits=12,
+        decimal_places=2,
+    )
+    budget = models.DecimalField(
+        verbose_name='rozpočet',
+        max_digits=8,
+        decimal_places=2,
+        blank=True,
+        null=True,
+    )
+
+    class Meta:
+        verbose_name = 'uzávierka'
+        verbose_name_plural = 'uzávierky'
+        unique_together = ('transaction_type', 'year')
+
+    def __str__(self):
+        return '{} {}'.format(self.name, self.year)
@@ -1,3 +1,268 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from accountancy.models import Transaction, Approval, Item
+from finances import closing, ledger
+from finances.balance import get_balance, get_year_over_year, copy_budgets
+from finances.models import TransactionType, ExtraExpense, Ledger, Budget
+
+
+def create_transaction(transaction_type, ammount, state):
+    t = Transaction.objects.create(
+        state=state,
+        ammount=ammount,
+        section=transaction_type.section,
+        description='test',
+        iban='SK3112000000198742637541',
+        provider='test',
+        business_id='12345678',
+        invoice_number='1',
+        invoice='invoices/test.pdf',
+    )
+    Approval.objects.create(transaction=t, transaction_type=transaction_type)
+    return t
+
+
+class BalanceTest(TestCase):
+
+    def populate(self, count):
+        for i in range(count):
+            for section in ('ultimate', 'discgolf'):
+                t = TransactionType.objects.create(
+                    section=section,
+                    name='{} {}'.format(section, i),
+                    ammount=Decimal('100.00'),
+                )
+                create_transaction(t, Decimal('10.00'), 'public')
+                create_transaction(t, Decimal('5.00'), 'payed')
+                create_transaction(t, Decimal('1000.00'), 'created')
+                ExtraExpense.objects.create(
+                    transaction_type=t,
+                    section=section,
+                    state='borrowed',
+                    ammount=Decimal('2.50'),
+                    purpose='test',
+                )
+                ExtraExpense.objects.create(
+                    transaction_type=t,
+                    section=section,
+                    state='allocated',
+                    ammount=Decimal('1000.00'),
+                    purpose='test',
+                )
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            get_balance()
+        return len(context)
+
+    def test_totals(self):
+        self.populate(2)
+        balance = {s['section']: s['types'] for s in get_balance()}
+
+        self.assertEqual(balance['vr'], [])
+        self.assertEqual(len(balance['ultimate']), 2)
+        for t in balance['ultimate'] + balance['discgolf']:
+            self.assertEqual(t['spent'], Decimal('17.50'))
+            self.assertEqual(t['budget'], Decimal('100.00'))
+
+    def test_constant_query_count(self):
+        self.populate(1)
+        small = self.count_queries()
+        self.populate(10)
+        self.assertEqual(self.count_queries(), small)
+
+
+class LedgerTest(TestCase):
+
+    def setUp(self):
+        self.type = TransactionType.objects.create(
+            section='ultimate',
+            name='test',
+            ammount=Decimal('100.00'),
+        )
+
+    def spent(self):
+        return get_balance()[1]['types'][0]['spent']
+
+    def test_incremental_updates(self):
+        t = create_transaction(self.type, Decimal('10.00'), 'created')
+        self.assertEqual(self.spent(), 0)
+
+        t.state = 'public'
+        t.save()
+        self.assertEqual(self.spent(), Decimal('10.00'))
+
+        t.state = 'payed'
+        t.ammount = Decimal('12.00')
+        t.save()
+        self.assertEqual(self.spent(), Decimal('12.00'))
+
+        e = ExtraExpense.objects.create(
+            transaction_type=self.type,
+            section='ultimate',
+            state='borrowed',
+            ammount=Decimal('3.00'),
+            purpose='test',
+        )
+        self.assertEqual(self.spent(), Decimal('15.00'))
+
+        e.state = 'allocated'
+        e.save()
+        t.delete()
+        self.assertEqual(self.spent(), 0)
+        self.assertEqual(ledger.rebuild(dry_run=True), [])
+
+    def test_deletions(self):
+        t = create_transaction(self.type, Decimal('10.00'), 'public')
+        Item.objects.create(transaction=t, approval=t.approval, date_payed='2020-06-01')
+        self.assertEqual(get_balance(year=2020)[1]['types'][0]['spent'], Decimal('10.00'))
+
+        t.item.delete()
+        self.assertEqual(get_balance(year=2020)[1]['types'][0]['spent'], 0)
+        self.assertEqual(ledger.rebuild(dry_run=True), [])
+
+        Approval.objects.get(transaction=t).delete()
+        self.assertEqual(self.spent(), 0)
+        self.assertEqual(ledger.rebuild(dry_run=True), [])
+
+        t = create_transaction(self.type, Decimal('10.00'), 'public')
+        Item.objects.create(transaction=t, approval=t.approval, date_payed='2020-06-01')
+        t.delete()
+        self.assertEqual(ledger.rebuild(dry_run=True), [])
+
+    def test_rebuild_reports_drift(self):
+        create_transaction(self.type, Decimal('10.00'), 'public')
+        Ledger.objects.update(transactions=0)
+
+        self.assertEqual(len(ledger.rebuild()), 1)
+        self.assertEqual(self.spent(), Decimal('10.00'))
+        self.assertEqual(ledger.rebuild(), [])
+
+
+class BalanceApiTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        for i in range(3):
+            t = TransactionType.objects.create(section='ultimate', name=str(i), ammount=Decimal('100.00'))
+            create_transaction(t, Decimal('10.00'), 'public')
+
+    def test_balance(self):
+        data = self.client.get('/finances/api/balance/?page_size=2&fields=name,spent').json()
+        self.assertEqual([(t['name'], Decimal(t['spent'])) for t in data['results']], [
+            ('0', Decimal('10.00')),
+            ('1', Decimal('10.00')),
+        ])
+        data = self.client.get(data['next']).json()
+        self.assertEqual([t['name'] for t in data['results']], ['2'])
+        self.assertIsNone(data['next'])
+
+        data = self.client.get('/finances/api/balance/?year=1999').json()
+        self.assertEqual(data['results'][0]['spent'], 0)
+
+    def test_sections(self):
+        ultimate = self.client.get('/finances/api/sections/').json()['results'][1]
+        self.assertEqual(ultimate['section'], 'ultimate')
+        self.assertEqual(Decimal(ultimate['spent']), Decimal('30.00'))
+        self.assertEqual(Decimal(ultimate['budget']), Decimal('300.00'))
+
+    def test_sections_by_year(self):
+        approval = Approval.objects.select_related('transaction', 'transaction_type').first()
+        Budget.objects.create(transaction_type=approval.transaction_type, year=2020, ammount=Decimal('50.00'))
+        Item.objects.create(transaction=approval.transaction, approval=approval, date_payed='2020-06-01')
+
+        ultimate = self.client.get('/finances/api/sections/?year=2020').json()['results'][1]
+        self.assertEqual(Decimal(ultimate['spent']), Decimal('10.00'))
+        self.assertEqual(Decimal(ultimate['budget']), Decimal('250.00'))
+
+        closing.close_year(2020)
+        Budget.objects.filter(year=2020).update(ammount=Decimal('0.00'))
+        cache.clear()
+        ultimate = self.client.get('/finances/api/sections/?year=2020').json()['results'][1]
+        self.assertEqual(Decimal(ultimate['budget']), Decimal('250.00'))
+
+
+class ClosingTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.type = TransactionType.objects.create(section='ultimate', name='test', ammount=Decimal('100.00'))
+        for year, state in ((2020, 'public'), (2020, 'payed'), (2021, 'public')):
+            t = create_transaction(self.type, Decimal('10.00'), state)
+            Item.objects.create(transaction=t, approval=t.approval, date_payed='{}-06-01'.format(year))
+        ExtraExpense.objects.create(
+            transaction_type=self.type,
+            section='ultimate',
+            state='borrowed',
+            ammount=Decimal('2.50'),
+            purpose='test',
+            year=2020,
+        )
+
+    def test_close_year(self):
+        self.assertEqual(closing.close_year(2020), (1, 1))
+
+        self.assertEqual(
+            sorted(Transaction.objects.values_list('state', flat=True)),
+            ['old', 'payed', 'public'],
+        )
+        self.assertEqual(get_balance(year=2020)[1]['types'][0]['spent'], Decimal('22.50'))
+        self.assertEqual(get_balance(year=2021)[1]['types'][0]['spent'], Decimal('12.50'))
+        self.assertEqual(ledger.rebuild(dry_run=True), [])
+
+        TransactionType.objects.update(name='renamed')
+        self.assertEqual(get_balance(year=2020)[1]['types'][0]['name'], 'test')
+
+        self.assertEqual(len(self.client.get('/').context['transaction_list']), 1)
+        self.assertEqual(len(self.client.get('/?year=2020').context['transaction_list']), 1)
+
+        with self.assertRaises(closing.ClosingError):
+            closing.close_year(2020)
+
+
+class BudgetTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.type = TransactionType.objects.create(section='ultimate', name='test', ammount=Decimal('100.00'))
+        Budget.objects.create(transaction_type=self.type, year=2020, ammount=Decimal('200.00'))
+        for year in (2020, 2021):
+            t = create_transaction(self.type, Decimal('10.00'), 'public')
+            Item.objects.create(transaction=t, approval=t.approval, date_payed='{}-06-01'.format(year))
+
+    def test_balance_per_year(self):
+        t = get_balance(year=2020)[1]['types'][0]
+        self.assertEqual((t['spent'], t['budget'], t['remaining']), (10, 200, 190))
+        t = get_balance(year=2021)[1]['types'][0]
+        self.assertEqual((t['spent'], t['budget'], t['remaining']), (10, 100, 90))
+
+        response = self.client.get('/finances/balance/?year=2020')
+        self.assertEqual(response.context['data'][1]['types'][0]['budget'], 200)
+        self.assertEqual(response.context['year_list'], [2020, 2021])
+
+    def test_year_over_year(self):
+        for i in range(5):
+            TransactionType.objects.create(section='discgolf', name=str(i))
+
+        with CaptureQueriesContext(connection) as context:
+            years = get_year_over_year()
+        self.assertEqual(len(context), 2)
+        self.assertEqual(
+            [(y['year'], y['spent'], y['budget']) for y in years[1]['years']],
+            [(2020, 10, 200), (2021, 10, 100)],
+        )
+        self.assertEqual(get_balance(year=2021)[1]['types'][0]['budget'], 100)
+
+        closing.close_year(2020)
+        Budget.objects.update(ammount=Decimal('300.00'))
+        self.assertEqual(get_year_over_year()[1]['years'][0]['budget'], 200)
 
-# Create your tests here.
+    def test_copy_budgets(self):
+        self.assertEqual(copy_budgets(2020, 2021), 1)
+        self.assertEqual(copy_budgets(2020, 2021), 0)
+        self.assertEqual(Budget.objects.get(year=2021).ammount, Decimal('200.00'))
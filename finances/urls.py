@@ -1,9 +1,13 @@
 from django.urls import path
 
+from .api import BalanceApi, SectionsApi, YearsApi
 from .views import BalanceView
 
 app_name = 'finances'
 
 urlpatterns = [
     path('balance/', BalanceView.as_view(), name='balance'),
+    path('api/balance/', BalanceApi.as_view(), name='api_balance'),
+    path('api/sections/', SectionsApi.as_view(), name='api_sections'),
+    path('api/years/', YearsApi.as_view(), name='api_years'),
 ]
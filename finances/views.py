@@ -1,33 +1,31 @@
 from django.views.generic import ListView
 from django.conf import settings
+from django.utils.decorators import method_decorator
 
-from accountancy.models import *
+from app.caching import cached_view
 from finances.models import *
+from finances.balance import get_balance, get_year_over_year
 
 SECTIONS = settings.SECTIONS
 
 
+@method_decorator(cached_view('balance'), name='dispatch')
 class BalanceView(ListView):
 
     model = TransactionType
 
+    def get_year(self):
+        try:
+            return int(self.request.GET.get('year', ''))
+        except ValueError:
+            return current_year()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['data'] = []
-        for section in SECTIONS:
-            temp = []
-            types = TransactionType.objects.filter(section=section[0])
-            for t in types:
-                c = t.ammount
-                approvals = Approval.objects.filter(transaction_type=t)
-                s = 0
-                for a in approvals:
-                    if a.transaction.state in ['payed', 'public']:
-                        s += a.transaction.ammount
-                extras = ExtraExpense.objects.filter(transaction_type=t)
-                for a in extras:
-                    if a.state in ['payed', 'borrowed']:
-                        s += a.ammount
-                temp.append((t.name, s, c))
-            context['data'].append((section[1], temp))
+        context['year'] = self.get_year()
+        context['data'] = get_balance(SECTIONS, year=context['year'])
+        context['years'] = get_year_over_year(SECTIONS)
+        context['year_list'] = sorted(
+            set(y['year'] for section in context['years'] for y in section['years']) | {context['year']}
+        )
         return context
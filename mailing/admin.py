@@ -0,0 +1,39 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import *
+
+
+class EmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'state', 'attempts', 'created', 'date_sent')
+    list_per_page = 100
+    list_filter = ('state',)
+
+    search_fields = ['subject', 'recipients']
+    ordering = ('-created',)
+
+    date_hierarchy = 'created'
+
+    readonly_fields = (
+        'created',
+        'date_sent',
+        'attempts',
+        'next_attempt',
+        'last_error',
+    )
+
+    actions = [
+        'retry',
+    ]
+
+    def retry(self, request, queryset):
+        queryset.exclude(state='sent').update(
+            state='queued',
+            attempts=0,
+            next_attempt=timezone.now(),
+        )
+
+    retry.short_description = 'Odoslať znova'
+
+
+admin.site.register(Email, EmailAdmin)
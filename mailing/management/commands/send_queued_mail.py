@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from mailing.outbox import send_queued
+
+
+class Command(BaseCommand):
+    help = 'Odošle e-maily čakajúce vo fronte.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=100,
+            help='Maximálny počet e-mailov odoslaných naraz.',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Beží nepretržite a frontu kontroluje opakovane.',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=10,
+            help='Počet sekúnd medzi kontrolami fronty v režime --loop.',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = send_queued(options['limit'])
+            if sent or failed:
+                self.stdout.write('Odoslané: {}, neúspešné: {}'.format(sent, failed))
+
+            if not options['loop']:
+                break
+            if sent + failed < options['limit']:
+                time.sleep(options['interval'])
@@ -0,0 +1,70 @@
+from django.db import models
+from django.utils import timezone
+
+STATES = (
+    ('queued', 'čaká na odoslanie'),
+    ('sent', 'odoslané'),
+    ('failed', 'neodoslateľné'),
+)
+
+
+class Email(models.Model):
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='vytvorené',
+    )
+    state = models.CharField(
+        max_length=15,
+        choices=STATES,
+        verbose_name='stav',
+        default='queued',
+    )
+    subject = models.CharField(
+        max_length=255,
+        verbose_name='predmet',
+    )
+    body = models.TextField(
+        verbose_name='obsah',
+    )
+    from_email = models.CharField(
+        max_length=255,
+        verbose_name='odosielateľ',
+    )
+    recipients = models.TextField(
+        verbose_name='príjemcovia',
+    )
+    attachment = models.CharField(
+        max_length=255,
+        verbose_name='príloha',
+        blank=True,
+    )
+    attempts = models.PositiveSmallIntegerField(
+        verbose_name='počet pokusov',
+        default=0,
+    )
+    next_attempt = models.DateTimeField(
+        verbose_name='ďalší pokus',
+        default=timezone.now,
+    )
+    last_error = models.TextField(
+        verbose_name='posledná chyba',
+        blank=True,
+    )
+    date_sent = models.DateTimeField(
+        verbose_name='odoslané',
+        blank=True,
+        null=True,
+    )
+
+    class Meta:
+        verbose_name = 'e-mail'
+        verbose_name_plural = 'e-maily'
+        indexes = [
+            models.Index(fields=['state', 'next_attempt']),
+        ]
+
+    def __str__(self):
+        return self.subject
+
+    def get_recipients(self):
+        return [r for r in self.recipients.split('\n') if r]
@@ -0,0 +1,141 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Email
+
+logger = logging.getLogger(__name__)
+
+'''
+Database backed outbox. SendMail stores rendered messages with enqueue(),
+inside the same database transaction as the change that triggered them,
+and `manage.py send_queued_mail` delivers them with send_queued().
+Attachments are stored as paths and read when the message is sent, a file
+replaced in the meantime is updated with move_attachment().
+'''
+
+
+def max_attempts():
+    return getattr(settings, 'EMAIL_QUEUE_MAX_ATTEMPTS', 8)
+
+
+def retry_delay(attempts):
+    base = getattr(settings, 'EMAIL_QUEUE_RETRY_DELAY', 60)
+    return timedelta(seconds=base * 2 ** (attempts - 1))
+
+
+def to_model(email, attachment=''):
+    return Email(
+        subject=email.subject,
+        body=email.body,
+        from_email=email.from_email,
+        recipients='\n'.join(email.to),
+        attachment=attachment or '',
+    )
+
+
+def enqueue(email, attachment=''):
+    e = to_model(email, attachment)
+    e.save()
+    return e
+
+
+def enqueue_many(emails):
+    return Email.objects.bulk_create([
+        to_model(email, attachment) for email, attachment in emails
+    ])
+
+
+def move_attachment(old, new):
+    return Email.objects.filter(state='queued', attachment=old).update(attachment=new)
+
+
+def build_message(e, connection=None):
+    email = EmailMessage(
+        e.subject,
+        e.body,
+        e.from_email,
+        e.get_recipients(),
+        connection=connection,
+    )
+    if e.attachment:
+        email.attach_file(e.attachment)
+    return email
+
+
+def claim(limit):
+    now = timezone.now()
+    lease = now + timedelta(seconds=getattr(settings, 'EMAIL_QUEUE_LEASE', 300))
+
+    with transaction.atomic():
+        due = Email.objects.filter(
+            state='queued',
+            next_attempt__lte=now,
+        ).order_by('next_attempt', 'pk')
+
+        if connection.features.has_select_for_update_skip_locked:
+            pks = list(due.select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+            Email.objects.filter(pk__in=pks).update(next_attempt=lease)
+        else:
+            # without row locks (SQLite) another worker may have read the
+            # same rows, a message is claimed only if nobody moved its
+            # next_attempt since it was read
+            pks = [
+                pk for pk, next_attempt in due.values_list('pk', 'next_attempt')[:limit]
+                if Email.objects.filter(
+                    pk=pk,
+                    state='queued',
+                    next_attempt=next_attempt,
+                ).update(next_attempt=lease)
+            ]
+
+    return Email.objects.filter(pk__in=pks).order_by('pk')
+
+
+def record_failure(e, error):
+    e.attempts += 1
+    e.last_error = repr(error)
+    if e.attempts >= max_attempts():
+        e.state = 'failed'
+        logger.error('E-mail %s nebol odoslaný: %r', e.pk, error)
+    else:
+        e.next_attempt = timezone.now() + retry_delay(e.attempts)
+    e.save(update_fields=['attempts', 'last_error', 'state', 'next_attempt'])
+
+
+def send_queued(limit=100):
+    sent = failed = 0
+    emails = list(claim(limit))
+    if not emails:
+        return sent, failed
+
+    mail_connection = get_connection()
+    try:
+        mail_connection.open()
+    except Exception as error:
+        # the server is down or refuses the credentials, the whole batch waits
+        for e in emails:
+            record_failure(e, error)
+        return sent, len(emails)
+
+    try:
+        for e in emails:
+            try:
+                build_message(e, mail_connection).send(fail_silently=False)
+            except Exception as error:
+                failed += 1
+                record_failure(e, error)
+            else:
+                sent += 1
+                e.attempts += 1
+                e.state = 'sent'
+                e.date_sent = timezone.now()
+                e.save(update_fields=['attempts', 'state', 'date_sent'])
+    finally:
+        mail_connection.close()
+
+    return sent, failed
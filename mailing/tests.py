@@ -0,0 +1,136 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from app.emails import SendMail, mail_batch
+from finances.models import TransactionType
+from mailing.models import Email
+from mailing.outbox import claim, send_queued
+
+
+class FailingBackend(BaseEmailBackend):
+
+    def send_messages(self, email_messages):
+        raise ConnectionError('SMTP server is down')
+
+
+class UnreachableBackend(BaseEmailBackend):
+
+    def open(self):
+        raise ConnectionRefusedError('Connection refused')
+
+
+@override_settings(EMAIL_QUEUE=True, EMAIL_QUEUE_MAX_ATTEMPTS=2)
+class OutboxTest(TestCase):
+
+    def queue(self):
+        SendMail(['test@example.com'], 'Test').send_rendered_email(
+            {},
+            type('Template', (), {'render': lambda self, context: 'obsah'})(),
+        )
+
+    def test_queued_until_sent(self):
+        self.queue()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(Email.objects.get().state, 'queued')
+
+        self.assertEqual(send_queued(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['test@example.com'])
+        self.assertEqual(Email.objects.get().state, 'sent')
+        self.assertEqual(send_queued(), (0, 0))
+
+    @override_settings(EMAIL_BACKEND='mailing.tests.FailingBackend')
+    def test_retry_and_dead_letter(self):
+        self.queue()
+
+        self.assertEqual(send_queued(), (0, 1))
+        e = Email.objects.get()
+        self.assertEqual(e.state, 'queued')
+        self.assertGreater(e.next_attempt, timezone.now())
+        self.assertEqual(send_queued(), (0, 0))
+
+        Email.objects.update(next_attempt=timezone.now())
+        self.assertEqual(send_queued(), (0, 1))
+        e = Email.objects.get()
+        self.assertEqual(e.state, 'failed')
+        self.assertIn('SMTP server is down', e.last_error)
+
+    @override_settings(EMAIL_BACKEND='mailing.tests.UnreachableBackend')
+    def test_connection_failure(self):
+        self.queue()
+
+        self.assertEqual(send_queued(), (0, 1))
+        e = Email.objects.get()
+        self.assertEqual((e.state, e.attempts), ('queued', 1))
+        self.assertIn('Connection refused', e.last_error)
+        self.assertGreater(e.next_attempt, timezone.now())
+
+    def test_concurrent_claim(self):
+        self.queue()
+        values_list = QuerySet.values_list
+
+        def claimed_meanwhile(queryset, *fields, **kwargs):
+            rows = list(values_list(queryset, *fields, **kwargs))
+            # another worker claims the same messages after they were read
+            Email.objects.update(next_attempt=timezone.now() + timedelta(minutes=5))
+            return rows
+
+        with mock.patch.object(QuerySet, 'values_list', claimed_meanwhile):
+            self.assertEqual(list(claim(10)), [])
+
+
+class Transfer:
+
+    def __init__(self, pk):
+        self.pk = pk
+        self.section = 'ultimate'
+        self.ammount = 10
+
+    def __str__(self):
+        return 'Transakcia {}'.format(self.pk)
+
+
+@override_settings(EMAIL_QUEUE=False, SAF_FM=['fm@example.com'])
+class BatchTest(TransactionTestCase):
+
+    def test_digest(self):
+        with mail_batch():
+            for i in range(3):
+                SendMail('SAF_FM', 'Žiadosť o vykonanie prevodu').send_reminder('vykonanie', Transfer(i))
+            SendMail(['a@example.com'], 'Zmena').change_state('zaplatená', Transfer(5))
+            self.assertEqual(len(mail.outbox), 0)
+
+        self.assertEqual(len(mail.outbox), 2)
+        digest, single = mail.outbox
+        self.assertEqual(digest.to, ['fm@example.com'])
+        self.assertIn('3 prevodov', digest.subject)
+        for i in range(3):
+            self.assertIn('Transakcia {}'.format(i), digest.body)
+        self.assertTrue(single.subject.endswith('Zmena'))
+
+    @override_settings(EMAIL_QUEUE=True)
+    def test_batch_is_queued(self):
+        with mail_batch():
+            for i in range(3):
+                SendMail(['a@example.com'], 'Zmena').change_state('zaplatená', Transfer(i))
+                SendMail(['b@example.com'], 'Zmena').change_state('zaplatená', Transfer(i))
+
+        self.assertEqual(Email.objects.count(), 2)
+        self.assertEqual(len(mail.outbox), 0)
+
+    @override_settings(EMAIL_QUEUE=True)
+    def test_rolled_back_with_changes(self):
+        with self.assertRaises(ValueError):
+            with mail_batch():
+                TransactionType.objects.create(section='ultimate', name='test')
+                SendMail(['a@example.com'], 'Zmena').change_state('zaplatená', Transfer(1))
+                raise ValueError
+
+        self.assertFalse(TransactionType.objects.exists())
+        self.assertFalse(Email.objects.exists())